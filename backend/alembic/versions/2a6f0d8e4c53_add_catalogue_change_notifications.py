@@ -0,0 +1,96 @@
+"""add catalogue change notifications
+
+Revision ID: 2a6f0d8e4c53
+Revises: 5b7e9c3d2f18
+Create Date: 2026-10-19 17:22:40.518207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2a6f0d8e4c53'
+down_revision: Union[str, None] = '5b7e9c3d2f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION catalogue_notify()
+RETURNS trigger AS $$
+DECLARE
+    changed integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT count(*) INTO changed FROM old_rows;
+    ELSE
+        SELECT count(*) INTO changed FROM new_rows;
+    END IF;
+    IF changed > 1000 THEN
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', 'RELOAD'
+        )::text);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'row', row_to_json(r)
+        )::text) FROM old_rows r;
+    ELSE
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'row', row_to_json(r)
+        )::text) FROM new_rows r;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+TRIGGERS = [
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_companies_insert
+AFTER INSERT ON companies
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """,
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_companies_update
+AFTER UPDATE ON companies
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """,
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_companies_delete
+AFTER DELETE ON companies
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """,
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_categories_insert
+AFTER INSERT ON categories
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """,
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_categories_update
+AFTER UPDATE ON categories
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """,
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_categories_delete
+AFTER DELETE ON categories
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(NOTIFY_FUNCTION)
+    for statement in TRIGGERS:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP FUNCTION IF EXISTS catalogue_notify() CASCADE')
@@ -0,0 +1,117 @@
+"""notify catalogue keys only
+
+Revision ID: 4d9a2f6b8e15
+Revises: e3b8c6a4d172
+Create Date: 2026-10-20 10:12:45.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d9a2f6b8e15'
+down_revision: Union[str, None] = 'e3b8c6a4d172'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION catalogue_notify()
+RETURNS trigger AS $$
+DECLARE
+    changed integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT count(*) INTO changed FROM old_rows;
+    ELSE
+        SELECT count(*) INTO changed FROM new_rows;
+    END IF;
+    IF changed > 1000 THEN
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', 'RELOAD'
+        )::text);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP,
+            'id', to_jsonb(r) -> TG_ARGV[0]
+        )::text) FROM old_rows r;
+    ELSE
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP,
+            'id', to_jsonb(r) -> TG_ARGV[0]
+        )::text) FROM new_rows r;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+PREVIOUS_NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION catalogue_notify()
+RETURNS trigger AS $$
+DECLARE
+    changed integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT count(*) INTO changed FROM old_rows;
+    ELSE
+        SELECT count(*) INTO changed FROM new_rows;
+    END IF;
+    IF changed > 1000 THEN
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', 'RELOAD'
+        )::text);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP,
+            'row', to_jsonb(r) - 'coordinates' - 'geog' - 'search_vector'
+        )::text) FROM old_rows r;
+    ELSE
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP,
+            'row', to_jsonb(r) - 'coordinates' - 'geog' - 'search_vector'
+        )::text) FROM new_rows r;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+# table -> key column published as "id"
+TABLE_KEYS = {
+    'companies': 'id',
+    'categories': 'id',
+    'buildings': 'id',
+    'company_search': 'company_id',
+}
+TRANSITION_TABLES = {
+    'INSERT': 'NEW TABLE AS new_rows',
+    'UPDATE': 'OLD TABLE AS old_rows NEW TABLE AS new_rows',
+    'DELETE': 'OLD TABLE AS old_rows',
+}
+
+
+def _triggers(with_key: bool) -> list[str]:
+    return [
+        f"""
+CREATE OR REPLACE TRIGGER catalogue_notify_{table}_{event.lower()}
+AFTER {event} ON {table}
+REFERENCING {transition}
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify({f"'{key}'" if with_key else ''})
+        """
+        for table, key in TABLE_KEYS.items()
+        for event, transition in TRANSITION_TABLES.items()
+    ]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(NOTIFY_FUNCTION)
+    for statement in _triggers(with_key=True):
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(PREVIOUS_NOTIFY_FUNCTION)
+    for statement in _triggers(with_key=False):
+        op.execute(statement)
@@ -0,0 +1,132 @@
+"""add company_search search_vector
+
+Revision ID: 5b7e9c3d2f18
+Revises: 8d2e4b7c1a90
+Create Date: 2026-10-19 16:05:11.731954
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e9c3d2f18'
+down_revision: Union[str, None] = '8d2e4b7c1a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+REFRESH = """
+CREATE OR REPLACE FUNCTION company_search_refresh(ids integer[])
+RETURNS void AS $$
+BEGIN
+    DELETE FROM company_search s
+    WHERE (ids IS NULL OR s.company_id = ANY(ids))
+      AND NOT EXISTS (SELECT 1 FROM companies c WHERE c.id = s.company_id);
+    INSERT INTO company_search (
+        company_id, name, building_id, geog, phone_numbers, phone_digits,
+        category_ids, category_names, search_vector
+    )
+    SELECT c.id, c.name, c.building_id, b.coordinates::geography,
+           coalesce(p.phone_numbers, '{}'), coalesce(p.phone_digits, ''),
+           coalesce(k.category_ids, '{}'), coalesce(k.category_names, '{}'),
+           setweight(to_tsvector('english', coalesce(c.name, '')), 'A')
+           || setweight(to_tsvector(
+               'english', coalesce(array_to_string(k.category_names, ' '), '')
+           ), 'B')
+    FROM companies c
+    LEFT JOIN buildings b ON b.id = c.building_id
+    LEFT JOIN LATERAL (
+        SELECT array_agg(pn.phone_number ORDER BY pn.id) AS phone_numbers,
+               string_agg(
+                   regexp_replace(pn.phone_number, '[^0-9]', '', 'g'), ' '
+                   ORDER BY pn.id
+               ) AS phone_digits
+        FROM phone_numbers pn
+        WHERE pn.company_id = c.id
+    ) p ON true
+    LEFT JOIN LATERAL (
+        SELECT array_agg(cat.id ORDER BY cat.id) AS category_ids,
+               array_agg(cat.name ORDER BY cat.id) AS category_names
+        FROM company_category_association a
+        JOIN categories cat ON cat.id = a.category_id
+        WHERE a.company_id = c.id
+    ) k ON true
+    WHERE ids IS NULL OR c.id = ANY(ids)
+    ON CONFLICT (company_id) DO UPDATE SET
+        name = EXCLUDED.name,
+        building_id = EXCLUDED.building_id,
+        geog = EXCLUDED.geog,
+        phone_numbers = EXCLUDED.phone_numbers,
+        phone_digits = EXCLUDED.phone_digits,
+        category_ids = EXCLUDED.category_ids,
+        category_names = EXCLUDED.category_names,
+        search_vector = EXCLUDED.search_vector;
+END
+$$ LANGUAGE plpgsql
+"""
+PREVIOUS_REFRESH = """
+CREATE OR REPLACE FUNCTION company_search_refresh(ids integer[])
+RETURNS void AS $$
+BEGIN
+    DELETE FROM company_search s
+    WHERE (ids IS NULL OR s.company_id = ANY(ids))
+      AND NOT EXISTS (SELECT 1 FROM companies c WHERE c.id = s.company_id);
+    INSERT INTO company_search (
+        company_id, name, building_id, geog, phone_numbers, phone_digits,
+        category_ids, category_names
+    )
+    SELECT c.id, c.name, c.building_id, b.coordinates::geography,
+           coalesce(p.phone_numbers, '{}'), coalesce(p.phone_digits, ''),
+           coalesce(k.category_ids, '{}'), coalesce(k.category_names, '{}')
+    FROM companies c
+    LEFT JOIN buildings b ON b.id = c.building_id
+    LEFT JOIN LATERAL (
+        SELECT array_agg(pn.phone_number ORDER BY pn.id) AS phone_numbers,
+               string_agg(
+                   regexp_replace(pn.phone_number, '[^0-9]', '', 'g'), ' '
+                   ORDER BY pn.id
+               ) AS phone_digits
+        FROM phone_numbers pn
+        WHERE pn.company_id = c.id
+    ) p ON true
+    LEFT JOIN LATERAL (
+        SELECT array_agg(cat.id ORDER BY cat.id) AS category_ids,
+               array_agg(cat.name ORDER BY cat.id) AS category_names
+        FROM company_category_association a
+        JOIN categories cat ON cat.id = a.category_id
+        WHERE a.company_id = c.id
+    ) k ON true
+    WHERE ids IS NULL OR c.id = ANY(ids)
+    ON CONFLICT (company_id) DO UPDATE SET
+        name = EXCLUDED.name,
+        building_id = EXCLUDED.building_id,
+        geog = EXCLUDED.geog,
+        phone_numbers = EXCLUDED.phone_numbers,
+        phone_digits = EXCLUDED.phone_digits,
+        category_ids = EXCLUDED.category_ids,
+        category_names = EXCLUDED.category_names;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.add_column('company_search', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.create_index('ix_company_search_search_vector', 'company_search', ['search_vector'], unique=False, postgresql_using='gin')
+    # ### end Alembic commands ###
+    op.execute(REFRESH)
+    op.execute('SELECT company_search_refresh(NULL)')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(PREVIOUS_REFRESH)
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_index('ix_company_search_search_vector', table_name='company_search', postgresql_using='gin')
+    op.drop_column('company_search', 'search_vector')
+    # ### end Alembic commands ###
@@ -0,0 +1,136 @@
+"""notify buildings and company_search changes
+
+Revision ID: 7c4a1e9f0b26
+Revises: 2a6f0d8e4c53
+Create Date: 2026-10-19 18:48:03.264519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4a1e9f0b26'
+down_revision: Union[str, None] = '2a6f0d8e4c53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION catalogue_notify()
+RETURNS trigger AS $$
+DECLARE
+    changed integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT count(*) INTO changed FROM old_rows;
+    ELSE
+        SELECT count(*) INTO changed FROM new_rows;
+    END IF;
+    IF changed > 1000 THEN
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', 'RELOAD'
+        )::text);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP,
+            'row', to_jsonb(r) - 'coordinates' - 'geog' - 'search_vector'
+        )::text) FROM old_rows r;
+    ELSE
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP,
+            'row', to_jsonb(r) - 'coordinates' - 'geog' - 'search_vector'
+        )::text) FROM new_rows r;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+PREVIOUS_NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION catalogue_notify()
+RETURNS trigger AS $$
+DECLARE
+    changed integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT count(*) INTO changed FROM old_rows;
+    ELSE
+        SELECT count(*) INTO changed FROM new_rows;
+    END IF;
+    IF changed > 1000 THEN
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', 'RELOAD'
+        )::text);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'row', row_to_json(r)
+        )::text) FROM old_rows r;
+    ELSE
+        PERFORM pg_notify('catalogue_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'row', row_to_json(r)
+        )::text) FROM new_rows r;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+TRIGGERS = [
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_buildings_insert
+AFTER INSERT ON buildings
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """,
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_buildings_update
+AFTER UPDATE ON buildings
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """,
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_buildings_delete
+AFTER DELETE ON buildings
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """,
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_company_search_insert
+AFTER INSERT ON company_search
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """,
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_company_search_update
+AFTER UPDATE ON company_search
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """,
+    """
+CREATE OR REPLACE TRIGGER catalogue_notify_company_search_delete
+AFTER DELETE ON company_search
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify()
+    """
+]
+TRIGGER_NAMES = [
+    ('catalogue_notify_buildings_insert', 'buildings'),
+    ('catalogue_notify_buildings_update', 'buildings'),
+    ('catalogue_notify_buildings_delete', 'buildings'),
+    ('catalogue_notify_company_search_insert', 'company_search'),
+    ('catalogue_notify_company_search_update', 'company_search'),
+    ('catalogue_notify_company_search_delete', 'company_search'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(NOTIFY_FUNCTION)
+    for statement in TRIGGERS:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table in TRIGGER_NAMES:
+        op.execute(f'DROP TRIGGER IF EXISTS {name} ON {table}')
+    op.execute(PREVIOUS_NOTIFY_FUNCTION)
@@ -0,0 +1,259 @@
+"""add company_search document table
+
+Revision ID: 8d2e4b7c1a90
+Revises: 3f1c2a9b7d41
+Create Date: 2026-10-19 14:37:52.406113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+import geoalchemy2
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2e4b7c1a90'
+down_revision: Union[str, None] = '3f1c2a9b7d41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FUNCTIONS = [
+    """
+CREATE OR REPLACE FUNCTION company_search_refresh(ids integer[])
+RETURNS void AS $$
+BEGIN
+    DELETE FROM company_search s
+    WHERE (ids IS NULL OR s.company_id = ANY(ids))
+      AND NOT EXISTS (SELECT 1 FROM companies c WHERE c.id = s.company_id);
+    INSERT INTO company_search (
+        company_id, name, building_id, geog, phone_numbers, phone_digits,
+        category_ids, category_names
+    )
+    SELECT c.id, c.name, c.building_id, b.coordinates::geography,
+           coalesce(p.phone_numbers, '{}'), coalesce(p.phone_digits, ''),
+           coalesce(k.category_ids, '{}'), coalesce(k.category_names, '{}')
+    FROM companies c
+    LEFT JOIN buildings b ON b.id = c.building_id
+    LEFT JOIN LATERAL (
+        SELECT array_agg(pn.phone_number ORDER BY pn.id) AS phone_numbers,
+               string_agg(
+                   regexp_replace(pn.phone_number, '[^0-9]', '', 'g'), ' '
+                   ORDER BY pn.id
+               ) AS phone_digits
+        FROM phone_numbers pn
+        WHERE pn.company_id = c.id
+    ) p ON true
+    LEFT JOIN LATERAL (
+        SELECT array_agg(cat.id ORDER BY cat.id) AS category_ids,
+               array_agg(cat.name ORDER BY cat.id) AS category_names
+        FROM company_category_association a
+        JOIN categories cat ON cat.id = a.category_id
+        WHERE a.company_id = c.id
+    ) k ON true
+    WHERE ids IS NULL OR c.id = ANY(ids)
+    ON CONFLICT (company_id) DO UPDATE SET
+        name = EXCLUDED.name,
+        building_id = EXCLUDED.building_id,
+        geog = EXCLUDED.geog,
+        phone_numbers = EXCLUDED.phone_numbers,
+        phone_digits = EXCLUDED.phone_digits,
+        category_ids = EXCLUDED.category_ids,
+        category_names = EXCLUDED.category_names;
+END
+$$ LANGUAGE plpgsql
+    """,
+    """
+CREATE OR REPLACE FUNCTION company_search_sync_companies()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM company_search_refresh(ARRAY(SELECT id FROM new_rows));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM company_search_refresh(ARRAY(SELECT id FROM old_rows UNION SELECT id FROM new_rows));
+    ELSE
+        PERFORM company_search_refresh(ARRAY(SELECT id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+    """,
+    """
+CREATE OR REPLACE FUNCTION company_search_sync_phone_numbers()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM company_search_refresh(ARRAY(SELECT company_id FROM new_rows));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM company_search_refresh(ARRAY(SELECT company_id FROM old_rows UNION SELECT company_id FROM new_rows));
+    ELSE
+        PERFORM company_search_refresh(ARRAY(SELECT company_id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+    """,
+    """
+CREATE OR REPLACE FUNCTION company_search_sync_company_category_association()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM company_search_refresh(ARRAY(SELECT company_id FROM new_rows));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM company_search_refresh(ARRAY(SELECT company_id FROM old_rows UNION SELECT company_id FROM new_rows));
+    ELSE
+        PERFORM company_search_refresh(ARRAY(SELECT company_id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+    """,
+    """
+CREATE OR REPLACE FUNCTION company_search_sync_buildings()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM company_search_refresh(ARRAY(SELECT c.id FROM companies c JOIN new_rows r ON r.id = c.building_id));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM company_search_refresh(ARRAY(SELECT c.id FROM companies c JOIN old_rows r ON r.id = c.building_id UNION SELECT c.id FROM companies c JOIN new_rows r ON r.id = c.building_id));
+    ELSE
+        PERFORM company_search_refresh(ARRAY(SELECT c.id FROM companies c JOIN old_rows r ON r.id = c.building_id));
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+    """,
+    """
+CREATE OR REPLACE FUNCTION company_search_sync_categories()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM company_search_refresh(ARRAY(SELECT a.company_id FROM company_category_association a JOIN new_rows r ON r.id = a.category_id));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM company_search_refresh(ARRAY(SELECT a.company_id FROM company_category_association a JOIN old_rows r ON r.id = a.category_id UNION SELECT a.company_id FROM company_category_association a JOIN new_rows r ON r.id = a.category_id));
+    ELSE
+        PERFORM company_search_refresh(ARRAY(SELECT a.company_id FROM company_category_association a JOIN old_rows r ON r.id = a.category_id));
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+    """
+]
+TRIGGERS = [
+    """
+CREATE OR REPLACE TRIGGER company_search_companies_insert
+AFTER INSERT ON companies
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_companies()
+    """,
+    """
+CREATE OR REPLACE TRIGGER company_search_companies_update
+AFTER UPDATE ON companies
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_companies()
+    """,
+    """
+CREATE OR REPLACE TRIGGER company_search_companies_delete
+AFTER DELETE ON companies
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_companies()
+    """,
+    """
+CREATE OR REPLACE TRIGGER company_search_phone_numbers_insert
+AFTER INSERT ON phone_numbers
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_phone_numbers()
+    """,
+    """
+CREATE OR REPLACE TRIGGER company_search_phone_numbers_update
+AFTER UPDATE ON phone_numbers
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_phone_numbers()
+    """,
+    """
+CREATE OR REPLACE TRIGGER company_search_phone_numbers_delete
+AFTER DELETE ON phone_numbers
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_phone_numbers()
+    """,
+    """
+CREATE OR REPLACE TRIGGER company_search_company_category_association_insert
+AFTER INSERT ON company_category_association
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_company_category_association()
+    """,
+    """
+CREATE OR REPLACE TRIGGER company_search_company_category_association_update
+AFTER UPDATE ON company_category_association
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_company_category_association()
+    """,
+    """
+CREATE OR REPLACE TRIGGER company_search_company_category_association_delete
+AFTER DELETE ON company_category_association
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_company_category_association()
+    """,
+    """
+CREATE OR REPLACE TRIGGER company_search_buildings_update
+AFTER UPDATE ON buildings
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_buildings()
+    """,
+    """
+CREATE OR REPLACE TRIGGER company_search_categories_update
+AFTER UPDATE ON categories
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_categories()
+    """
+]
+SOURCE_TABLES = (
+    'companies', 'phone_numbers', 'company_category_association',
+    'buildings', 'categories'
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('company_search',
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('building_id', sa.Integer(), nullable=True),
+    sa.Column('geog', geoalchemy2.types.Geography(geometry_type='POINT', srid=4326, from_text='ST_GeogFromText', name='geography'), nullable=True),
+    sa.Column('phone_numbers', postgresql.ARRAY(sqlalchemy_utils.types.phone_number.PhoneNumberType(length=20)), nullable=True),
+    sa.Column('phone_digits', sa.String(), nullable=True),
+    sa.Column('category_ids', postgresql.ARRAY(sa.Integer()), nullable=True),
+    sa.Column('category_names', postgresql.ARRAY(sa.String()), nullable=True),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('company_id')
+    )
+    op.create_index('idx_company_search_geog', 'company_search', ['geog'], unique=False, postgresql_using='gist')
+    op.create_index(op.f('ix_company_search_building_id'), 'company_search', ['building_id'], unique=False)
+    op.create_index('ix_company_search_category_ids', 'company_search', ['category_ids'], unique=False, postgresql_using='gin')
+    op.create_index('ix_company_search_category_names', 'company_search', ['category_names'], unique=False, postgresql_using='gin')
+    op.create_index('ix_company_search_name_trgm', 'company_search', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_company_search_phone_digits_trgm', 'company_search', ['phone_digits'], unique=False, postgresql_using='gin', postgresql_ops={'phone_digits': 'gin_trgm_ops'})
+    # ### end Alembic commands ###
+    for statement in FUNCTIONS + TRIGGERS:
+        op.execute(statement)
+    op.execute('SELECT company_search_refresh(NULL)')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in SOURCE_TABLES:
+        op.execute(f'DROP FUNCTION IF EXISTS company_search_sync_{table}() CASCADE')
+    op.execute('DROP FUNCTION IF EXISTS company_search_refresh(integer[])')
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_index('ix_company_search_phone_digits_trgm', table_name='company_search', postgresql_using='gin', postgresql_ops={'phone_digits': 'gin_trgm_ops'})
+    op.drop_index('ix_company_search_name_trgm', table_name='company_search', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.drop_index('ix_company_search_category_names', table_name='company_search', postgresql_using='gin')
+    op.drop_index('ix_company_search_category_ids', table_name='company_search', postgresql_using='gin')
+    op.drop_index(op.f('ix_company_search_building_id'), table_name='company_search')
+    op.drop_index('idx_company_search_geog', table_name='company_search', postgresql_using='gist')
+    op.drop_table('company_search')
+    # ### end Alembic commands ###
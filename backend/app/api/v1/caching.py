@@ -0,0 +1,68 @@
+import hashlib
+from typing import Any, Awaitable, Callable
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+
+from core.cache import response_cache
+from core.metrics import TimedJSONResponse
+
+
+def make_etag(*version) -> str:
+    digest = hashlib.blake2b(repr(version).encode(), digest_size=12)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison against If-None-Match, as RFC 9110 requires"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+async def cached_json_response(
+        key: str, build: Callable[[], Awaitable[Any]], etag: str | None = None
+) -> Response:
+    """Serve serialised response bytes from cache, build them on miss.
+
+    Entries are stored with the etag they were built for, so an entry
+    left over from an older version is rebuilt instead of served.
+    build raises HTTPException for missing entities, those are not
+    cached."""
+    tag = (etag or "").encode()
+    body = None
+    cached = await response_cache.get(key)
+    if cached is not None:
+        cached_tag, _, cached_body = cached.partition(b"\n")
+        if cached_tag == tag:
+            body = cached_body
+    if body is None:
+        body = TimedJSONResponse(jsonable_encoder(await build())).body
+        await response_cache.set(key, tag + b"\n" + body)
+    headers = {"ETag": etag} if etag else None
+    return Response(
+        content=body, media_type="application/json", headers=headers
+    )
+
+
+async def conditional_json_response(
+        request: Request,
+        key: str,
+        version: tuple | None,
+        build: Callable[[], Awaitable[Any]]
+) -> Response:
+    """Answer 304 when the client's ETag matches the entity version.
+
+    version is None for a missing entity, build then raises 404."""
+    if version is None:
+        return await cached_json_response(key, build)
+    etag = make_etag(key, *version)
+    if etag_matches(request, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    return await cached_json_response(key, build, etag)
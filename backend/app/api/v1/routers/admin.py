@@ -0,0 +1,138 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from api.v1.schemas import PoolStatus, ReplicaStatus, StatementCacheStatus, \
+    QueryPlanReport, SlowRequestTrace
+from core.explain import PLAN_CASES, explain_cases
+from core.querylog import slow_traces
+from core.statement_cache import statement_cache_stats
+from database import engine, replicas, get_session, AsyncSession
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+    responses={404: {"description": "Endpoint not found"}}
+)
+
+
+@router.get(
+    "/db-pool",
+    response_model=PoolStatus,
+    summary="Database pool status",
+    description="""## Current state of this worker's database pool:
+
+    - checked_out: connections currently in use
+    - waiters: requests currently queued for a returned connection
+    - wait_count: checkouts that had to queue
+    - wait_time_*: time those checkouts spent queued, in seconds
+    """
+)
+async def get_db_pool_status() -> PoolStatus:
+    return PoolStatus(**engine.pool.stats())
+
+
+@router.get(
+    "/replicas",
+    response_model=List[ReplicaStatus],
+    summary="Read replicas status",
+    description="""## Health and pool state of configured read replicas:
+
+    - healthy: false while a replica is skipped after a failed connect
+    """
+)
+async def get_replicas_status() -> List[ReplicaStatus]:
+    return [
+        ReplicaStatus(
+            **health, pool=PoolStatus(**replica_engine.pool.stats())
+        )
+        for health, replica_engine in zip(
+            replicas.health(), replicas.engines
+        )
+    ]
+
+
+@router.get(
+    "/statement-cache",
+    response_model=StatementCacheStatus,
+    summary="Compiled statement cache hit rate",
+    description="""## SQLAlchemy compiled cache usage since worker start:
+
+    - hits / misses: executions that reused / compiled a statement
+    - uncached: executions that bypass the cache (e.g. text queries)
+    """
+)
+async def get_statement_cache_status() -> StatementCacheStatus:
+    return StatementCacheStatus(**statement_cache_stats.snapshot())
+
+
+@router.get(
+    "/slow-requests",
+    response_model=List[SlowRequestTrace],
+    summary="Statement traces of the slowest requests",
+    description="""## Slowest requests of each recent minute on this worker:
+
+    - statements: every SQL statement of the request in order, with
+      parameter types instead of values and offset_ms from its start
+    - request_id: the X-Request-ID of the response and the slow
+      statement log
+    """
+)
+async def get_slow_requests() -> List[SlowRequestTrace]:
+    return [SlowRequestTrace(**trace) for trace in slow_traces.snapshot()]
+
+
+def _plan_cases(cases: List[str] | None):
+    if not cases:
+        return PLAN_CASES
+    selected = [case for case in PLAN_CASES if case.name in cases]
+    unknown = set(cases) - {case.name for case in selected}
+    if unknown:
+        raise HTTPException(
+            detail=f"Unknown plan cases: {', '.join(sorted(unknown))}",
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+    return selected
+
+
+@router.get(
+    "/query-plans",
+    response_model=List[QueryPlanReport],
+    summary="Repository query plans checked against the baseline",
+    description="""## EXPLAIN (ANALYZE, BUFFERS) of the repository reads:
+
+    - case: repeat to explain only some statements, e.g. company:id
+    - company_id: company the filter values are taken from,
+      the one with the median id by default
+    - problems: new sequential scans of large tables, indexes the
+      baseline used and the plan does not, row estimate blowups
+    - baseline: false when no plan is saved for the case yet
+    """
+)
+async def get_query_plans(
+        case: List[str] | None = Query(None),
+        company_id: int | None = None,
+        db: AsyncSession = Depends(get_session)
+) -> List[QueryPlanReport]:
+    reports = await explain_cases(db, _plan_cases(case), company_id=company_id)
+    return [QueryPlanReport(**report) for report in reports]
+
+
+@router.post(
+    "/query-plans/baseline",
+    response_model=List[QueryPlanReport],
+    summary="Save the current query plans as the baseline",
+    description="""## Replaces the saved plans of the selected cases:
+
+    - problems are reported against the plans being replaced
+    """
+)
+async def save_query_plans_baseline(
+        case: List[str] | None = Query(None),
+        company_id: int | None = None,
+        db: AsyncSession = Depends(get_session)
+) -> List[QueryPlanReport]:
+    reports = await explain_cases(
+        db, _plan_cases(case), company_id=company_id, save="all"
+    )
+    return [QueryPlanReport(**report) for report in reports]
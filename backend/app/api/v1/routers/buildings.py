@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, status, Response, \
+    Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from api.v1.caching import cached_json_response, conditional_json_response
 from api.v1.schemas import BuildingCreate, BuildingResponse, \
-    BuildingCompaniesResponse, Coordinates
+    BuildingCompaniesResponse, Coordinates, BuildingsByIdsResponse, \
+    IdListParams, BuildingImportResult, BuildingUpsertBatch, UpsertResult
+from core.bulk_import import BuildingImport
+from core.upsert import upsert_buildings
+from core.cache import building_key, building_companies_key
 from core.repositories.buildings import BuildingsQueries
-from database import get_session
+from database import get_session, get_read_session
 
 router = APIRouter(
     prefix="/buildings",
@@ -49,6 +57,96 @@ async def create_building(
         )
 
 
+@router.post(
+    "/bulk",
+    response_model=BuildingImportResult,
+    summary="Import many buildings",
+    response_description="Counts of imported and rejected rows and the "
+                         "ids of the new buildings",
+    description="""Import buildings from a streamed upload:
+
+    Body is CSV (text/csv) with a header row, NDJSON
+    (application/x-ndjson) or GeoJSON text sequences
+    (application/geo+json-seq) of Point Features. Fields:
+
+    - address: Full postal address
+    - longitude, latitude: Point, taken from the geometry for Features
+    - key: Optional client key, the Feature id or a "key" property
+
+    ids maps each key and lines the line number of each row without a
+    key to the new building id. Rejected rows are listed with their line and reason
+    in errors_file, see /imports/errors
+    """
+)
+async def bulk_import_buildings(
+        request: Request,
+        db: AsyncSession = Depends(get_session)
+) -> BuildingImportResult:
+    result = await BuildingImport(db).run(
+        request.stream(), request.headers.get("content-type", "")
+    )
+    return BuildingImportResult(**result)
+
+
+@router.post(
+    "/upsert",
+    response_model=List[UpsertResult],
+    summary="Create or update buildings by external ID",
+    response_description="Outcome for each external_id",
+    description="""Idempotent ingest of partner records:
+
+    - records: List of {external_id, address, coordinates}
+
+    A later record with the same external_id replaces an earlier one.
+    Records that match what is stored are left untouched (unchanged)
+    """
+)
+async def upsert_buildings_by_external_id(
+        batch: BuildingUpsertBatch,
+        db: AsyncSession = Depends(get_session)
+) -> List[UpsertResult]:
+    results = await upsert_buildings(
+        [
+            {
+                "external_id": record.external_id,
+                "address": record.address,
+                "longitude": record.coordinates.longitude,
+                "latitude": record.coordinates.latitude,
+            } for record in batch.records
+        ],
+        db
+    )
+    return [UpsertResult(**result) for result in results]
+
+
+@router.get(
+    "",
+    response_model=BuildingsByIdsResponse,
+    summary="Get buildings by ID list",
+    description="""Retrieve many buildings in one request:
+
+    - ids: Building IDs, comma separated or repeated
+
+    buildings keeps the order of ids, ids not found are listed in missing
+    """
+)
+async def get_buildings(
+        id_list: IdListParams = Depends(),
+        db: AsyncSession = Depends(get_read_session)
+) -> BuildingsByIdsResponse:
+    blds, missing = await BuildingsQueries.get_buildings(id_list.ids, db)
+    return BuildingsByIdsResponse(
+        buildings=[
+            BuildingResponse(
+                id=bld.id,
+                address=bld.address,
+                coordinates=Coordinates.from_wkb(bld.coordinates)
+            ) for bld in blds
+        ],
+        missing=missing
+    )
+
+
 @router.get(
     "/{building_id}",
     response_model=BuildingResponse,
@@ -61,19 +159,22 @@ async def create_building(
 )
 async def get_building(
         building_id: int,
-        db: AsyncSession = Depends(get_session)
-) -> BuildingResponse:
-    bld = await BuildingsQueries.get_building(building_id, db)
-    if not bld:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Building not found"
+        db: AsyncSession = Depends(get_read_session)
+) -> Response:
+    async def build() -> BuildingResponse:
+        bld = await BuildingsQueries.get_building(building_id, db)
+        if not bld:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Building not found"
+            )
+        return BuildingResponse(
+            id=bld.id,
+            address=bld.address,
+            coordinates=Coordinates.from_wkb(bld.coordinates)
         )
-    return BuildingResponse(
-        id=bld.id,
-        address=bld.address,
-        coordinates=Coordinates.from_wkb(bld.coordinates)
-    )
+
+    return await cached_json_response(building_key(building_id), build)
 
 
 @router.get(
@@ -84,35 +185,46 @@ async def get_building(
     description="""Get all companies located in the specified building:
     
     - building_id: ID of the building to query
+
+    Supports conditional requests with If-None-Match (304 Not Modified)
     """
 )
 async def get_companies_in_building(
         building_id: int,
+        request: Request,
         db: AsyncSession = Depends(get_session)
-) -> BuildingCompaniesResponse:
-    bld = await BuildingsQueries.get_building_companies(building_id, db)
+) -> Response:
+    async def build() -> BuildingCompaniesResponse:
+        bld = await BuildingsQueries.get_building_companies(building_id, db)
 
-    if bld is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Building not found"
+        if bld is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Building not found"
+            )
+
+        return BuildingCompaniesResponse(
+            id=bld.id,
+            address=bld.address,
+            coordinates=Coordinates.from_wkb(bld.coordinates),
+            companies=[
+                {
+                    "company_id": cmp.id,
+                    "company_name": cmp.name,
+                    "categories": [
+                        {"category_id": cat.id, "category_name": cat.name}
+                        for cat in cmp.categories
+                    ],
+                    "phone_numbers": [
+                        str(num.phone_number) for num in cmp.phone_numbers
+                    ]
+                } for cmp in bld.companies
+            ]
         )
 
-    return BuildingCompaniesResponse(
-        id=bld.id,
-        address=bld.address,
-        coordinates=Coordinates.from_wkb(bld.coordinates),
-        companies=[
-            {
-                "company_id": cmp.id,
-                "company_name": cmp.name,
-                "categories": [
-                    {"category_id": cat.id, "category_name": cat.name}
-                    for cat in cmp.categories
-                ],
-                "phone_numbers": [
-                    str(num.phone_number) for num in cmp.phone_numbers
-                ]
-            } for cmp in bld.companies
-        ]
+    version = await BuildingsQueries.get_building_companies_version(
+        building_id, db
+    )
+    return await conditional_json_response(
+        request, building_companies_key(building_id), version, build
     )
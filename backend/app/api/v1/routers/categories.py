@@ -1,8 +1,11 @@
-from fastapi import APIRouter, status, Depends, HTTPException
+from fastapi import APIRouter, status, Depends, HTTPException, Response, \
+    Request
 
+from api.v1.caching import cached_json_response, conditional_json_response
 from api.v1.schemas import CategoryResponse, CategoryCreate
+from core.cache import category_key, category_name_key
 from core.repositories.categories import CategoriesQueries
-from database import get_session, AsyncSession
+from database import get_session, get_read_session, AsyncSession
 
 router = APIRouter(
     prefix="/categories",
@@ -47,25 +50,35 @@ async def create_category(
     description="""## Get category details by ID with parent and children:
     
     - category_id: ID of the category to retrieve
+
+    Supports conditional requests with If-None-Match (304 Not Modified)
     """
 )
 async def get_category_by_id(
         category_id: int,
-        db: AsyncSession = Depends(get_session)
-) -> CategoryResponse:
-    cat = await CategoriesQueries.get_category(category_id, db)
-    if cat is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Category not found"
+        request: Request,
+        db: AsyncSession = Depends(get_read_session)
+) -> Response:
+    async def build() -> CategoryResponse:
+        cat = await CategoriesQueries.get_category(category_id, db)
+        if cat is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Category not found"
+            )
+        return CategoryResponse(
+            id=cat.id,
+            name=cat.name,
+            parent_id=cat.parent_id,
+            children=[
+                {"id": child.id, "name": child.name}
+                for child in cat.children
+            ]
         )
-    return CategoryResponse(
-        id=cat.id,
-        name=cat.name,
-        parent_id=cat.parent_id,
-        children=[
-            {"id": child.id, "name": child.name} for child in cat.children
-        ]
+
+    version = await CategoriesQueries.get_category_version(category_id, db)
+    return await conditional_json_response(
+        request, category_key(category_id), version, build
     )
 
 
@@ -81,19 +94,25 @@ async def get_category_by_id(
 )
 async def get_category_by_name(
         category_name: str,
-        db: AsyncSession = Depends(get_session)
-) -> CategoryResponse:
-    cat = await CategoriesQueries.get_category(category_name, db)
-    if cat is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Category not found"
+        db: AsyncSession = Depends(get_read_session)
+) -> Response:
+    async def build() -> CategoryResponse:
+        cat = await CategoriesQueries.get_category(category_name, db)
+        if cat is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Category not found"
+            )
+        return CategoryResponse(
+            id=cat.id,
+            name=cat.name,
+            parent_id=cat.parent_id,
+            children=[
+                {'id': child.id, 'name': child.name}
+                for child in cat.children
+            ]
         )
-    return CategoryResponse(
-        id=cat.id,
-        name=cat.name,
-        parent_id=cat.parent_id,
-        children=[
-            {'id': child.id, 'name': child.name} for child in cat.children
-        ]
+
+    return await cached_json_response(
+        category_name_key(category_name), build
     )
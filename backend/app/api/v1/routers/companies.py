@@ -1,12 +1,19 @@
 from typing import List
 
-from fastapi import APIRouter, status, Depends, HTTPException
+from fastapi import APIRouter, status, Depends, HTTPException, Response, \
+    Request, Query
 
+from api.v1.caching import conditional_json_response
 from api.v1.schemas import CompanyResponse, CompanyCreate, \
     CompaniesByCategoriesResponse, CompanyAdvancedSearchParams, \
-    CompanyAreaSearchParams
+    CompanyAreaSearchParams, CompanyAreaBatchSearchParams, \
+    CompanyAreaBatchResponse, CompaniesByIdsResponse, IdListParams, \
+    BulkImportResult, CompanyUpsertBatch, UpsertResult
+from core.bulk_import import CompanyImport
+from core.upsert import upsert_companies
+from core.cache import company_key
 from core.repositories.companies import CompaniesQueries
-from database import get_session, AsyncSession
+from database import get_session, get_read_session, AsyncSession
 
 router = APIRouter(
     prefix="/companies",
@@ -17,6 +24,20 @@ router = APIRouter(
 )
 
 
+def search_row_response(row) -> CompanyResponse:
+    """Response from a company_search document row"""
+    return CompanyResponse(
+        id=row.id,
+        name=row.name,
+        phone_numbers=[str(num) for num in row.phone_numbers],
+        building_id=row.building_id,
+        categories=[
+            {"category_id": cat_id, "category_name": cat_name}
+            for cat_id, cat_name in zip(row.category_ids, row.category_names)
+        ]
+    )
+
+
 @router.post(
     "/",
     response_model=CompanyResponse,
@@ -56,6 +77,101 @@ async def create_company(
         )
 
 
+@router.post(
+    "/bulk",
+    response_model=BulkImportResult,
+    summary="Import many companies",
+    response_description="Counts of imported and rejected rows",
+    description="""## Import companies from a streamed upload:
+
+    Body is NDJSON (application/x-ndjson), one object per line, or CSV
+    (text/csv) with a header row. Fields:
+
+    - name: Company name
+    - building_id: ID of the building where company is located
+    - phone_numbers: List of phone numbers, "; " separated in CSV
+    - categories: List of category IDs, "; " separated in CSV
+
+    Valid rows are imported in one transaction. Rejected rows are listed
+    with their line and reason in errors_file, see /imports/errors
+    """
+)
+async def bulk_import_companies(
+        request: Request,
+        db: AsyncSession = Depends(get_session)
+) -> BulkImportResult:
+    result = await CompanyImport(db).run(
+        request.stream(), request.headers.get("content-type", "")
+    )
+    return BulkImportResult(**result)
+
+
+@router.post(
+    "/upsert",
+    response_model=List[UpsertResult],
+    summary="Create or update companies by external ID",
+    response_description="Outcome for each external_id",
+    description="""## Idempotent ingest of partner records:
+
+    - records: List of companies, each with
+      - external_id: Partner key the company is matched on
+      - name: Company name
+      - building_id or building_external_id: Building of the company
+      - phone_numbers: Phone numbers, replace the stored ones
+      - categories: Category IDs, replace the stored ones
+
+    A later record with the same external_id replaces an earlier one.
+    Records that match what is stored are left untouched (unchanged),
+    records with unknown buildings or categories are rejected
+    """
+)
+async def upsert_companies_by_external_id(
+        batch: CompanyUpsertBatch,
+        db: AsyncSession = Depends(get_session)
+) -> List[UpsertResult]:
+    results = await upsert_companies(
+        [record.model_dump() for record in batch.records], db
+    )
+    return [UpsertResult(**result) for result in results]
+
+
+@router.get(
+    "",
+    response_model=CompaniesByIdsResponse,
+    summary="Get companies by ID list",
+    description="""## Get many companies in one request:
+
+    - ids: Company IDs, comma separated or repeated
+
+    companies keeps the order of ids, ids not found are listed in missing
+    """
+)
+async def get_companies_by_ids(
+        id_list: IdListParams = Depends(),
+        db: AsyncSession = Depends(get_read_session)
+) -> CompaniesByIdsResponse:
+    cmps, missing = await CompaniesQueries.get_companies_by_ids(
+        id_list.ids, db
+    )
+    return CompaniesByIdsResponse(
+        companies=[
+            CompanyResponse(
+                id=cmp.id,
+                name=cmp.name,
+                phone_numbers=[
+                    str(num.phone_number) for num in cmp.phone_numbers
+                ],
+                building_id=cmp.building_id,
+                categories=[
+                    {"category_id": cat.id, "category_name": cat.name}
+                    for cat in cmp.categories
+                ]
+            ) for cmp in cmps
+        ],
+        missing=missing
+    )
+
+
 @router.get(
     "/{company_id}",
     response_model=List[CompanyResponse],
@@ -63,25 +179,36 @@ async def create_company(
     description="""## Get company details by ID:
     
     - company_id: ID of the company to retrieve
+
+    Supports conditional requests with If-None-Match (304 Not Modified)
     """
 )
 async def get_companies_by_id(
         company_id: int,
+        request: Request,
         db: AsyncSession = Depends(get_session)
-) -> List[CompanyResponse]:
-    cmps = await CompaniesQueries.get_companies(company_id, db)
-    return [
+) -> Response:
+    async def build() -> List[CompanyResponse]:
+        cmps = await CompaniesQueries.get_companies(company_id, db)
+        return [
             CompanyResponse(
                 id=cmp.id,
                 name=cmp.name,
-                phone_numbers=[str(num.phone_number) for num in cmp.phone_numbers],
+                phone_numbers=[
+                    str(num.phone_number) for num in cmp.phone_numbers
+                ],
                 building_id=cmp.building_id,
                 categories=[
                     {"category_id": cat.id, "category_name": cat.name}
                     for cat in cmp.categories
                 ]
             ) for cmp in cmps
-    ]
+        ]
+
+    version = await CompaniesQueries.get_company_version(company_id, db)
+    return await conditional_json_response(
+        request, company_key(company_id), version, build
+    )
 
 
 @router.get(
@@ -95,7 +222,7 @@ async def get_companies_by_id(
 )
 async def search_companies_by_name(
         company_name: str,
-        db: AsyncSession = Depends(get_session)
+        db: AsyncSession = Depends(get_read_session)
 ) -> List[CompanyResponse]:
     cmps = await CompaniesQueries.get_companies(company_name, db)
     return [
@@ -126,7 +253,7 @@ async def search_companies_by_name(
 )
 async def search_companies_in_area(
         search_data: CompanyAreaSearchParams,
-        db: AsyncSession = Depends(get_session)
+        db: AsyncSession = Depends(get_read_session)
 ) -> List[CompanyResponse]:
     companies = await CompaniesQueries.get_companies_in_area(
         search_data.longitude, search_data.latitude, search_data.radius, db
@@ -147,6 +274,39 @@ async def search_companies_in_area(
     ]
 
 
+@router.post(
+    "/search/in-area/batch",
+    response_model=CompanyAreaBatchResponse,
+    summary="Find companies near many locations",
+    response_description="Company ids per point and the companies found",
+    description="""## Search around many points at once:
+
+    - points: List of {radius, longitude, latitude}, as for /search/in-area
+
+    results keeps the order of points and lists the ids of the companies
+    found around each, companies holds every company found exactly once
+    """
+)
+async def search_companies_in_areas(
+        search_data: CompanyAreaBatchSearchParams,
+        db: AsyncSession = Depends(get_read_session)
+) -> CompanyAreaBatchResponse:
+    points = [
+        (point.longitude, point.latitude, point.radius)
+        for point in search_data.points
+    ]
+    groups, companies = await CompaniesQueries.get_companies_in_areas(
+        points, db
+    )
+    return CompanyAreaBatchResponse(
+        results=[
+            {**point.model_dump(), "company_ids": company_ids}
+            for point, company_ids in zip(search_data.points, groups)
+        ],
+        companies=[search_row_response(row) for row in companies]
+    )
+
+
 @router.get(
     "/search/by-category-id",
     response_model=List[CompaniesByCategoriesResponse],
@@ -158,7 +318,7 @@ async def search_companies_in_area(
 )
 async def get_companies_by_category_id(
         category_id: int,
-        db: AsyncSession = Depends(get_session)
+        db: AsyncSession = Depends(get_read_session)
 ) -> List[CompaniesByCategoriesResponse]:
     result = await CompaniesQueries.get_companies_by_category(category_id, db)
     return [
@@ -185,7 +345,7 @@ async def get_companies_by_category_id(
 )
 async def get_companies_by_category_name(
         category_name: str,
-        db: AsyncSession = Depends(get_session)
+        db: AsyncSession = Depends(get_read_session)
 ) -> List[CompaniesByCategoriesResponse]:
     result = await CompaniesQueries.get_companies_by_category(
         category_name, db
@@ -219,7 +379,7 @@ async def get_companies_by_category_name(
 )
 async def advanced_search_companies(
         search_data: CompanyAdvancedSearchParams = Depends(),
-        db: AsyncSession = Depends(get_session)
+        db: AsyncSession = Depends(get_read_session)
 ) -> List[CompanyResponse]:
     companies = await CompaniesQueries.run_advanced_search(
         search_data.name,
@@ -231,17 +391,24 @@ async def advanced_search_companies(
         db
     )
 
-    return [
-        CompanyResponse(
-            id=cmp.id,
-            name=cmp.name,
-            phone_numbers=[str(num.phone_number) for num in
-                           cmp.phone_numbers],
-            building_id=cmp.building_id,
-            categories=[
-                {"category_id": cat.id, "category_name": cat.name}
-                for cat in cmp.categories
-            ]
-        )
-        for cmp in companies
-    ]
+    return [search_row_response(row) for row in companies]
+
+
+@router.get(
+    "/search/text",
+    response_model=List[CompanyResponse],
+    summary="Full-text company search",
+    description="""## Ranked search over company and category names:
+
+    - q: Search query, web search syntax ("coffee -chain", "\"sushi bar\"",
+      "cafe or bakery")
+    - limit: Maximum number of results, most relevant first
+    """,
+)
+async def text_search_companies(
+        q: str = Query(..., min_length=1),
+        limit: int = Query(20, ge=1, le=100),
+        db: AsyncSession = Depends(get_read_session)
+) -> List[CompanyResponse]:
+    companies = await CompaniesQueries.search_text(q, limit, db)
+    return [search_row_response(row) for row in companies]
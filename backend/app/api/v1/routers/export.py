@@ -1,8 +1,10 @@
 from fastapi import APIRouter, BackgroundTasks, Depends
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 
 from api.v1.schemas import ExportStatus
 from database import get_session, AsyncSession
+from rabbitmq.export_events import export_events_broker, \
+    stream_task_events, task_event, TERMINAL_STATUSES
 from rabbitmq.export_service import create_task, check_task, \
     get_export_file_content
 from rabbitmq.producer import publish_export_task
@@ -64,6 +66,39 @@ async def check_export_status(
     )
 
 
+@router.get(
+    "/events/{task_id}",
+    summary="Stream export status events",
+    response_class=StreamingResponse,
+    description="""## Subscribe to export task status changes (SSE):
+
+    - task_id: ID of the export task
+
+    Sends the current status first, then every status change
+    until the task is completed or failed
+    """
+)
+async def export_status_events(
+    task_id: int,
+    db: AsyncSession = Depends(get_session)
+) -> StreamingResponse:
+    task = await check_task(task_id, db)
+    queue = None
+    if task.status not in TERMINAL_STATUSES:
+        queue = await export_events_broker.subscribe(task_id)
+        try:
+            # re-read after subscribing so a change in between is not missed
+            await db.refresh(task)
+        except Exception:
+            export_events_broker.unsubscribe(task_id, queue)
+            raise
+    return StreamingResponse(
+        stream_task_events(task_id, task_event(task), queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get(
     "/download/{task_id}",
     summary="Download exported file",
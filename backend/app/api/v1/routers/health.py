@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from core.warmup import warm_up
+from database import get_session, AsyncSession
+
+router = APIRouter(
+    prefix="/health",
+    tags=["Health"],
+)
+
+
+@router.get(
+    "/live",
+    summary="Liveness probe",
+    description="## The process is up and answering requests"
+)
+async def get_liveness() -> dict:
+    return {"status": "ok"}
+
+
+@router.get(
+    "/ready",
+    summary="Readiness probe",
+    description="""## 200 once the worker serves at full speed, else 503:
+
+    - steps: start-up warm-up steps and the seconds they took,
+      null while one is still running
+    - ready_after: seconds from start until the worker was ready
+    - database: whether the primary answers a query
+    """
+)
+async def get_readiness(
+        db: AsyncSession = Depends(get_session)
+) -> JSONResponse:
+    report = warm_up.status()
+    try:
+        await db.execute(text("SELECT 1"))
+        report["database"] = True
+    except (OSError, DBAPIError):
+        report["database"] = False
+    ready = report["ready"] and report["database"]
+    return JSONResponse(
+        report,
+        status_code=(
+            status.HTTP_200_OK if ready
+            else status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    )
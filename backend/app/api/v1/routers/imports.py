@@ -0,0 +1,27 @@
+from fastapi import APIRouter
+from fastapi.responses import FileResponse
+
+from core.bulk_import import get_errors_file
+
+router = APIRouter(
+    prefix="/imports",
+    tags=["Imports"],
+    responses={404: {"description": "Endpoint not found"}}
+)
+
+
+@router.get(
+    "/errors/{filename}",
+    summary="Download rejected import rows",
+    description="""## Download the errors file of a bulk import:
+
+    - filename: errors_file returned by the import
+    """
+)
+async def download_import_errors(filename: str):
+    file_path = get_errors_file(filename)
+    return FileResponse(
+        path=file_path,
+        filename=file_path.name,
+        media_type="text/csv"
+    )
@@ -0,0 +1,38 @@
+from typing import List, Literal
+
+from fastapi import APIRouter, Depends, Query
+
+from api.v1.schemas import Suggestion
+from core.suggest import suggest_index
+from database import get_session, AsyncSession
+
+router = APIRouter(
+    prefix="/suggest",
+    tags=["Suggest"],
+    responses={404: {"description": "Endpoint not found"}}
+)
+
+
+@router.get(
+    "",
+    response_model=List[Suggestion],
+    summary="Autocomplete company and category names",
+    description="""## Name completions for a search box:
+
+    - q: Beginning of a name or of any word in it, case-insensitive
+    - limit: Maximum number of completions
+    - kind: Only "company" or only "category" completions
+
+    Served from an in-memory index, the database is only read to build
+    it on first use
+    """
+)
+async def suggest(
+        q: str = Query(..., min_length=1),
+        limit: int = Query(10, ge=1, le=50),
+        kind: Literal["company", "category"] | None = None,
+        db: AsyncSession = Depends(get_session)
+) -> List[Suggestion]:
+    # the session only connects if the index has to be loaded
+    await suggest_index.ensure_loaded(db)
+    return suggest_index.search(q, limit, kind)
@@ -1,10 +1,50 @@
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Literal
 
 from fastapi import HTTPException, status
 from fastapi.params import Query
 from geoalchemy2.shape import to_shape
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
+
+from config import settings
+
+
+# Common schemas
+class IdListParams:
+    """Multi-get ids as "?ids=3,1,2" or "?ids=3&ids=1", order is kept"""
+    def __init__(
+        self,
+        ids: List[str] = Query(
+            ..., description="Comma separated ids, "
+                             f"at most {settings.MULTI_GET_MAX_IDS}"
+        ),
+    ):
+        self.ids = self._validate_ids(ids)
+
+    @staticmethod
+    def _validate_ids(ids: List[str]) -> List[int]:
+        try:
+            parsed = [
+                int(part) for value in ids
+                for part in value.split(",") if part.strip()
+            ]
+        except ValueError:
+            raise HTTPException(
+                detail="ids must be integers",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        if not parsed:
+            raise HTTPException(
+                detail="At least one id is required",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        if len(parsed) > settings.MULTI_GET_MAX_IDS:
+            raise HTTPException(
+                detail=f"At most {settings.MULTI_GET_MAX_IDS} ids "
+                       "can be requested at once",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        return parsed
 
 
 # Company schemas
@@ -23,12 +63,32 @@ class CompanyResponse(BaseModel):
     categories: List
 
 
+class CompaniesByIdsResponse(BaseModel):
+    companies: List[CompanyResponse]
+    missing: List[int]
+
+
 class CompanyAreaSearchParams(BaseModel):
     radius: int
     longitude: float
     latitude: float
 
 
+class CompanyAreaBatchSearchParams(BaseModel):
+    points: List[CompanyAreaSearchParams] = Field(
+        ..., min_length=1, max_length=settings.AREA_BATCH_MAX_POINTS
+    )
+
+
+class CompanyAreaBatchResult(CompanyAreaSearchParams):
+    company_ids: List[int]
+
+
+class CompanyAreaBatchResponse(BaseModel):
+    results: List[CompanyAreaBatchResult]
+    companies: List[CompanyResponse]
+
+
 class CompanyAdvancedSearchParams:
     def __init__(
         self,
@@ -118,6 +178,11 @@ class BuildingResponse(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
 
+class BuildingsByIdsResponse(BaseModel):
+    buildings: List[BuildingResponse]
+    missing: List[int]
+
+
 class BuildingCompaniesResponse(BaseModel):
     id: int
     address: str
@@ -146,6 +211,62 @@ class CompaniesByCategoriesResponse(BaseModel):
     companies: List[Dict]
 
 
+# Upsert schemas
+class CompanyUpsert(BaseModel):
+    external_id: str = Field(..., min_length=1)
+    name: str
+    building_id: int | None = None
+    building_external_id: str | None = None
+    phone_numbers: List[str] = []
+    categories: List[int] = []
+
+
+class CompanyUpsertBatch(BaseModel):
+    records: List[CompanyUpsert] = Field(
+        ..., min_length=1, max_length=settings.UPSERT_MAX_RECORDS
+    )
+
+
+class BuildingUpsert(BaseModel):
+    external_id: str = Field(..., min_length=1)
+    address: str
+    coordinates: Coordinates
+
+
+class BuildingUpsertBatch(BaseModel):
+    records: List[BuildingUpsert] = Field(
+        ..., min_length=1, max_length=settings.UPSERT_MAX_RECORDS
+    )
+
+
+class UpsertResult(BaseModel):
+    external_id: str
+    id: int | None
+    status: Literal["created", "updated", "unchanged", "rejected"]
+    error: str | None = None
+
+
+# Import schemas
+class BulkImportResult(BaseModel):
+    imported: int
+    rejected: int
+    errors_file: str | None
+
+
+class BuildingImportResult(BulkImportResult):
+    # client key -> building id
+    ids: Dict[str, int]
+    # line number of a row without a key -> building id
+    lines: Dict[int, int]
+
+
+# Suggest schemas
+class Suggestion(BaseModel):
+    kind: Literal["company", "category"]
+    id: int
+    name: str
+
+
 # Export schemas
 class ExportStatus(BaseModel):
     task_id: int
@@ -154,3 +275,65 @@ class ExportStatus(BaseModel):
     url: str | None
     created_at: datetime | None
     updated_at: datetime | None
+
+
+# Admin schemas
+class PoolStatus(BaseModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    max_overflow: int
+    waiters: int
+    wait_count: int
+    wait_time_total: float
+    wait_time_avg: float
+    wait_time_max: float
+
+
+class ReplicaStatus(BaseModel):
+    url: str
+    healthy: bool
+    pool: PoolStatus
+
+
+class StatementCacheStatus(BaseModel):
+    hits: int
+    misses: int
+    uncached: int
+    hit_ratio: float
+    compiled_cache_size: int
+
+
+class SlowStatement(BaseModel):
+    statement: str
+    params: Dict | List
+    duration_ms: float
+    rows: int | None
+    offset_ms: float
+
+
+class SlowRequestTrace(BaseModel):
+    minute: datetime
+    request_id: str
+    method: str
+    path: str
+    route: str | None
+    status: int
+    duration_ms: float
+    statement_count: int
+    statements: List[SlowStatement]
+
+
+class QueryPlanReport(BaseModel):
+    case: str
+    execution_ms: float
+    planning_ms: float
+    seq_scans: List[str]
+    indexes: List[str]
+    misestimate: float
+    misestimated_node: str | None
+    shared_hit: int
+    shared_read: int
+    baseline: bool
+    problems: List[str]
@@ -0,0 +1,485 @@
+"""Bulk imports streamed from NDJSON or CSV uploads.
+
+Rows are parsed while the upload streams in and COPYed into a
+temporary staging table. Invalid rows are rejected there with
+set-based checks, the rest is moved into the catalogue tables with
+INSERT ... SELECT, all in one transaction. Rejected rows are written
+with their line number and reason to an errors CSV in IMPORT_DIR."""
+import csv
+import json
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy_utils.types.phone_number import PhoneNumberParseException
+
+from config import settings
+from core.cache import response_cache, building_companies_key
+from core.geocache import geo_cell_cache
+from core.suggest import suggest_index
+from database import AsyncSession
+from models import PhoneNumber
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl")
+# GeoJSON text sequences, one Feature per line
+GEOJSON_SEQ_TYPES = ("application/geo+json-seq",)
+CSV_TYPES = ("text/csv",)
+# separates list values in CSV cells, as in exports
+LIST_SEPARATOR = ";"
+
+
+class RowError(ValueError):
+    """Row that cannot be imported, the message is reported for it"""
+
+
+async def read_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Lines of a UTF-8 byte stream, chunks may split lines anywhere"""
+    tail = b""
+    async for chunk in stream:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield _decode(line)
+    if tail:
+        yield _decode(tail)
+
+
+def _decode(line: bytes) -> str:
+    try:
+        return line.decode("utf-8-sig").rstrip("\r")
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Upload must be UTF-8 encoded"
+        )
+
+
+async def csv_rows(lines: AsyncIterator[str]):
+    """(line number, fields or RowError) of a CSV with a header row.
+
+    Quoted values may span lines, a row is numbered by its first line"""
+    header = None
+    pending: list[str] = []
+    start = number = 0
+    async for line in lines:
+        number += 1
+        if not pending:
+            start = number
+        pending.append(line)
+        record = "\n".join(pending)
+        if record.count('"') % 2:
+            continue
+        pending = []
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip() for name in values]
+        elif len(values) != len(header):
+            yield start, RowError(
+                f"expected {len(header)} values, got {len(values)}"
+            )
+        else:
+            yield start, dict(zip(header, values))
+    if pending:
+        yield start, RowError("unterminated quoted value")
+
+
+async def ndjson_rows(lines: AsyncIterator[str]):
+    """(line number, fields or RowError) of newline delimited JSON.
+
+    Record separators starting GeoJSON text sequence lines are skipped"""
+    number = 0
+    async for line in lines:
+        number += 1
+        line = line.lstrip("\x1e")
+        if not line.strip():
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            yield number, RowError("invalid JSON")
+            continue
+        if isinstance(fields, dict):
+            yield number, fields
+        else:
+            yield number, RowError("row must be a JSON object")
+
+
+def as_list(value, field: str) -> list:
+    """JSON list, or LIST_SEPARATOR separated CSV cell"""
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        return [
+            part.strip() for part in value.split(LIST_SEPARATOR)
+            if part.strip()
+        ]
+    if isinstance(value, list):
+        return value
+    raise RowError(f"{field} must be a list")
+
+
+def as_int(value, field: str) -> int | None:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (bool, float)):
+        raise RowError(f"{field} must be an integer")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{field} must be an integer")
+
+
+def as_float(value, field: str) -> float | None:
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise RowError(f"{field} must be a number")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{field} must be a number")
+
+
+def as_text(value, field: str) -> str:
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise RowError(f"{field} must be a string")
+    return value.strip()
+
+
+class BulkImport:
+    """Import of one upload into the catalogue.
+
+    Subclasses define the staging table, parse() for one row of fields,
+    the checks that set the error column of invalid staged rows and the
+    statements that insert the remaining ones."""
+    name: str
+    staging_table: str
+    # staging columns filled by COPY, besides line
+    columns: tuple[str, ...]
+    staging_ddl: str
+    checks: tuple[str, ...] = ()
+    inserts: tuple[str, ...] = ()
+    json_types = NDJSON_TYPES
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.errors: list[tuple[int, str]] = []
+        self.imported = 0
+
+    def parse(self, fields: dict) -> tuple:
+        raise NotImplementedError
+
+    async def before_commit(self):
+        """Last reads from the staging table, it is dropped on commit"""
+
+    async def after_commit(self):
+        """Invalidate what ORM write events would have"""
+
+    def rows(self, stream: AsyncIterator[bytes], content_type: str):
+        media_type = content_type.split(";")[0].strip().lower()
+        if media_type in self.json_types:
+            return ndjson_rows(read_lines(stream))
+        if media_type in CSV_TYPES:
+            return csv_rows(read_lines(stream))
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Upload {' or '.join(self.json_types + CSV_TYPES)}"
+        )
+
+    async def _records(self, rows) -> AsyncIterator[tuple]:
+        async for line, fields in rows:
+            try:
+                if isinstance(fields, RowError):
+                    raise fields
+                record = self.parse(fields)
+            except RowError as e:
+                self.errors.append((line, str(e)))
+                continue
+            yield line, *record
+
+    async def run(
+            self, stream: AsyncIterator[bytes], content_type: str
+    ) -> dict:
+        rows = self.rows(stream, content_type)
+        try:
+            await self.db.execute(text(
+                f"CREATE TEMP TABLE {self.staging_table} "
+                f"(line integer PRIMARY KEY, {self.staging_ddl}, "
+                f"error text) ON COMMIT DROP"
+            ))
+            # COPY runs on the session's connection and transaction
+            connection = await self.db.connection()
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                self.staging_table,
+                records=self._records(rows),
+                columns=("line", *self.columns)
+            )
+            # temporary tables are never analyzed automatically
+            await self.db.execute(text(f"ANALYZE {self.staging_table}"))
+            for statement in self.checks:
+                await self.db.execute(text(statement))
+            rejected = await self.db.execute(text(
+                f"DELETE FROM {self.staging_table} "
+                f"WHERE error IS NOT NULL RETURNING line, error"
+            ))
+            self.errors.extend(rejected.tuples())
+            self.imported = (await self.db.execute(text(
+                f"SELECT count(*) FROM {self.staging_table}"
+            ))).scalar_one()
+            for statement in self.inserts:
+                await self.db.execute(text(statement))
+            await self.before_commit()
+            await self.db.commit()
+        except HTTPException:
+            await self.db.rollback()
+            raise
+        except Exception as e:
+            await self.db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Import failed: {e}"
+            )
+        await self.after_commit()
+        return self.result()
+
+    def result(self) -> dict:
+        return {
+            "imported": self.imported,
+            "rejected": len(self.errors),
+            "errors_file": self._write_errors(),
+        }
+
+    def _write_errors(self) -> str | None:
+        if not self.errors:
+            return None
+        directory = Path(settings.IMPORT_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        date_now = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = (
+            f"import_{self.name}_{date_now}_{uuid.uuid4().hex[:8]}"
+            f"_errors.csv"
+        )
+        with open(directory / filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["line", "error"])
+            writer.writerows(sorted(self.errors))
+        return filename
+
+
+def get_errors_file(filename: str) -> Path:
+    file_path = Path(settings.IMPORT_DIR) / filename
+    if Path(filename).name != filename or not file_path.is_file():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    return file_path
+
+
+class CompanyImport(BulkImport):
+    """Fields: name, building_id, phone_numbers and categories (ids).
+    Phone numbers are stored as the model stores them, in E.164"""
+    name = "companies"
+    staging_table = "company_import"
+    columns = ("name", "building_id", "phone_numbers", "category_ids")
+    staging_ddl = (
+        "name text, building_id integer, phone_numbers text[], "
+        "category_ids integer[], company_id integer"
+    )
+    checks = (
+        """
+        UPDATE company_import s
+        SET error = 'building not found: ' || s.building_id
+        WHERE NOT EXISTS (SELECT FROM buildings b WHERE b.id = s.building_id)
+        """,
+        """
+        UPDATE company_import s
+        SET error = 'categories not found: ' || m.missing
+        FROM (
+            SELECT t.line, string_agg(DISTINCT c.id::text, ', ') AS missing
+            FROM company_import t
+            CROSS JOIN unnest(t.category_ids) AS c(id)
+            LEFT JOIN categories k ON k.id = c.id
+            WHERE k.id IS NULL AND t.error IS NULL
+            GROUP BY t.line
+        ) m
+        WHERE s.line = m.line
+        """,
+    )
+    inserts = (
+        # ids are drawn inside the INSERT, which holds its table lock
+        # from the start, see datagen._reserve_ids
+        """
+        WITH new AS (
+            UPDATE company_import
+            SET company_id = nextval(
+                pg_get_serial_sequence('companies', 'id')
+            )
+            RETURNING line, company_id, name, building_id
+        )
+        INSERT INTO companies (id, name, building_id)
+        SELECT company_id, name, building_id
+        FROM new
+        ORDER BY line
+        """,
+        """
+        INSERT INTO phone_numbers (phone_number, company_id)
+        SELECT p.phone_number, s.company_id
+        FROM company_import s
+        CROSS JOIN unnest(s.phone_numbers) AS p(phone_number)
+        """,
+        """
+        INSERT INTO company_category_association (company_id, category_id)
+        SELECT DISTINCT s.company_id, c.category_id
+        FROM company_import s
+        CROSS JOIN unnest(s.category_ids) AS c(category_id)
+        """,
+    )
+    _phone_type = PhoneNumber.__table__.c.phone_number.type
+
+    def __init__(self, db: AsyncSession):
+        super().__init__(db)
+        self.building_ids: list[int] = []
+
+    def parse(self, fields: dict) -> tuple:
+        name = as_text(fields.get("name"), "name")
+        if not name:
+            raise RowError("name is required")
+        building_id = as_int(fields.get("building_id"), "building_id")
+        if building_id is None:
+            raise RowError("building_id is required")
+        phone_numbers = [
+            self._phone_number(value)
+            for value in as_list(fields.get("phone_numbers"), "phone_numbers")
+        ]
+        category_ids = [
+            as_int(value, "categories")
+            for value in as_list(fields.get("categories"), "categories")
+        ]
+        return name, building_id, phone_numbers, category_ids
+
+    def _phone_number(self, value) -> str:
+        try:
+            return self._phone_type.process_bind_param(str(value), None)
+        except PhoneNumberParseException:
+            raise RowError(f"invalid phone number: {value}")
+
+    async def before_commit(self):
+        result = await self.db.execute(
+            text("SELECT DISTINCT building_id FROM company_import")
+        )
+        self.building_ids = list(result.scalars())
+
+    async def after_commit(self):
+        if self.building_ids:
+            await response_cache.delete(
+                *(building_companies_key(bid) for bid in self.building_ids)
+            )
+        for building_id in self.building_ids:
+            geo_cell_cache.invalidate_building(building_id)
+        if self.imported:
+            suggest_index.invalidate()
+
+
+class BuildingImport(BulkImport):
+    """Fields: address, longitude, latitude and an optional client key,
+    or GeoJSON Point Features with address and key properties (the
+    Feature id is used as key too).
+
+    Points are built in SQL, the result maps each key, and the line
+    number of each row without one, to the id of the new building"""
+    name = "buildings"
+    staging_table = "building_import"
+    columns = ("address", "lon", "lat", "key")
+    staging_ddl = (
+        "address text, lon double precision, lat double precision, "
+        "key text, building_id integer"
+    )
+    json_types = NDJSON_TYPES + GEOJSON_SEQ_TYPES
+    checks = (
+        """
+        UPDATE building_import s
+        SET error = 'duplicate key: ' || s.key
+        FROM (
+            SELECT key, min(line) AS first_line
+            FROM building_import
+            WHERE key IS NOT NULL
+            GROUP BY key
+            HAVING count(*) > 1
+        ) d
+        WHERE s.key = d.key AND s.line > d.first_line
+        """,
+    )
+    inserts = (
+        """
+        WITH new AS (
+            UPDATE building_import
+            SET building_id = nextval(
+                pg_get_serial_sequence('buildings', 'id')
+            )
+            RETURNING line, building_id, address, lon, lat
+        )
+        INSERT INTO buildings (id, address, coordinates)
+        SELECT building_id, address, ST_SetSRID(ST_MakePoint(lon, lat), 4326)
+        FROM new
+        ORDER BY line
+        """,
+    )
+
+    def __init__(self, db: AsyncSession):
+        super().__init__(db)
+        self.ids: dict[str, int] = {}
+        self.lines: dict[int, int] = {}
+
+    def parse(self, fields: dict) -> tuple:
+        if fields.get("type") == "Feature":
+            geometry = fields.get("geometry") or {}
+            coordinates = geometry.get("coordinates")
+            if (geometry.get("type") != "Point"
+                    or not isinstance(coordinates, list)
+                    or len(coordinates) < 2):
+                raise RowError("geometry must be a Point")
+            lon, lat = coordinates[:2]
+            properties = fields.get("properties") or {}
+            key = fields.get("id", properties.get("key"))
+        else:
+            properties = fields
+            lon, lat = fields.get("longitude"), fields.get("latitude")
+            key = fields.get("key")
+
+        address = as_text(properties.get("address"), "address")
+        if not address:
+            raise RowError("address is required")
+        lon, lat = as_float(lon, "longitude"), as_float(lat, "latitude")
+        if lon is None or lat is None:
+            raise RowError("longitude and latitude are required")
+        if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+            raise RowError("coordinates out of range")
+        key = None if key is None or key == "" else str(key)
+        return address, lon, lat, key
+
+    async def before_commit(self):
+        result = await self.db.execute(text(
+            "SELECT key, line, building_id FROM building_import ORDER BY line"
+        ))
+        for key, line, building_id in result:
+            if key is None:
+                self.lines[line] = building_id
+            else:
+                self.ids[key] = building_id
+
+    async def after_commit(self):
+        # new buildings can land in any cached cell
+        if self.imported:
+            await geo_cell_cache.clear()
+
+    def result(self) -> dict:
+        return {**super().result(), "ids": self.ids, "lines": self.lines}
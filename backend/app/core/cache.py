@@ -0,0 +1,183 @@
+"""Pluggable cache for serialised read responses"""
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from config import settings
+
+
+class LRUCache:
+    """In-process cache bounded by entry count, entries expire after ttl.
+
+    on_evict is called with the key and value of every entry dropped
+    other than by replacing it"""
+
+    def __init__(
+            self, max_entries: int, ttl: float,
+            on_evict: Callable[[str, Any], None] | None = None
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def _evicted(self, key: str, value: Any):
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    async def get(self, key: str) -> Any | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self._evicted(key, value)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        expires_at = time.monotonic() + (ttl or self.ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            evicted_key, (_, evicted) = self._data.popitem(last=False)
+            self._evicted(evicted_key, evicted)
+
+    async def delete(self, *keys: str):
+        self.discard(*keys)
+
+    def discard(self, *keys: str):
+        """Synchronous delete, usable from ORM event hooks"""
+        for key in keys:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._evicted(key, entry[1])
+
+    def discard_prefix(self, prefix: str):
+        self.discard(*[key for key in self._data if key.startswith(prefix)])
+
+    async def clear(self):
+        data, self._data = self._data, OrderedDict()
+        for key, (_, value) in data.items():
+            self._evicted(key, value)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache:
+    """Cache on a Redis-protocol server.
+
+    client is any object with redis.asyncio.Redis get/set/delete
+    semantics, so tests can pass a local stand-in."""
+
+    def __init__(self, client, ttl: float, prefix: str = "cache:"):
+        self._client = client
+        self.ttl = ttl
+        self._prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl: float) -> "RedisCache":
+        import redis.asyncio
+
+        return cls(redis.asyncio.from_url(url), ttl)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._client.get(self._prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None):
+        await self._client.set(
+            self._prefix + key, value, px=int((ttl or self.ttl) * 1000)
+        )
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._client.delete(*(self._prefix + key for key in keys))
+
+    async def clear(self):
+        keys = [key async for key in self._client.scan_iter(
+            match=self._prefix + "*"
+        )]
+        if keys:
+            await self._client.delete(*keys)
+
+
+class NullCache:
+    async def get(self, key: str) -> None:
+        return None
+
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        pass
+
+    async def delete(self, *keys: str):
+        pass
+
+    async def clear(self):
+        pass
+
+
+def build_cache(backend: str):
+    match backend:
+        case "memory":
+            return LRUCache(
+                settings.RESPONSE_CACHE_MAX_ENTRIES,
+                settings.RESPONSE_CACHE_TTL
+            )
+        case "redis":
+            return RedisCache.from_url(
+                settings.REDIS_URL, settings.RESPONSE_CACHE_TTL
+            )
+        case "none":
+            return NullCache()
+        case _:
+            raise ValueError(f"Unknown cache backend: {backend}")
+
+
+response_cache = build_cache(settings.RESPONSE_CACHE_BACKEND)
+
+
+# response cache keys
+def company_key(company_id: int) -> str:
+    return f"company:{company_id}"
+
+
+def building_key(building_id: int) -> str:
+    return f"building:{building_id}"
+
+
+def building_companies_key(building_id: int) -> str:
+    return f"building:{building_id}:companies"
+
+
+def category_key(category_id: int) -> str:
+    return f"category:{category_id}"
+
+
+def category_name_key(category_name: str) -> str:
+    return f"category-name:{category_name}"
+
+
+def on_catalogue_change(payload: str | None):
+    """catalogue_changes callback for the in-process backend, drops the
+    entries writes of other processes made stale. Shared backends are
+    invalidated by the writer."""
+    if not isinstance(response_cache, LRUCache):
+        return
+    change = json.loads(payload) if payload is not None else None
+    if change is None or change["op"] == "RELOAD":
+        return response_cache.discard_prefix("")
+    match change["table"]:
+        case "buildings":
+            response_cache.discard(
+                building_key(change["id"]),
+                building_companies_key(change["id"])
+            )
+        case "companies":
+            response_cache.discard(company_key(change["id"]))
+        case "categories":
+            # the old name is not known, and parents list their children
+            response_cache.discard(category_key(change["id"]))
+            response_cache.discard_prefix(category_name_key(""))
@@ -0,0 +1,343 @@
+"""Deterministic synthetic catalogue for benchmarks and scale tests.
+
+Each batch is generated from its own seed (spec seed, table, batch
+number), so the data does not depend on the number of workers or on the
+order batches finish in. Batches are rendered to CSV in worker processes
+and loaded with COPY over a pool of connections, one transaction per
+batch. Ids are reserved from the sequences up front, so a run can be
+added to a catalogue that is already in use."""
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+import asyncpg
+import numpy as np
+
+from models import CATALOGUE_CHANNEL, CATALOGUE_TABLES
+
+KM_PER_DEGREE = 111.32
+TABLE_SEEDS = {"buildings": 1, "companies": 2}
+GENERATED_TABLES = (
+    "categories", "buildings", "companies", "phone_numbers",
+    "company_category_association", "company_search"
+)
+
+ADJECTIVES = (
+    "Golden", "Northern", "Green", "Red", "Silver", "Urban", "Royal",
+    "Bright", "Old", "New", "Blue", "Happy", "Grand", "Little", "Swift",
+    "Central",
+)
+NOUNS = (
+    "Bear", "River", "Garden", "Star", "Bridge", "Harbor", "Maple",
+    "Falcon", "Square", "Lantern", "Anchor", "Orchard", "Tower", "Fox",
+    "Meadow", "Crown",
+)
+KINDS = (
+    "Cafe", "Bakery", "Market", "Studio", "Clinic", "Bistro", "Salon",
+    "Pharmacy", "Books", "Fitness", "Tailor", "Sushi Bar", "Pizzeria",
+    "Hardware", "Florist", "Bank",
+)
+STREETS = (
+    "Tverskaya", "Arbat", "Pokrovka", "Sretenka", "Myasnitskaya",
+    "Lesnaya", "Sadovaya", "Ostozhenka", "Prechistenka", "Petrovka",
+    "Nikolskaya", "Varvarka", "Taganskaya", "Bolshaya Ordynka",
+    "Pyatnitskaya", "Kuznetsky Most", "Maroseyka", "Solyanka",
+    "Neglinnaya", "Volkhonka",
+)
+
+
+@dataclass(frozen=True)
+class DataSpec:
+    companies: int = 100_000
+    buildings: int = 10_000
+    # categories per level: roots, then children of every category above
+    category_levels: tuple[int, ...] = (8, 4, 3)
+    phones_per_company: tuple[int, int] = (0, 3)
+    categories_per_company: tuple[int, int] = (1, 3)
+    # buildings gather around clusters scattered over the city, cluster
+    # sizes follow a Zipf law so there is a dense centre and a long tail
+    clusters: int = 12
+    city_center: tuple[float, float] = (37.6173, 55.7558)
+    city_radius_km: float = 20.0
+    cluster_radius_km: float = 1.5
+    seed: int = 42
+    batch_size: int = 50_000
+
+
+@dataclass
+class GeneratedData:
+    spec: DataSpec
+    # table -> ids given to the generated rows
+    ids: dict[str, range] = field(default_factory=dict)
+    # table -> rows loaded
+    rows: dict[str, int] = field(default_factory=dict)
+
+
+def _rng(spec: DataSpec, table: str, batch: int) -> np.random.Generator:
+    return np.random.default_rng([spec.seed, TABLE_SEEDS[table], batch])
+
+
+def category_tree(spec: DataSpec) -> list[tuple[int | None, str]]:
+    """(parent index, name) of each category, parents come first"""
+    tree, level = [], [(None, "")]
+    for width in spec.category_levels:
+        next_level = []
+        for parent, prefix in level:
+            for n in range(1, width + 1):
+                path = f"{prefix}{n}"
+                next_level.append((len(tree), path + "."))
+                tree.append((parent, f"Category {path}"))
+        level = next_level
+    return tree
+
+
+def category_leaves(spec: DataSpec) -> np.ndarray:
+    """Indexes of the categories without children"""
+    tree = category_tree(spec)
+    parents = {parent for parent, _ in tree}
+    return np.array(
+        [n for n in range(len(tree)) if n not in parents], dtype=np.int64
+    )
+
+
+def cluster_layout(spec: DataSpec) -> tuple[np.ndarray, np.ndarray]:
+    """(lon, lat) centres of the clusters and their share of buildings"""
+    rng = np.random.default_rng([spec.seed, 0])
+    lon, lat = spec.city_center
+    offset = rng.normal(0, spec.city_radius_km / 2, (spec.clusters, 2))
+    offset[0] = 0
+    centers = np.column_stack((
+        lon + offset[:, 0] / (KM_PER_DEGREE * np.cos(np.radians(lat))),
+        lat + offset[:, 1] / KM_PER_DEGREE,
+    ))
+    weights = 1 / np.arange(1, spec.clusters + 1) ** 1.1
+    return centers, weights / weights.sum()
+
+
+def batches(total: int, size: int) -> list[tuple[int, int, int]]:
+    """(batch number, first row, rows) covering total rows"""
+    return [
+        (n, start, min(size, total - start))
+        for n, start in enumerate(range(0, total, size))
+    ]
+
+
+def _csv(lines: list[str]) -> bytes:
+    return "".join(lines).encode()
+
+
+def category_batch(
+        spec: DataSpec, first_id: int
+) -> list[tuple[str, list[str], bytes]]:
+    """The whole category tree as (table, columns, CSV)"""
+    return [("categories", ["id", "parent_id", "name"], _csv([
+        f"{first_id + n},"
+        f"{'' if parent is None else first_id + parent},{name}\n"
+        for n, (parent, name) in enumerate(category_tree(spec))
+    ]))]
+
+
+def building_batch(
+        spec: DataSpec, batch: int, start: int, count: int, first_id: int
+) -> list[tuple[str, list[str], bytes]]:
+    """Buildings start .. start + count as (table, columns, CSV)"""
+    rng = _rng(spec, "buildings", batch)
+    centers, weights = cluster_layout(spec)
+    cluster = rng.choice(len(weights), size=count, p=weights)
+    # bigger clusters spread wider
+    spread = spec.cluster_radius_km * np.sqrt(weights * spec.clusters)
+    offset = rng.normal(0, 1, (count, 2)) * spread[cluster, None]
+    lat = centers[cluster, 1] + offset[:, 1] / KM_PER_DEGREE
+    lon = centers[cluster, 0] + offset[:, 0] / (
+        KM_PER_DEGREE * np.cos(np.radians(lat))
+    )
+    street = rng.integers(0, len(STREETS), count)
+    house = rng.integers(1, 300, count)
+    first = first_id + start
+    return [("buildings", ["id", "address", "coordinates"], _csv([
+        f'{first + n},"{STREETS[s]} St, {h}",'
+        f"SRID=4326;POINT({x:.6f} {y:.6f})\n"
+        for n, (s, h, x, y) in enumerate(zip(
+            street.tolist(), house.tolist(), lon.tolist(), lat.tolist()
+        ))
+    ]))]
+
+
+def company_batch(
+        spec: DataSpec, batch: int, start: int, count: int, first_id: int,
+        first_building_id: int, first_category_id: int
+) -> list[tuple[str, list[str], bytes]]:
+    """Companies start .. start + count with their phones and category
+    links as (table, columns, CSV)"""
+    rng = _rng(spec, "companies", batch)
+    ids = np.arange(first_id + start, first_id + start + count)
+    words = rng.integers(
+        0, [len(ADJECTIVES), len(NOUNS), len(KINDS)], (count, 3)
+    )
+    building = first_building_id + rng.integers(0, spec.buildings, count)
+
+    phones = rng.integers(
+        spec.phones_per_company[0], spec.phones_per_company[1] + 1, count
+    )
+    phone_owner = np.repeat(ids, phones)
+    numbers = rng.integers(0, 10 ** 9, len(phone_owner))
+
+    leaves = category_leaves(spec)
+    links = rng.integers(
+        spec.categories_per_company[0],
+        spec.categories_per_company[1] + 1, count
+    )
+    link_owner = np.repeat(ids, links)
+    category = first_category_id + leaves[
+        rng.integers(0, len(leaves), len(link_owner))
+    ]
+    pairs = np.unique(np.column_stack((link_owner, category)), axis=0)
+
+    return [
+        ("companies", ["id", "name", "building_id"], _csv([
+            f"{cid},{ADJECTIVES[a]} {NOUNS[b]} {KINDS[c]},{bid}\n"
+            for cid, (a, b, c), bid in zip(
+                ids.tolist(), words.tolist(), building.tolist()
+            )
+        ])),
+        ("phone_numbers", ["phone_number", "company_id"], _csv([
+            f"+79{number:09d},{cid}\n"
+            for number, cid in zip(numbers.tolist(), phone_owner.tolist())
+        ])),
+        ("company_category_association", ["company_id", "category_id"],
+         _csv([f"{cid},{kid}\n" for cid, kid in pairs.tolist()])),
+    ]
+
+
+async def _reserve_ids(conn: asyncpg.Connection, table: str, count: int):
+    """Moves the id sequence of table past count ids and returns them.
+
+    nextval and setval are two steps, the lock makes writers of the
+    table wait until the range is reserved instead of drawing an id in
+    between. The application draws ids in INSERT statements only, which
+    take their table lock first."""
+    if not count:
+        return range(0)
+    async with conn.transaction():
+        await conn.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+        last = await conn.fetchval(
+            "SELECT setval(pg_get_serial_sequence($1, 'id'), "
+            "nextval(pg_get_serial_sequence($1, 'id')) + $2 - 1)",
+            table, count
+        )
+    return range(last - count + 1, last + 1)
+
+
+async def _copy(
+        pool: asyncpg.Pool, parts: list[tuple[str, list[str], bytes]],
+        refresh: range | None
+) -> dict[str, int]:
+    rows = {}
+    async with pool.acquire() as conn, conn.transaction():
+        for table, columns, data in parts:
+            status = await conn.copy_to_table(
+                table, source=io.BytesIO(data), columns=columns,
+                format="csv"
+            )
+            rows[table] = int(status.split()[-1])
+        if refresh:
+            # what the company_search triggers would do, once per batch
+            await conn.execute(
+                "SELECT company_search_refresh(ARRAY("
+                "SELECT generate_series($1::integer, $2::integer)))",
+                refresh.start, refresh.stop - 1
+            )
+    return rows
+
+
+async def generate(
+        dsn: str, spec: DataSpec, workers: int = 4, truncate: bool = False,
+        disable_triggers: bool = True,
+        progress: Callable[[str, int], None] | None = None
+) -> GeneratedData:
+    """Generates spec into the database at dsn.
+
+    truncate empties the catalogue first. disable_triggers skips the
+    per-row catalogue triggers while loading, company_search is filled
+    once per batch and listeners get a RELOAD at the end; it needs an
+    exclusive lock on the tables, so leave it off while other sessions
+    hold them."""
+    data = GeneratedData(spec)
+    loop = asyncio.get_running_loop()
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    pool = await asyncpg.create_pool(dsn, min_size=1, max_size=workers)
+    semaphore = asyncio.Semaphore(workers)
+
+    async def load(name: str, job, *args, refresh: range | None = None):
+        async with semaphore:
+            parts = await loop.run_in_executor(executor, job, *args)
+            rows = await _copy(pool, parts, refresh)
+        for table, count in rows.items():
+            data.rows[table] = data.rows.get(table, 0) + count
+        if progress:
+            progress(name, data.rows[name])
+
+    try:
+        async with pool.acquire() as conn:
+            if truncate:
+                await conn.execute(
+                    f"TRUNCATE TABLE {', '.join(GENERATED_TABLES)} "
+                    "RESTART IDENTITY CASCADE"
+                )
+            for table, count in (
+                ("categories", len(category_tree(spec))),
+                ("buildings", spec.buildings),
+                ("companies", spec.companies),
+            ):
+                data.ids[table] = await _reserve_ids(conn, table, count)
+            if disable_triggers:
+                for table in GENERATED_TABLES:
+                    await conn.execute(
+                        f"ALTER TABLE {table} DISABLE TRIGGER USER"
+                    )
+        try:
+            categories = data.ids["categories"].start
+            buildings = data.ids["buildings"].start
+            companies = data.ids["companies"].start
+            await load("categories", category_batch, spec, categories)
+            await asyncio.gather(*(
+                load("buildings", building_batch, spec, n, start, count,
+                     buildings)
+                for n, start, count in batches(
+                    spec.buildings, spec.batch_size
+                )
+            ))
+            await asyncio.gather(*(
+                load(
+                    "companies", company_batch, spec, n, start, count,
+                    companies, buildings, categories,
+                    refresh=range(
+                        companies + start, companies + start + count
+                    ) if disable_triggers else None
+                )
+                for n, start, count in batches(
+                    spec.companies, spec.batch_size
+                )
+            ))
+        finally:
+            if disable_triggers:
+                async with pool.acquire() as conn:
+                    for table in GENERATED_TABLES:
+                        await conn.execute(
+                            f"ALTER TABLE {table} ENABLE TRIGGER USER"
+                        )
+                    for table in CATALOGUE_TABLES:
+                        await conn.execute(
+                            "SELECT pg_notify($1, json_build_object("
+                            "'table', $2::text, 'op', 'RELOAD')::text)",
+                            CATALOGUE_CHANNEL, table
+                        )
+        async with pool.acquire() as conn:
+            await conn.execute(f"ANALYZE {', '.join(GENERATED_TABLES)}")
+    finally:
+        await pool.close()
+        if executor:
+            executor.shutdown()
+    return data
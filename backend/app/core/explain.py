@@ -0,0 +1,347 @@
+"""EXPLAIN plans of the repository read statements.
+
+Every PlanCase builds one statement exactly as a repository builds it,
+with values taken from a sample company so each filter matches real
+rows. explain_cases runs them under EXPLAIN (ANALYZE, BUFFERS, FORMAT
+JSON), summarises the plans and checks them against the plans saved in
+settings.PLAN_BASELINE_DIR. Flagged as regressions:
+
+- a sequential scan of a large table the case does not expect (without
+  a baseline any such scan is flagged)
+- an index the baseline plan used and the current one does not
+- a row estimate settings.PLAN_MISESTIMATE_GROWTH times further off
+  than in the baseline and over settings.PLAN_MISESTIMATE_LIMIT
+
+Only the main statement of a case is explained, relationships loaded
+with selectinload run as separate lookups by primary key.
+"""
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Literal
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, func, cast, String, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from config import settings
+from core.repositories.buildings import BuildingsQueries
+from core.repositories.categories import CategoriesQueries
+from core.repositories.companies import CompaniesQuerybuilder
+from database import AsyncSession
+from models import Company, Building, Category, PhoneNumber, \
+    company_category_association
+from rabbitmq.export_service import export_query
+
+# nodes estimated and returning fewer rows are not checked for estimates
+MIN_ESTIMATE_ROWS = 100
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) of a statement, executes
+    it with the same parameters"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element: Explain, compiler, **kw) -> str:
+    return ("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+            + compiler.process(element.statement, **kw))
+
+
+@dataclass(frozen=True)
+class PlanCase:
+    name: str
+    # sample values -> (statement, params)
+    build: Callable[[dict], tuple]
+    # tables a sequential scan of is expected, e.g. by full exports
+    seq_scans: tuple[str, ...] = ()
+
+
+def _statement(build: Callable[[dict], object]) -> Callable[[dict], tuple]:
+    return lambda sample: (build(sample), {})
+
+
+def _advanced_case(shape: tuple[str, ...]) -> PlanCase:
+    values = {
+        "name": lambda s: s["company_name"],
+        "category_id": lambda s: s["category_id"],
+        "category_name": lambda s: s["category_name"],
+        "phone_number": lambda s: s["phone"],
+        "building_id": lambda s: s["building_id"],
+        "location": lambda s: (s["lon"], s["lat"], 1000),
+        "company_ids": lambda s: [s["company_id"]],
+    }
+
+    def build(sample: dict) -> tuple:
+        kwargs = dict.fromkeys(CompaniesQuerybuilder.advanced_filters)
+        kwargs.update((f, values[f](sample)) for f in shape)
+        return CompaniesQuerybuilder.get_companies_advanced_search_query(
+            **kwargs
+        )
+
+    return PlanCase("advanced:" + "+".join(shape), build)
+
+
+_companies = CompaniesQuerybuilder
+PLAN_CASES = [
+    PlanCase("company:id", _statement(
+        lambda s: _companies.get_company_query(s["company_id"])
+    )),
+    # companies.name has no index, lookups by name scan the table
+    PlanCase("company:name", _statement(
+        lambda s: _companies.get_company_query(s["company_name"])
+    ), seq_scans=("companies",)),
+    PlanCase("company:version", _statement(
+        lambda s: _companies.get_company_version_query(s["company_id"])
+    )),
+    PlanCase("companies:by_ids", lambda s: (
+        _companies.get_companies_by_ids_query([s["company_id"]])
+    )),
+    # the area filter casts buildings.coordinates to geography, which
+    # no index covers
+    PlanCase("companies:in_area", lambda s: (
+        _companies.get_companies_in_area_query(s["lon"], s["lat"], 1000)
+    ), seq_scans=("buildings", "companies")),
+    PlanCase("companies:in_areas", lambda s: (
+        _companies.get_companies_in_areas_query([
+            (s["lon"], s["lat"], 500), (s["lon"], s["lat"], 2000)
+        ])
+    )),
+    PlanCase("companies:by_category_id", _statement(
+        lambda s: _companies.get_companies_by_category_query(
+            s["category_id"]
+        )
+    )),
+    PlanCase("companies:by_category_name", _statement(
+        lambda s: _companies.get_companies_by_category_query(
+            s["category_name"]
+        )
+    )),
+    *(_advanced_case(shape) for shape in _companies.common_advanced_shapes),
+    PlanCase("companies:text", lambda s: (
+        _companies.get_text_search_query(s["company_name"], 20)
+    )),
+    PlanCase("building:id", _statement(
+        lambda s: BuildingsQueries.get_building_query(s["building_id"])
+    )),
+    PlanCase("buildings:by_ids", lambda s: (
+        BuildingsQueries.get_buildings_query([s["building_id"]])
+    )),
+    PlanCase("building:companies", _statement(
+        lambda s: BuildingsQueries.get_building_companies_query(
+            s["building_id"]
+        )
+    )),
+    PlanCase("building:companies_version", _statement(
+        lambda s: BuildingsQueries.get_building_companies_version_query(
+            s["building_id"]
+        )
+    )),
+    PlanCase("category:id", _statement(
+        lambda s: CategoriesQueries.get_category_query(s["category_id"])
+    )),
+    PlanCase("category:name", _statement(
+        lambda s: CategoriesQueries.get_category_query(s["category_name"])
+    )),
+    PlanCase("category:version", _statement(
+        lambda s: CategoriesQueries.get_category_version_query(
+            s["category_id"]
+        )
+    )),
+    PlanCase("category:parent_depth", _statement(
+        lambda s: CategoriesQueries.get_parent_with_depth_query(
+            s["category_id"]
+        )
+    )),
+    *(
+        PlanCase(f"export:{table}", _statement(
+            lambda s, table=table: export_query(table)
+        ), seq_scans=(table,))
+        for table in ("companies", "phone_numbers", "buildings", "categories")
+    ),
+]
+
+
+async def plan_sample(db: AsyncSession, company_id: int | None = None) -> dict:
+    """Values the cases filter by, all taken from one company: the given
+    one or the one with the median id"""
+    assoc = company_category_association
+    if company_id is None:
+        company_id = select(
+            func.percentile_disc(0.5).within_group(Company.id)
+        ).scalar_subquery()
+    phone = (
+        select(func.right(cast(PhoneNumber.phone_number, String), 4))
+        .where(PhoneNumber.company_id == Company.id)
+        .order_by(PhoneNumber.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        select(
+            Company.id, Company.name, Company.building_id,
+            func.ST_X(Building.coordinates), func.ST_Y(Building.coordinates),
+            Category.id, Category.name, phone
+        )
+        .join(Building, Building.id == Company.building_id)
+        .join(assoc, assoc.c.company_id == Company.id)
+        .join(Category, Category.id == assoc.c.category_id)
+        .where(Company.id >= company_id)
+        .order_by(Company.id, Category.id)
+        .limit(1)
+    )
+    row = result.first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No company with a building and a category to sample"
+        )
+    keys = (
+        "company_id", "company_name", "building_id", "lon", "lat",
+        "category_id", "category_name", "phone"
+    )
+    sample = dict(zip(keys, row))
+    sample["phone"] = sample["phone"] or "0"
+    return sample
+
+
+async def explain(db: AsyncSession, statement, params: dict) -> dict:
+    """Executes the statement under EXPLAIN, returns the JSON plan"""
+    result = await db.execute(Explain(statement), params)
+    plan = result.scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def _nodes(node: dict):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _nodes(child)
+
+
+def summarize(plan: dict) -> dict:
+    """Scans, indexes, worst row estimate, timing and buffers of a plan"""
+    root = plan["Plan"]
+    seq_scans, indexes = set(), set()
+    misestimate, misestimated = 1.0, None
+    for node in _nodes(root):
+        if node["Node Type"] == "Seq Scan":
+            seq_scans.add(node["Relation Name"])
+        if "Index Name" in node:
+            indexes.add(node["Index Name"])
+        estimated = node.get("Plan Rows", 0)
+        actual = node.get("Actual Rows", 0)
+        if max(estimated, actual) < MIN_ESTIMATE_ROWS:
+            continue
+        ratio = max(estimated, actual) / max(min(estimated, actual), 1)
+        if ratio > misestimate:
+            misestimate, misestimated = ratio, node["Node Type"]
+    return {
+        "execution_ms": plan.get("Execution Time", 0.0),
+        "planning_ms": plan.get("Planning Time", 0.0),
+        "seq_scans": sorted(seq_scans),
+        "indexes": sorted(indexes),
+        "misestimate": round(misestimate, 1),
+        "misestimated_node": misestimated,
+        "shared_hit": root.get("Shared Hit Blocks", 0),
+        "shared_read": root.get("Shared Read Blocks", 0),
+    }
+
+
+def find_regressions(
+        summary: dict, baseline: dict | None, table_rows: dict[str, float],
+        expected_seq_scans: tuple[str, ...] = ()
+) -> list[str]:
+    """Problems of a plan summary compared to its baseline summary"""
+    problems = []
+    known = set(expected_seq_scans)
+    if baseline is not None:
+        known.update(baseline["seq_scans"])
+    for table in summary["seq_scans"]:
+        rows = table_rows.get(table, 0)
+        if table not in known and rows >= settings.PLAN_LARGE_TABLE_ROWS:
+            problems.append(
+                f"sequential scan of {table} (~{rows:.0f} rows)"
+            )
+    if baseline is None:
+        return problems
+
+    for index in sorted(set(baseline["indexes"]) - set(summary["indexes"])):
+        problems.append(f"index {index} is no longer used")
+    limit = max(
+        settings.PLAN_MISESTIMATE_LIMIT,
+        baseline["misestimate"] * settings.PLAN_MISESTIMATE_GROWTH
+    )
+    if summary["misestimate"] > limit:
+        problems.append(
+            f"{summary['misestimated_node']} rows estimate off by "
+            f"{summary['misestimate']:.0f}x, baseline "
+            f"{baseline['misestimate']:.0f}x"
+        )
+    return problems
+
+
+def _plan_path(directory: Path, case: str) -> Path:
+    return Path(directory) / (re.sub(r"[^\w.-]", "_", case) + ".json")
+
+
+def load_baseline(directory: Path, case: str) -> dict | None:
+    path = _plan_path(directory, case)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())["summary"]
+
+
+def save_baseline(directory: Path, case: str, plan: dict, summary: dict):
+    path = _plan_path(directory, case)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(
+        {"case": case, "summary": summary, "plan": plan}, indent=2
+    ))
+
+
+async def table_rows(db: AsyncSession) -> dict[str, float]:
+    """Planner row estimates of the application tables"""
+    result = await db.execute(text(
+        "SELECT relname, reltuples FROM pg_class "
+        "WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+    ))
+    return {name: rows for name, rows in result}
+
+
+async def explain_cases(
+        db: AsyncSession, cases: list[PlanCase] | None = None,
+        directory: Path | None = None, company_id: int | None = None,
+        save: Literal["none", "missing", "all"] = "none"
+) -> list[dict]:
+    """Explains the cases and checks them against their baselines.
+
+    save "missing" records the plans of cases without a baseline, "all"
+    replaces every baseline; problems are still reported against the
+    baseline found before"""
+    directory = directory or settings.PLAN_BASELINE_DIR
+    sample = await plan_sample(db, company_id)
+    rows = await table_rows(db)
+    reports = []
+    for case in PLAN_CASES if cases is None else cases:
+        plan = await explain(db, *case.build(sample))
+        summary = summarize(plan)
+        baseline = load_baseline(directory, case.name)
+        if save == "all" or save == "missing" and baseline is None:
+            save_baseline(directory, case.name, plan, summary)
+        reports.append({
+            "case": case.name,
+            **summary,
+            "baseline": baseline is not None,
+            "problems": find_regressions(
+                summary, baseline, rows, case.seq_scans
+            ),
+        })
+    return reports
@@ -0,0 +1,359 @@
+"""Radius search candidates cached per geohash cell.
+
+A radius search is answered from the cells covering its bounding box:
+each cell holds the (company, lon, lat) rows located in it and the
+distance check runs in process. Great-circle distances can differ from
+the spheroid distances of ST_DWithin by up to SPHEROID_MARGIN, rows
+that close to the radius are checked by ST_DWithin, so results match
+the uncached statement. Cells are loaded from the database on a miss
+and dropped when a building or company in them is written, through the
+ORM in this process or by anyone as announced on CATALOGUE_CHANNEL."""
+import asyncio
+import json
+import logging
+import math
+import re
+from collections import namedtuple
+
+from geoalchemy2 import Geography, WKBElement
+from geoalchemy2.shape import to_shape
+from sqlalchemy import event, select, cast, func, or_, inspect
+
+from config import settings
+from core.cache import LRUCache
+from database import AsyncSession, AsyncSessionLocal
+from models import Building, Company
+
+logger = logging.getLogger("geo_cache")
+
+EARTH_RADIUS = 6371008.8  # mean radius, meters
+SPHEROID_MARGIN = 0.01
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+WKT_POINT = re.compile(r"POINT\s*\(\s*(\S+)\s+(\S+)\s*\)", re.IGNORECASE)
+
+# (company id, lon, lat) rows and the ids of all buildings in a cell
+Cell = namedtuple("Cell", "rows building_ids")
+
+
+def haversine(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    """Great-circle distance in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (math.sin(dphi / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    """Width and height of a geohash cell in degrees"""
+    bits = precision * 5
+    return 360 / 2 ** ((bits + 1) // 2), 180 / 2 ** (bits // 2)
+
+
+def _cell_index(lon: float, lat: float, precision: int) -> tuple[int, int]:
+    width, height = cell_size(precision)
+    bits = precision * 5
+    ix = min(int((lon + 180) // width), 2 ** ((bits + 1) // 2) - 1)
+    iy = min(int((lat + 90) // height), 2 ** (bits // 2) - 1)
+    return ix, iy
+
+
+def _cell_hash(ix: int, iy: int, precision: int) -> str:
+    bits = precision * 5
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    code = 0
+    for bit in range(bits):
+        # even bits come from the longitude, most significant first
+        if bit % 2 == 0:
+            lon_bits -= 1
+            code = (code << 1) | ((ix >> lon_bits) & 1)
+        else:
+            lat_bits -= 1
+            code = (code << 1) | ((iy >> lat_bits) & 1)
+    return "".join(
+        BASE32[(code >> shift) & 31]
+        for shift in range(bits - 5, -1, -5)
+    )
+
+
+def encode(lon: float, lat: float, precision: int) -> str:
+    return _cell_hash(*_cell_index(lon, lat, precision), precision)
+
+
+def covering_cells(
+        lon: float, lat: float, radius: float, precision: int,
+        max_cells: int
+) -> list[tuple[str, tuple[float, float, float]]] | None:
+    """Cells intersecting the bounding box of the circle, each with the
+    center and radius of a circle enclosing it. None when the circle
+    needs more than max_cells cells or wraps around a pole or the
+    antimeridian."""
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90) or radius < 0:
+        return None
+    dlat = math.degrees(radius / EARTH_RADIUS)
+    if abs(lat) + dlat >= 90:
+        return None
+    dlon = dlat / math.cos(math.radians(abs(lat) + dlat))
+    if not -180 <= lon - dlon <= lon + dlon <= 180:
+        return None
+
+    min_ix, min_iy = _cell_index(lon - dlon, lat - dlat, precision)
+    max_ix, max_iy = _cell_index(lon + dlon, lat + dlat, precision)
+    if (max_ix - min_ix + 1) * (max_iy - min_iy + 1) > max_cells:
+        return None
+
+    width, height = cell_size(precision)
+    cells = []
+    for ix in range(min_ix, max_ix + 1):
+        for iy in range(min_iy, max_iy + 1):
+            west, south = ix * width - 180, iy * height - 90
+            center = (west + width / 2, south + height / 2)
+            # the margin covers the spheroid used by ST_DWithin
+            enclosing = max(
+                haversine(*center, west, south),
+                haversine(*center, west, south + height)
+            ) * (1 + SPHEROID_MARGIN)
+            cells.append(
+                (_cell_hash(ix, iy, precision), (*center, enclosing))
+            )
+    return cells
+
+
+def _geography_point(lon, lat):
+    return cast(func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326), Geography)
+
+
+def point_of(coordinates) -> tuple[float, float] | None:
+    """(lon, lat) of a Building.coordinates value in any of the forms the
+    application assigns or loads"""
+    if coordinates is None:
+        return None
+    if isinstance(coordinates, WKBElement):
+        point = to_shape(coordinates)
+        return point.x, point.y
+    match = WKT_POINT.search(getattr(coordinates, "data", str(coordinates)))
+    if match is None:
+        return None
+    return float(match.group(1)), float(match.group(2))
+
+
+class GeoCellCache:
+    def __init__(
+            self, precision: int, max_cells: int, ttl: float,
+            max_entries: int, enabled: bool = True
+    ):
+        self.enabled = enabled
+        self.precision = precision
+        self.max_cells = max_cells
+        self._cells = LRUCache(max_entries, ttl, on_evict=self._forget)
+        # building and company id -> cell it was cached in, for
+        # invalidation, entries go with their cell
+        self._building_cells: dict[int, str] = {}
+        self._company_cells: dict[int, str] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def find_company_ids(
+            self, lon: float, lat: float, radius: float, db: AsyncSession
+    ) -> list[int] | None:
+        """Ids of companies within radius meters of the point, None if
+        the search is too wide to be answered from cells"""
+        if not self.enabled:
+            return None
+        cells = covering_cells(
+            lon, lat, radius, self.precision, self.max_cells
+        )
+        if cells is None:
+            return None
+
+        entries = {}
+        missing = []
+        for cell, enclosing in cells:
+            entry = await self._cells.get(cell)
+            if entry is None:
+                missing.append((cell, enclosing))
+            else:
+                entries[cell] = entry
+        if missing:
+            entries.update(await self._load(missing, db))
+
+        company_ids, near_edge = [], []
+        inside = radius * (1 - SPHEROID_MARGIN)
+        outside = radius * (1 + SPHEROID_MARGIN)
+        for entry in entries.values():
+            for company_id, company_lon, company_lat in entry.rows:
+                distance = haversine(lon, lat, company_lon, company_lat)
+                if distance <= inside:
+                    company_ids.append(company_id)
+                elif distance <= outside:
+                    near_edge.append(company_id)
+        if near_edge:
+            company_ids.extend(
+                await self._within(lon, lat, radius, near_edge, db)
+            )
+        return company_ids
+
+    @staticmethod
+    async def _within(
+            lon: float, lat: float, radius: float, company_ids: list[int],
+            db: AsyncSession
+    ) -> list[int]:
+        """The companies ST_DWithin places within radius of the point"""
+        result = await db.execute(
+            select(Company.id)
+            .join(Building, Building.id == Company.building_id)
+            .where(
+                Company.id.in_(company_ids),
+                func.ST_DWithin(
+                    cast(Building.coordinates, Geography),
+                    _geography_point(lon, lat), radius
+                )
+            )
+        )
+        return list(result.scalars())
+
+    async def _load(
+            self, cells: list[tuple[str, tuple]], db: AsyncSession
+    ) -> dict[str, Cell]:
+        q = (
+            select(
+                Building.id, Company.id,
+                func.ST_X(Building.coordinates),
+                func.ST_Y(Building.coordinates)
+            )
+            .outerjoin(Company, Company.building_id == Building.id)
+            .where(or_(*(
+                func.ST_DWithin(
+                    cast(Building.coordinates, Geography),
+                    _geography_point(x, y), radius
+                ) for _, (x, y, radius) in cells
+            )))
+        )
+        result = await db.execute(q)
+
+        rows = {cell: [] for cell, _ in cells}
+        building_ids = {cell: set() for cell, _ in cells}
+        for building_id, company_id, x, y in result:
+            cell = encode(x, y, self.precision)
+            if cell not in rows:
+                continue
+            building_ids[cell].add(building_id)
+            if company_id is not None:
+                rows[cell].append((company_id, x, y))
+        loaded = {}
+        for cell in rows:
+            loaded[cell] = Cell(tuple(rows[cell]), tuple(building_ids[cell]))
+            await self._cells.set(cell, loaded[cell])
+            for building_id in loaded[cell].building_ids:
+                self._building_cells[building_id] = cell
+            for company_id, _, _ in loaded[cell].rows:
+                self._company_cells[company_id] = cell
+        return loaded
+
+    def _forget(self, cell: str, entry: Cell):
+        """Drops the ids of a cell that left the cache"""
+        for building_id in entry.building_ids:
+            if self._building_cells.get(building_id) == cell:
+                del self._building_cells[building_id]
+        for company_id, _, _ in entry.rows:
+            if self._company_cells.get(company_id) == cell:
+                del self._company_cells[company_id]
+
+    def invalidate_point(self, lon: float, lat: float):
+        if -180 <= lon <= 180 and -90 <= lat <= 90:
+            self._cells.discard(encode(lon, lat, self.precision))
+
+    def invalidate_building(self, building_id: int | None):
+        cell = self._building_cells.pop(building_id, None)
+        if cell is not None:
+            self._cells.discard(cell)
+
+    def invalidate_company(self, company_id: int | None):
+        cell = self._company_cells.pop(company_id, None)
+        if cell is not None:
+            self._cells.discard(cell)
+
+    async def clear(self):
+        await self._cells.clear()
+
+    async def stop(self):
+        """Cancels read backs and drops the cells, changes are no longer
+        received"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.clear()
+
+    def on_notification(self, payload: str | None):
+        """catalogue_changes callback, see models.CATALOGUE_CHANNEL.
+
+        Notifications carry ids only, the cell a building or company
+        moved to is found by reading it back."""
+        if payload is None:
+            # notifications may have been missed
+            return self._run(self.clear())
+        change = json.loads(payload)
+        table = change["table"]
+        if table not in ("companies", "buildings"):
+            return
+        if change["op"] == "RELOAD":
+            return self._run(self.clear())
+        if table == "companies":
+            self.invalidate_company(change["id"])
+            located = Company.id
+        else:
+            self.invalidate_building(change["id"])
+            located = Building.id
+        if change["op"] != "DELETE":
+            self._run(self._invalidate_located(located, [change["id"]]))
+
+    def _run(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _invalidate_located(self, key, ids: list[int]):
+        """Drops the cells of the buildings, or the buildings of the
+        companies, with key (Building.id or Company.id) in ids"""
+        try:
+            async with AsyncSessionLocal() as db:
+                q = select(
+                    func.ST_X(Building.coordinates),
+                    func.ST_Y(Building.coordinates)
+                )
+                if key is Company.id:
+                    q = q.join(Company, Company.building_id == Building.id)
+                result = await db.execute(q.where(key.in_(ids)))
+                points = result.all()
+        except Exception:
+            logger.exception("Geo cache falls back to clearing")
+            return await self.clear()
+        for point in points:
+            self.invalidate_point(*point)
+
+
+geo_cell_cache = GeoCellCache(
+    settings.GEO_CACHE_PRECISION, settings.GEO_CACHE_MAX_CELLS,
+    settings.GEO_CACHE_TTL, settings.GEO_CACHE_MAX_ENTRIES,
+    enabled=settings.GEO_CACHE_ENABLED
+)
+
+
+@event.listens_for(Building, "after_insert")
+@event.listens_for(Building, "after_update")
+@event.listens_for(Building, "after_delete")
+def _invalidate_building_cell(mapper, connection, target):
+    geo_cell_cache.invalidate_building(target.id)
+    point = point_of(target.coordinates)
+    if point is not None:
+        geo_cell_cache.invalidate_point(*point)
+
+
+@event.listens_for(Company, "after_insert")
+@event.listens_for(Company, "after_update")
+@event.listens_for(Company, "after_delete")
+def _invalidate_company_cell(mapper, connection, target):
+    history = inspect(target).attrs.building_id.history
+    for building_id in (target.building_id, *history.deleted):
+        geo_cell_cache.invalidate_building(building_id)
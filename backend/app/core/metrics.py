@@ -0,0 +1,296 @@
+"""In-process metrics rendered in Prometheus text exposition format"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import settings
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0
+)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(34), chr(39))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = (
+            self._values.get(label_values, 0) + amount
+        )
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} counter"]
+        for label_values, value in self._values.items():
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, *label_values, value: float):
+        self._values[label_values] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(
+            self, name: str, documentation: str, labels=(),
+            buckets=LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., sum, count]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, *label_values, value: float):
+        series = self._values.get(label_values)
+        if series is None:
+            series = self._values[label_values] = (
+                [0] * len(self.buckets) + [0.0, 0]
+            )
+        idx = bisect_left(self.buckets, value)
+        if idx < len(self.buckets):
+            series[idx] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} histogram"]
+        label_names = self.labels + ("le",)
+        for label_values, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(label_names, label_values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(label_names, label_values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency",
+    labels=("method", "route", "status")
+))
+db_statements_per_request = registry.register(Histogram(
+    "db_statements_per_request", "SQL statements executed per request",
+    labels=("route",), buckets=COUNT_BUCKETS
+))
+db_time_per_request = registry.register(Histogram(
+    "db_time_per_request_seconds", "Time spent in SQL per request",
+    labels=("route",)
+))
+db_rows_fetched = registry.register(Counter(
+    "db_rows_fetched_total", "Rows returned or affected by SQL statements",
+    labels=("route",)
+))
+response_serialization = registry.register(Histogram(
+    "response_serialization_seconds", "Time spent rendering JSON responses",
+    labels=("route",)
+))
+export_rows = registry.register(Counter(
+    "export_rows_total", "Rows written by the export worker",
+    labels=("table",)
+))
+export_bytes = registry.register(Counter(
+    "export_bytes_total", "Bytes written by the export worker",
+    labels=("table",)
+))
+export_duration = registry.register(Histogram(
+    "export_duration_seconds", "Export task processing time",
+    labels=("table",)
+))
+export_rows_per_second = registry.register(Gauge(
+    "export_last_rows_per_second", "Throughput of the last export task",
+    labels=("table",)
+))
+export_bytes_per_second = registry.register(Gauge(
+    "export_last_bytes_per_second", "Throughput of the last export task",
+    labels=("table",)
+))
+
+
+@dataclass(slots=True)
+class RequestStats:
+    statements: int = 0
+    db_time: float = 0.0
+    rows: int = 0
+    serialization_time: float = 0.0
+
+
+request_stats: ContextVar[RequestStats | None] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def _before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+):
+    stats = request_stats.get()
+    if stats is None:
+        return
+    stats.statements += 1
+    stats.db_time += time.perf_counter() - context._metrics_started
+    if cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+
+def instrument_engine(engine: AsyncEngine):
+    event.listen(
+        engine.sync_engine, "before_cursor_execute", _before_cursor_execute
+    )
+    event.listen(
+        engine.sync_engine, "after_cursor_execute", _after_cursor_execute
+    )
+
+
+class StatementCounter:
+    """Records the SQL statements an engine runs while active, guards
+    against lazy loads and N+1 queries in tests:
+
+        with StatementCounter(engine) as counter:
+            ...
+        assert counter.count <= 3, counter.statements
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine.sync_engine
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def reset(self):
+        self.statements.clear()
+
+    def _after_cursor_execute(
+            self, conn, cursor, statement, parameters, context, executemany
+    ):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(
+            self.engine, "after_cursor_execute", self._after_cursor_execute
+        )
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(
+            self.engine, "after_cursor_execute", self._after_cursor_execute
+        )
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSON response that reports its rendering time to request stats"""
+
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        body = super().render(content)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.serialization_time += time.perf_counter() - started
+        return body
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and DB usage"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.SQL_STATEMENTS_HEADER:
+                    message["headers"] = [
+                        *message.get("headers", ()),
+                        (b"x-sql-statements", str(stats.statements).encode())
+                    ]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_stats.reset(token)
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            http_request_duration.observe(
+                scope["method"], route_path, status_code, value=elapsed
+            )
+            db_statements_per_request.observe(
+                route_path, value=stats.statements
+            )
+            db_time_per_request.observe(route_path, value=stats.db_time)
+            if stats.rows:
+                db_rows_fetched.inc(route_path, amount=stats.rows)
+            if stats.serialization_time:
+                response_serialization.observe(
+                    route_path, value=stats.serialization_time
+                )
@@ -0,0 +1,93 @@
+import asyncio
+from collections import defaultdict
+from typing import Callable
+
+import asyncpg
+
+from database import engine
+
+NotificationCallback = Callable[[str | None], None]
+
+
+class NotificationHub:
+    """Single Postgres LISTEN connection per process, fanned out in memory.
+
+    Callbacks receive the raw NOTIFY payload, or None when the listener
+    connection was lost and notifications may have been missed."""
+
+    def __init__(self, dsn: str):
+        self._dsn = dsn
+        self._conn: asyncpg.Connection | None = None
+        self._lock = asyncio.Lock()
+        self._callbacks: dict[str, set[NotificationCallback]] = (
+            defaultdict(set)
+        )
+
+    async def subscribe(
+            self, channel: str, callback: NotificationCallback
+    ) -> None:
+        async with self._lock:
+            conn = await self._get_connection()
+            if not self._callbacks[channel]:
+                await conn.add_listener(channel, self._dispatch)
+            self._callbacks[channel].add(callback)
+
+    async def unsubscribe(
+            self, channel: str, callback: NotificationCallback
+    ) -> None:
+        async with self._lock:
+            callbacks = self._callbacks.get(channel)
+            if not callbacks:
+                return
+            callbacks.discard(callback)
+            if not callbacks:
+                del self._callbacks[channel]
+                if self._conn is not None and not self._conn.is_closed():
+                    await self._conn.remove_listener(channel, self._dispatch)
+
+    async def close(self) -> None:
+        """Closes the connection, subscriptions are listened to again on
+        the next subscribe"""
+        async with self._lock:
+            if self._conn is not None and not self._conn.is_closed():
+                # a deliberate close is not a lost connection
+                self._conn.remove_termination_listener(self._on_terminated)
+                await self._conn.close()
+            self._conn = None
+
+    async def _get_connection(self) -> asyncpg.Connection:
+        if self._conn is None or self._conn.is_closed():
+            self._conn = await asyncpg.connect(self._dsn)
+            self._conn.add_termination_listener(self._on_terminated)
+            for channel in self._callbacks:
+                await self._conn.add_listener(channel, self._dispatch)
+        return self._conn
+
+    def _dispatch(self, connection, pid, channel: str, payload: str):
+        for callback in list(self._callbacks.get(channel, ())):
+            callback(payload)
+
+    def _on_terminated(self, connection):
+        self._conn = None
+        for callbacks in self._callbacks.values():
+            for callback in list(callbacks):
+                callback(None)
+        if self._callbacks:
+            asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self, delay: float = 1.0) -> None:
+        while self._callbacks:
+            try:
+                async with self._lock:
+                    await self._get_connection()
+                return
+            except (OSError, asyncpg.PostgresError):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+notification_hub = NotificationHub(
+    engine.url.set(drivername="postgresql").render_as_string(
+        hide_password=False
+    )
+)
@@ -0,0 +1,214 @@
+"""Slow statement log and statement traces of the slowest requests.
+
+RequestTraceMiddleware gives every request an id, the client's
+X-Request-ID when it sends one, and a RequestTrace kept in a context
+variable. Engines passed to trace_engine add each statement to the
+current trace. Statements slower than settings.SLOW_QUERY_MS are logged
+as one JSON line with the request id, route, parameter shape (types and
+list lengths, never values), duration and row count. Full traces of the
+settings.SLOW_TRACES_PER_MINUTE slowest requests of each minute are kept
+for settings.SLOW_TRACES_MINUTES minutes.
+"""
+import heapq
+import itertools
+import json
+import logging
+import time
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import settings
+
+logger = logging.getLogger("slow_queries")
+
+# statements recorded per trace, later ones are only counted
+MAX_TRACE_STATEMENTS = 200
+
+
+@dataclass(slots=True)
+class RequestTrace:
+    request_id: str
+    method: str
+    path: str
+    # the ASGI scope, the router sets the matched route on it
+    scope: dict
+    started: float = field(default_factory=time.perf_counter)
+    statements: list[dict] = field(default_factory=list)
+    statement_count: int = 0
+
+    @property
+    def route(self) -> str | None:
+        route = self.scope.get("route")
+        return route.path if route is not None else None
+
+
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+current_trace: ContextVar[RequestTrace | None] = ContextVar(
+    "current_trace", default=None
+)
+
+
+def _value_shape(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def params_shape(parameters, executemany: bool = False) -> dict | list:
+    """Types and list lengths of statement parameters"""
+    if executemany:
+        return {
+            "rows": len(parameters),
+            "row": params_shape(parameters[0]) if parameters else [],
+        }
+    if isinstance(parameters, dict):
+        return {key: _value_shape(value) for key, value in parameters.items()}
+    return [_value_shape(value) for value in parameters or ()]
+
+
+def _before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+):
+    context._trace_started = time.perf_counter()
+
+
+def _after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+):
+    finished = time.perf_counter()
+    duration_ms = (finished - context._trace_started) * 1000
+    trace = current_trace.get()
+    slow = duration_ms >= settings.SLOW_QUERY_MS
+    if trace is None and not slow:
+        return
+
+    record = {
+        "statement": statement,
+        "params": params_shape(parameters, executemany),
+        "duration_ms": round(duration_ms, 3),
+        "rows": cursor.rowcount if cursor.rowcount >= 0 else None,
+    }
+    if trace is not None:
+        trace.statement_count += 1
+        if len(trace.statements) < MAX_TRACE_STATEMENTS:
+            trace.statements.append({
+                **record,
+                "offset_ms": round(
+                    (context._trace_started - trace.started) * 1000, 3
+                ),
+            })
+    if slow:
+        logger.warning(json.dumps({
+            "event": "slow_statement",
+            "request_id": request_id.get(),
+            "method": trace.method if trace else None,
+            "route": trace.route if trace else None,
+            **record,
+        }))
+
+
+def trace_engine(engine: AsyncEngine):
+    event.listen(
+        engine.sync_engine, "before_cursor_execute", _before_cursor_execute
+    )
+    event.listen(
+        engine.sync_engine, "after_cursor_execute", _after_cursor_execute
+    )
+
+
+class SlowRequestTraces:
+    """The slowest requests of each minute with all their statements"""
+
+    def __init__(self):
+        # minute -> min-heap of (duration, tie breaker, report)
+        self._minutes: dict[int, list[tuple]] = {}
+        self._counter = itertools.count()
+
+    def offer(self, trace: RequestTrace, duration: float, status_code: int):
+        keep = settings.SLOW_TRACES_PER_MINUTE
+        if keep <= 0:
+            return
+        minute = int(time.time() // 60)
+        heap = self._minutes.get(minute)
+        if heap is None:
+            for expired in [
+                m for m in self._minutes
+                if m <= minute - settings.SLOW_TRACES_MINUTES
+            ]:
+                del self._minutes[expired]
+            heap = self._minutes[minute] = []
+        if len(heap) >= keep and duration <= heap[0][0]:
+            return
+
+        report = {
+            "minute": datetime.fromtimestamp(minute * 60, timezone.utc),
+            "request_id": trace.request_id,
+            "method": trace.method,
+            "path": trace.path,
+            "route": trace.route,
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "statement_count": trace.statement_count,
+            "statements": trace.statements,
+        }
+        entry = (duration, next(self._counter), report)
+        if len(heap) < keep:
+            heapq.heappush(heap, entry)
+        else:
+            heapq.heapreplace(heap, entry)
+
+    def snapshot(self) -> list[dict]:
+        """Kept traces, latest minute first, slowest first within it"""
+        return [
+            report
+            for minute in sorted(self._minutes, reverse=True)
+            for _, _, report in sorted(self._minutes[minute], reverse=True)
+        ]
+
+    def clear(self):
+        self._minutes.clear()
+
+
+slow_traces = SlowRequestTraces()
+
+
+class RequestTraceMiddleware:
+    """ASGI middleware setting the request id and statement trace"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        rid = dict(scope["headers"]).get(b"x-request-id")
+        rid = rid.decode("latin-1")[:128] if rid else uuid.uuid4().hex
+        trace = RequestTrace(rid, scope["method"], scope["path"], scope)
+        id_token = request_id.set(rid)
+        trace_token = current_trace.set(trace)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (b"x-request-id", rid.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(trace_token)
+            request_id.reset(id_token)
+            slow_traces.offer(
+                trace, time.perf_counter() - trace.started, status_code
+            )
@@ -1,9 +1,12 @@
 from geoalchemy2 import WKTElement
-from sqlalchemy import select
+from sqlalchemy import select, func, bindparam, Select
 from sqlalchemy.orm import joinedload
 
+from core.cache import response_cache, building_key, \
+    building_companies_key
 from database import AsyncSession
-from models import Building, Company
+from models import Building, Company, Category, PhoneNumber, \
+    company_category_association
 
 
 class BuildingsQueries:
@@ -20,36 +23,114 @@ class BuildingsQueries:
             )
             db.add(bld)
             await db.commit()
-            await db.refresh(bld)
+            await response_cache.delete(
+                building_key(bld.id), building_companies_key(bld.id)
+            )
+            # the session keeps the values it inserted, no refresh needed
             return bld
         except Exception as e:
             await db.rollback()
             raise e
 
     @staticmethod
-    async def get_building(building_id: int, db: AsyncSession) -> Building:
-        result = await db.execute(
-            select(Building).where(Building.id == building_id)
+    def get_building_query(building_id: int) -> Select:
+        return select(Building).where(Building.id == building_id)
+
+    @staticmethod
+    def get_buildings_query(
+            building_ids: list[int]
+    ) -> tuple[Select, dict]:
+        q = (
+            select(Building)
+            .where(Building.id.in_(bindparam("ids", expanding=True)))
         )
-        return result.scalar_one_or_none()
+        return q, {"ids": list(dict.fromkeys(building_ids))}
 
     @staticmethod
-    async def get_building_companies(
-            building_id: int,
-            db: AsyncSession
-    ) -> Building:
+    def get_building_companies_query(building_id: int) -> Select:
         preload_options = [
             joinedload(Building.companies),
             joinedload(Building.companies).joinedload(Company.phone_numbers),
             joinedload(Building.companies).joinedload(Company.categories)
         ]
-        q = (
+        return (
             select(Building)
             .where(Building.id == building_id)
             .options(*preload_options)
         )
 
+    @staticmethod
+    def get_building_companies_version_query(building_id: int) -> Select:
+        assoc = company_category_association
+        in_building = Company.building_id == Building.id
+        return select(
+            Building.updated_at,
+            select(func.max(Company.updated_at))
+            .where(in_building)
+            .scalar_subquery(),
+            select(func.count(Company.id))
+            .where(in_building)
+            .scalar_subquery(),
+            select(func.max(Category.updated_at))
+            .join(assoc, assoc.c.category_id == Category.id)
+            .join(Company, Company.id == assoc.c.company_id)
+            .where(in_building)
+            .scalar_subquery(),
+            select(func.count())
+            .select_from(assoc)
+            .join(Company, Company.id == assoc.c.company_id)
+            .where(in_building)
+            .scalar_subquery(),
+            select(func.max(PhoneNumber.id))
+            .join(Company, Company.id == PhoneNumber.company_id)
+            .where(in_building)
+            .scalar_subquery(),
+            select(func.count(PhoneNumber.id))
+            .join(Company, Company.id == PhoneNumber.company_id)
+            .where(in_building)
+            .scalar_subquery(),
+        ).where(Building.id == building_id)
+
+    @classmethod
+    async def get_building(
+            cls, building_id: int, db: AsyncSession
+    ) -> Building:
+        result = await db.execute(cls.get_building_query(building_id))
+        return result.scalar_one_or_none()
+
+    @classmethod
+    async def get_buildings(
+            cls, building_ids: list[int], db: AsyncSession
+    ) -> tuple[list[Building], list[int]]:
+        """Buildings in the order of building_ids, fetched with one query,
+        and the ids that were not found"""
+        result = await db.execute(*cls.get_buildings_query(building_ids))
+        found = {bld.id: bld for bld in result.scalars()}
+        return (
+            [found[bld_id] for bld_id in building_ids if bld_id in found],
+            [bld_id for bld_id in building_ids if bld_id not in found]
+        )
+
+    @classmethod
+    async def get_building_companies(
+            cls, building_id: int,
+            db: AsyncSession
+    ) -> Building:
+        """Read through db, not the snapshot: the response is cached under
+        an ETag versioned on db and has to match it"""
+        q = cls.get_building_companies_query(building_id)
         res = await db.execute(q)
         bld = res.scalars().first()
 
         return bld
+
+    @classmethod
+    async def get_building_companies_version(
+            cls, building_id: int, db: AsyncSession
+    ) -> tuple | None:
+        """Cheap version of the rows a building companies response is
+        built from, None if the building does not exist"""
+        q = cls.get_building_companies_version_query(building_id)
+        result = await db.execute(q)
+        row = result.first()
+        return tuple(row) if row else None
@@ -1,50 +1,91 @@
 from fastapi import HTTPException, status
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, func, literal_column, Select
+from sqlalchemy.orm import selectinload, aliased
 
+from core.cache import response_cache, category_key, category_name_key
+from core.singleflight import query_flight
 from database import AsyncSession
 from models import Category
 
 
 class CategoriesQueries:
-    @classmethod
-    async def _get_category_depth(
-            cls, category_id: int, db: AsyncSession
-    ) -> int:
-        depth = 1
-        result = await db.execute(
-            select(Category).where(Category.id == category_id)
-        )
-        current_category = result.scalars().first()
-        while current_category and current_category.parent_id:
-            depth += 1
-            result = await db.execute(
-                select(Category).where(
-                    Category.id == current_category.parent_id)
+    @staticmethod
+    def get_parent_with_depth_query(parent_id: int) -> Select:
+        """The parent category and its nesting depth (1 for a root),
+        walked up in one recursive query"""
+        ancestors = (
+            select(
+                Category.id, Category.parent_id,
+                literal_column("1").label("depth")
             )
-            current_category = result.scalars().first()
-        return depth
+            .where(Category.id == parent_id)
+            .cte("ancestors", recursive=True)
+        )
+        ancestors = ancestors.union_all(
+            select(Category.id, Category.parent_id, ancestors.c.depth + 1)
+            .join(ancestors, Category.id == ancestors.c.parent_id)
+        )
+        return select(
+            Category,
+            select(func.max(ancestors.c.depth)).scalar_subquery()
+        ).where(Category.id == parent_id)
+
+    @staticmethod
+    def get_category_query(criteria: int | str) -> Select:
+        q = select(Category).options(selectinload(Category.children))
+        match criteria:
+            case int():
+                return q.where(Category.id == criteria)
+            case str():
+                return q.where(Category.name == criteria)
+            case _:
+                raise ValueError("Invalid category search parameter, "
+                                 "str or int required")
+
+    @staticmethod
+    def get_category_version_query(category_id: int) -> Select:
+        child = aliased(Category)
+        return select(
+            Category.updated_at,
+            select(func.max(child.updated_at))
+            .where(child.parent_id == Category.id)
+            .scalar_subquery(),
+            select(func.count(child.id))
+            .where(child.parent_id == Category.id)
+            .scalar_subquery(),
+        ).where(Category.id == category_id)
+
+    @classmethod
+    async def _get_parent_with_depth(
+            cls, parent_id: int, db: AsyncSession
+    ) -> tuple[Category | None, int]:
+        result = await db.execute(cls.get_parent_with_depth_query(parent_id))
+        row = result.first()
+        return (row[0], row[1]) if row else (None, 0)
 
     @classmethod
     async def create_category(
             cls, name: str, parent_id: int | None, db: AsyncSession
     ):
         try:
+            stale_keys = [category_name_key(name)]
             # validate Category nesting depth does not exceed level 3
             if parent_id:
-                parent_res = await db.execute(
-                    select(Category).where(Category.id == parent_id)
+                parent, depth = await cls._get_parent_with_depth(
+                    parent_id, db
                 )
-                parent = parent_res.scalar_one_or_none()
                 if parent is None:
                     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                         detail="Parent category not found")
-                depth = await cls._get_category_depth(parent_id, db)
                 if depth >= 3:
                     raise HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail="Maximum categories nesting depth of 3 exceeded"
                     )
+                # parent responses list their children
+                stale_keys += [
+                    category_key(parent.id), category_name_key(parent.name)
+                ]
 
             cat = Category(
                 name=name,
@@ -52,27 +93,42 @@ class CategoriesQueries:
             )
             db.add(cat)
             await db.commit()
-            await db.refresh(cat)
+            await response_cache.delete(category_key(cat.id), *stale_keys)
+            # id and server defaults come back with the INSERT, a refresh
+            # would only repeat the read
             return cat
 
         except Exception as e:
             await db.rollback()
             raise e
 
-    @staticmethod
+    @classmethod
     async def get_category(
-            criteria: int | str, db: AsyncSession
+            cls, criteria: int | str, db: AsyncSession
     ) -> Category:
-        """Get category with children by search criteria (id or name)"""
-        q = select(Category).options(selectinload(Category.children))
-        match criteria:
-            case int():
-                result = await db.execute(q.where(Category.id == criteria))
-                cat = result.scalars().first()
-            case str():
-                result = await db.execute(q.where(Category.name == criteria))
-                cat = result.scalars().first()
-            case _:
-                cat = None
+        """Get category with children by search criteria (id or name)
 
-        return cat
+        Concurrent calls with the same criteria share one execution"""
+        return await query_flight.do(
+            ("category", type(criteria).__name__, criteria),
+            lambda: cls._get_category(criteria, db)
+        )
+
+    @classmethod
+    async def _get_category(
+            cls, criteria: int | str, db: AsyncSession
+    ) -> Category:
+        if not isinstance(criteria, (int, str)):
+            return None
+        result = await db.execute(cls.get_category_query(criteria))
+        return result.scalars().first()
+
+    @classmethod
+    async def get_category_version(
+            cls, category_id: int, db: AsyncSession
+    ) -> tuple | None:
+        """Cheap version of a category and its children,
+        None if the category does not exist"""
+        result = await db.execute(cls.get_category_version_query(category_id))
+        row = result.first()
+        return tuple(row) if row else None
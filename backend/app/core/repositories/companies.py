@@ -1,16 +1,68 @@
 from typing import List
 
 from fastapi import HTTPException, status
-from geoalchemy2 import Geography, WKTElement
-from sqlalchemy import select, cast, func, Select, and_
+from geoalchemy2 import Geography
+from sqlalchemy import select, cast, func, Select, and_, bindparam, Float, \
+    Integer, String, column, true, insert, any_, except_
+from sqlalchemy.dialects.postgresql import array, websearch_to_tsquery, \
+    ARRAY, aggregate_order_by
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import joinedload, selectinload
 
+from core.cache import response_cache, company_key, building_companies_key
+from core.geocache import geo_cell_cache
+from core.singleflight import query_flight
+from core.snapshot import snapshot_engine, Snapshot, LayeredSnapshot
+from core.suggest import suggest_index
 from database import AsyncSession
 from models import Company, Building, Category, PhoneNumber, \
-    company_category_association
+    CompanySearch, SEARCH_CONFIG, company_category_association
 
 
 class CompaniesQuerybuilder:
+    """Builds company statements.
+
+    Search statements are built once per filter combination with named
+    bind parameters and reused, so SQLAlchemy's compiled cache and
+    asyncpg's prepared statements are hit on every call after the first.
+    """
+    area_preload = (
+        selectinload(Company.phone_numbers),
+        selectinload(Company.categories),
+        joinedload(Company.building)
+    )
+    # response-ready columns of the search document
+    search_columns = (
+        CompanySearch.company_id.label("id"),
+        CompanySearch.name,
+        CompanySearch.building_id,
+        CompanySearch.phone_numbers,
+        CompanySearch.category_ids,
+        CompanySearch.category_names,
+    )
+    advanced_filters = (
+        "name", "category_id", "category_name", "phone_number",
+        "building_id", "location", "company_ids"
+    )
+    # filter combinations compiled ahead of the first request
+    common_advanced_shapes = (
+        ("name",),
+        ("category_id",),
+        ("category_name",),
+        ("phone_number",),
+        ("building_id",),
+        ("location",),
+        ("name", "category_id"),
+        ("name", "location"),
+        ("category_id", "location"),
+        ("category_name", "location"),
+        ("company_ids",),
+        ("name", "company_ids"),
+        ("category_id", "company_ids"),
+        ("category_name", "company_ids"),
+    )
+    _statements: dict[tuple, Select] = {}
+
     @classmethod
     def get_company_query(cls, criteria: str | int) -> Select:
         q = select(Company)
@@ -26,36 +78,229 @@ class CompaniesQuerybuilder:
         return q
 
     @classmethod
-    def get_area_filter(cls, lon: float, lat: float, radius: int):
-        center_point = cast(
-            WKTElement(
-                f"POINT({lon} {lat})", srid=4326
-            ),
+    def get_company_version_query(cls, company_id: int) -> Select:
+        assoc = company_category_association
+        return select(
+            Company.updated_at,
+            select(func.max(Category.updated_at))
+            .join(assoc, assoc.c.category_id == Category.id)
+            .where(assoc.c.company_id == Company.id)
+            .scalar_subquery(),
+            select(func.count())
+            .select_from(assoc)
+            .where(assoc.c.company_id == Company.id)
+            .scalar_subquery(),
+            select(func.max(PhoneNumber.id))
+            .where(PhoneNumber.company_id == Company.id)
+            .scalar_subquery(),
+            select(func.count(PhoneNumber.id))
+            .where(PhoneNumber.company_id == Company.id)
+            .scalar_subquery(),
+        ).where(Company.id == company_id)
+
+    @classmethod
+    def get_create_company_query(
+            cls, name: str, building_id: int, phone_numbers: list[str],
+            category_ids: list[int]
+    ) -> tuple[Select, dict]:
+        """Creates a company with its phones and category links in one
+        statement of data-modifying CTEs.
+
+        The company is inserted only if all categories exist. The single
+        result row has the new id, or NULL and the missing category ids,
+        and the linked categories ordered by id."""
+        def build():
+            ids = bindparam("category_ids", type_=ARRAY(Integer))
+            cats = (
+                select(Category.id, Category.name)
+                .where(Category.id == any_(ids))
+                .cte("cats")
+            )
+            requested = func.unnest(ids).column_valued("id")
+            all_found = (
+                select(func.count()).select_from(cats).scalar_subquery()
+                == select(func.count(requested.distinct())).scalar_subquery()
+            )
+            new_company = (
+                insert(Company)
+                .from_select(
+                    ["name", "building_id"],
+                    select(
+                        bindparam("name", type_=String),
+                        bindparam("building_id", type_=Integer)
+                    ).where(all_found)
+                )
+                .returning(Company.id)
+                .cte("new_company")
+            )
+            phones = (
+                insert(PhoneNumber)
+                .from_select(
+                    ["phone_number", "company_id"],
+                    select(
+                        func.unnest(bindparam(
+                            "phone_numbers",
+                            type_=ARRAY(PhoneNumber.phone_number.type)
+                        )),
+                        new_company.c.id
+                    )
+                )
+                .cte("phones")
+            )
+            links = (
+                insert(company_category_association)
+                .from_select(
+                    ["company_id", "category_id"],
+                    select(new_company.c.id, cats.c.id)
+                )
+                .cte("links")
+            )
+            missing = except_(
+                select(func.unnest(ids).label("id")), select(cats.c.id)
+            ).subquery("missing")
+            return select(
+                select(new_company.c.id).scalar_subquery().label("id"),
+                select(
+                    func.array_agg(aggregate_order_by(cats.c.id, cats.c.id))
+                ).scalar_subquery().label("category_ids"),
+                select(
+                    func.array_agg(aggregate_order_by(cats.c.name, cats.c.id))
+                ).scalar_subquery().label("category_names"),
+                select(
+                    func.array_agg(missing.c.id)
+                ).scalar_subquery().label("missing_categories"),
+            ).add_cte(phones, links)
+
+        q = cls._get_cached(("create",), build)
+        return q, {
+            "name": name,
+            "building_id": building_id,
+            "phone_numbers": phone_numbers,
+            "category_ids": list(dict.fromkeys(category_ids)),
+        }
+
+    @staticmethod
+    def _center_point(lon, lat):
+        """Accepts plain values or bind parameters, the point is built
+        server-side so the statement text does not depend on them"""
+        return cast(
+            func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326),
             Geography
         )
+
+    @classmethod
+    def get_area_filter(cls, lon, lat, radius):
         return Company.building.has(
             func.ST_DWithin(
                 cast(Building.coordinates, Geography),
-                center_point,
+                cls._center_point(lon, lat),
                 radius
             )
         )
 
+    @staticmethod
+    def _area_params():
+        return (
+            bindparam("lon", type_=Float),
+            bindparam("lat", type_=Float),
+            bindparam("radius", type_=Integer)
+        )
+
+    @classmethod
+    def _area_params_filter(cls):
+        return cls.get_area_filter(*cls._area_params())
+
+    @classmethod
+    def _search_area_params_filter(cls):
+        lon, lat, radius = cls._area_params()
+        return func.ST_DWithin(
+            CompanySearch.geog, cls._center_point(lon, lat), radius
+        )
+
+    @classmethod
+    def _get_cached(cls, key: tuple, build) -> Select:
+        q = cls._statements.get(key)
+        if q is None:
+            q = cls._statements.setdefault(key, build())
+        return q
+
     @classmethod
     def get_companies_in_area_query(
             cls, lon: float, lat: float, radius: int
-    ) -> Select:
-        preload_options = [
-            selectinload(Company.phone_numbers),
-            selectinload(Company.categories),
-            joinedload(Company.building)
-        ]
-        area_filter = cls.get_area_filter(lon, lat, radius)
+    ) -> tuple[Select, dict]:
+        q = cls._get_cached(
+            ("in_area",),
+            lambda: (
+                select(Company)
+                .where(cls._area_params_filter())
+                .options(*cls.area_preload)
+            )
+        )
+        return q, {"lon": lon, "lat": lat, "radius": radius}
 
-        q = (
-            select(Company).where(area_filter).options(*preload_options)
+    @classmethod
+    def get_companies_by_ids_query(
+            cls, company_ids: list[int]
+    ) -> tuple[Select, dict]:
+        q = cls._get_cached(
+            ("by_ids",),
+            lambda: (
+                select(Company)
+                .where(Company.id.in_(bindparam("ids", expanding=True)))
+                .options(*cls.area_preload)
+            )
         )
-        return q
+        return q, {"ids": company_ids}
+
+    @classmethod
+    def get_companies_in_areas_query(
+            cls, points: list[tuple[float, float, int]]
+    ) -> tuple[Select, dict]:
+        """Many radius searches in one statement.
+
+        Points arrive as parallel arrays unnested into numbered rows, each
+        row probes the company_search GIST index through a lateral join.
+        Matches are grouped per company, so a company found near several
+        points is returned once with the numbers of all of them."""
+        def build():
+            spots = func.unnest(
+                bindparam("lons", type_=ARRAY(Float)),
+                bindparam("lats", type_=ARRAY(Float)),
+                bindparam("radii", type_=ARRAY(Integer)),
+            ).table_valued(
+                column("lon", Float), column("lat", Float),
+                column("radius", Integer), with_ordinality="idx"
+            ).render_derived(name="points")
+            found = (
+                select(CompanySearch.company_id)
+                .where(func.ST_DWithin(
+                    CompanySearch.geog,
+                    cls._center_point(spots.c.lon, spots.c.lat),
+                    spots.c.radius
+                ))
+                .lateral("found")
+            )
+            matches = (
+                select(
+                    found.c.company_id,
+                    func.array_agg(spots.c.idx).label("point_indexes")
+                )
+                .select_from(spots.join(found, true()))
+                .group_by(found.c.company_id)
+                .cte("matches")
+            )
+            return (
+                select(*cls.search_columns, matches.c.point_indexes)
+                .join_from(
+                    CompanySearch, matches,
+                    matches.c.company_id == CompanySearch.company_id
+                )
+                .order_by(CompanySearch.company_id)
+            )
+
+        q = cls._get_cached(("in_areas",), build)
+        lons, lats, radii = map(list, zip(*points))
+        return q, {"lons": lons, "lats": lats, "radii": radii}
 
     @classmethod
     def get_companies_by_category_query(cls, criteria: int | str) -> Select:
@@ -81,55 +326,126 @@ class CompaniesQuerybuilder:
         q = select(Category).where(cat_filter).options(*preload_options)
         return q
 
+    @classmethod
+    def _build_advanced_search_query(cls, shape: tuple[str, ...]) -> Select:
+        """Single table scan of company_search, every filter is served
+        by one of its indexes"""
+        doc = CompanySearch
+        filters = {
+            "name": lambda: doc.name.ilike(bindparam("name_pattern")),
+            "category_id": lambda: doc.category_ids.contains(
+                array([bindparam("category_id", type_=Integer)])
+            ),
+            "category_name": lambda: doc.category_names.contains(
+                array([bindparam("category_name", type_=String)])
+            ),
+            "phone_number": lambda: doc.phone_digits.ilike(
+                bindparam("phone_pattern")
+            ),
+            "building_id": lambda: (
+                doc.building_id == bindparam("building_id")
+            ),
+            "location": cls._search_area_params_filter,
+            "company_ids": lambda: doc.company_id.in_(
+                bindparam("company_ids", expanding=True)
+            ),
+        }
+        q = select(*cls.search_columns)
+        if shape:
+            q = q.where(and_(*(filters[name]() for name in shape)))
+        return q
+
     @classmethod
     def get_companies_advanced_search_query(
             cls, name, category_id, category_name, phone_number, building_id,
-            location
-    ) -> Select:
-        """Builds and returns search query based on provided parameters"""
-        q = select(Company).options(
-            joinedload(Company.phone_numbers),
-            joinedload(Company.building),
-            selectinload(Company.categories),
-        )
-        filters = []
+            location, company_ids=None
+    ) -> tuple[Select, dict]:
+        """Returns search query for provided parameters and its params.
 
+        company_ids restricts the search to already known candidates,
+        e.g. the ones a location resolved to"""
+        params = {}
         if name:
-            filters.append(Company.name.ilike(f"%{name}%"))
-
+            params["name_pattern"] = f"%{name}%"
         if category_id:
-            filters.append(
-                Company.categories.any(Category.id == category_id)
-            )
-
+            params["category_id"] = category_id
         if category_name:
-            filters.append(
-                Company.categories.any(Category.name == category_name)
-            )
-
+            params["category_name"] = category_name
         if phone_number:
-            filters.append(
-                Company.phone_numbers.any(
-                    func.regexp_replace(
-                        PhoneNumber.phone_number, "[^0-9]", "", "g"
-                    ).ilike(f"%{phone_number}%")
-                )
-            )
-
+            params["phone_pattern"] = f"%{phone_number}%"
         if building_id:
-            filters.append(Company.building_id == building_id)
-
+            params["building_id"] = building_id
         if location:
-            lon, lat, radius = location
-            area_filter = CompaniesQuerybuilder.get_area_filter(
-                lon, lat, radius
+            params["lon"], params["lat"], params["radius"] = location
+        if company_ids is not None:
+            params["company_ids"] = company_ids
+
+        given = {
+            "name": name, "category_id": category_id,
+            "category_name": category_name, "phone_number": phone_number,
+            "building_id": building_id, "location": location,
+            "company_ids": company_ids is not None
+        }
+        shape = tuple(f for f in cls.advanced_filters if given[f])
+        q = cls._get_cached(
+            ("advanced", shape),
+            lambda: cls._build_advanced_search_query(shape)
+        )
+        return q, params
+
+    @classmethod
+    def get_text_search_query(
+            cls, text: str, limit: int
+    ) -> tuple[Select, dict]:
+        """Ranked full-text search over company and category names"""
+        def build():
+            ts_query = websearch_to_tsquery(
+                SEARCH_CONFIG, bindparam("text", type_=String)
+            )
+            return (
+                select(*cls.search_columns)
+                .where(CompanySearch.search_vector.bool_op("@@")(ts_query))
+                .order_by(
+                    func.ts_rank(CompanySearch.search_vector, ts_query).desc(),
+                    CompanySearch.company_id
+                )
+                .limit(bindparam("limit", type_=Integer))
             )
-            filters.append(area_filter)
 
-        if filters:
-            q = q.where(and_(*filters))
+        q = cls._get_cached(("text",), build)
+        return q, {"text": text, "limit": limit}
 
-        return q
+    @classmethod
+    def get_warm_up_statements(cls) -> list[tuple[Select, dict]]:
+        """Hot statements with placeholder params matching no rows, for
+        cache warm-up"""
+        # a noncharacter no name contains, NUL would not match either but
+        # Postgres rejects it in text; ids are never negative
+        text, no_id = "\uffff", -1
+        placeholders = {
+            "name": text, "category_id": no_id, "category_name": text,
+            "phone_number": text, "building_id": no_id,
+            "location": (0.0, 0.0, 1), "company_ids": [no_id]
+        }
+        statements = [
+            (cls.get_company_query(no_id), {}),
+            (cls.get_company_query(text), {}),
+            (cls.get_companies_by_category_query(no_id), {}),
+            (cls.get_companies_by_category_query(text), {}),
+            cls.get_companies_in_area_query(0.0, 0.0, 1),
+            cls.get_companies_by_ids_query([no_id]),
+            cls.get_companies_in_areas_query([(0.0, 0.0, 1)]),
+            cls.get_text_search_query(text, 1),
+            # a missing category keeps the company from being inserted
+            cls.get_create_company_query(text, no_id, [], [no_id]),
+        ]
+        for shape in cls.common_advanced_shapes:
+            kwargs = dict.fromkeys(cls.advanced_filters)
+            kwargs.update((f, placeholders[f]) for f in shape)
+            statements.append(
+                cls.get_companies_advanced_search_query(**kwargs)
+            )
+        return statements
 
 
 class CompaniesQueries:
@@ -137,54 +453,45 @@ class CompaniesQueries:
     async def create_company(
             name: str, phone_numbers: list, building_id: int, categories: list,
             db: AsyncSession
-    ):
-        cmp = Company(
-            name=name, building_id=building_id
+    ) -> Company:
+        """Creates the company in one round trip and returns it built from
+        the statement's result, detached from the session"""
+        query, params = CompaniesQuerybuilder.get_create_company_query(
+            name, building_id, phone_numbers, categories
         )
-        db.add(cmp)
-        await db.flush()
-
         try:
-            nums_db = []
-            for number in phone_numbers:
-                nums_db.append(
-                    PhoneNumber(phone_number=number, company_id=cmp.id)
-                )
-            db.add_all(nums_db)
-
-            if categories:
-                categories_res = await db.execute(
-                    select(Category).where(Category.id.in_(categories))
-                )
-                existing_categories = categories_res.scalars().all()
-                if len(existing_categories) != len(categories):
-                    found_cats = {c.id for c in existing_categories}
-                    missing = set(categories) - found_cats
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"Categories not found: {missing}"
-                    )
-                # Clear existing associations
-                await db.execute(
-                    company_category_association.delete().where(
-                        company_category_association.c.company_id == cmp.id
-                    )
+            result = await db.execute(query, params)
+            row = result.one()
+            if row.id is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Categories not found: "
+                           f"{set(row.missing_categories or ())}"
                 )
-                # Add new associations
-                await db.execute(
-                    company_category_association.insert(),
-                    [{"company_id": cmp.id, "category_id": c.id} for c in
-                     existing_categories]
-                )
-
             await db.commit()
-            await db.refresh(cmp)
-            return cmp
-
         except Exception as e:
             await db.rollback()
             raise e
 
+        # no ORM flush happened, so no write events fired
+        await response_cache.delete(
+            company_key(row.id), building_companies_key(building_id)
+        )
+        geo_cell_cache.invalidate_building(building_id)
+        suggest_index.apply("company", row.id, name)
+        return Company(
+            id=row.id,
+            name=name,
+            building_id=building_id,
+            phone_numbers=[
+                PhoneNumber(phone_number=number) for number in phone_numbers
+            ],
+            categories=[
+                Category(id=cat_id, name=cat_name) for cat_id, cat_name in
+                zip(row.category_ids or (), row.category_names or ())
+            ]
+        )
+
     @staticmethod
     async def get_companies(
             criteria: str | int, db: AsyncSession
@@ -207,14 +514,74 @@ class CompaniesQueries:
         return comps
 
     @staticmethod
+    async def get_companies_by_ids(
+            company_ids: list[int], db: AsyncSession
+    ) -> tuple[List[Company], list[int]]:
+        """Companies in the order of company_ids, fetched with one query,
+        and the ids that were not found"""
+        query, params = CompaniesQuerybuilder.get_companies_by_ids_query(
+            list(dict.fromkeys(company_ids))
+        )
+        result = await db.execute(query, params)
+        found = {cmp.id: cmp for cmp in result.scalars()}
+        return (
+            [found[cmp_id] for cmp_id in company_ids if cmp_id in found],
+            [cmp_id for cmp_id in company_ids if cmp_id not in found]
+        )
+
+    @staticmethod
+    async def get_company_version(
+            company_id: int, db: AsyncSession
+    ) -> tuple | None:
+        """Cheap version of the rows a company response is built from,
+        None if the company does not exist"""
+        q = CompaniesQuerybuilder.get_company_version_query(company_id)
+        result = await db.execute(q)
+        row = result.first()
+        return tuple(row) if row else None
+
+    @classmethod
     async def get_companies_in_area(
+            cls, lon: float, lat: float, radius: int, db: AsyncSession
+    ) -> List[Company]:
+        """Concurrent searches for the same point share one execution,
+        coordinates are normalised to about 10 cm"""
+        if snapshot_engine.ready:
+            snapshot = snapshot_engine.snapshot
+            return cls._found_or_404(
+                [
+                    snapshot.company_view(row) for row in
+                    snapshot.companies_in_area(lon, lat, radius).tolist()
+                ],
+                "No companies found in given area"
+            )
+        lon, lat = round(lon, 6), round(lat, 6)
+        return await query_flight.do(
+            ("companies_in_area", lon, lat, radius),
+            lambda: cls._get_companies_in_area(lon, lat, radius, db)
+        )
+
+    @staticmethod
+    async def _get_companies_in_area(
             lon: float, lat: float, radius: int, db: AsyncSession
     ) -> List[Company]:
-        query = CompaniesQuerybuilder.get_companies_in_area_query(
-            lon, lat, radius
+        company_ids = await geo_cell_cache.find_company_ids(
+            lon, lat, radius, db
         )
-        result = await db.execute(query)
-        comps = result.scalars().all()
+        if company_ids is None:
+            query, params = (
+                CompaniesQuerybuilder.get_companies_in_area_query(
+                    lon, lat, radius
+                )
+            )
+        else:
+            query, params = CompaniesQuerybuilder.get_companies_by_ids_query(
+                company_ids
+            )
+        comps = []
+        if company_ids is None or company_ids:
+            result = await db.execute(query, params)
+            comps = result.scalars().all()
 
         if not comps:
             raise HTTPException(
@@ -224,10 +591,54 @@ class CompaniesQueries:
         return comps
 
     @staticmethod
+    async def get_companies_in_areas(
+            points: list[tuple[float, float, int]], db: AsyncSession
+    ) -> tuple[list[list[int]], List[Row]]:
+        """Company ids found around each point, in point order, and the
+        search_columns rows of every company found, each once"""
+        groups = [[] for _ in points]
+        if snapshot_engine.ready:
+            snapshot = snapshot_engine.snapshot
+            found = {}
+            for group, (lon, lat, radius) in zip(groups, points):
+                rows = snapshot.companies_in_area(lon, lat, radius).tolist()
+                for row in rows:
+                    cmp = found.get(row)
+                    if cmp is None:
+                        cmp = found[row] = snapshot.search_row(row)
+                    group.append(cmp.id)
+            return groups, sorted(found.values(), key=lambda cmp: cmp.id)
+
+        query, params = CompaniesQuerybuilder.get_companies_in_areas_query(
+            points
+        )
+        result = await db.execute(query, params)
+        comps = result.all()
+        for cmp in comps:
+            for idx in cmp.point_indexes:
+                groups[idx - 1].append(cmp.id)
+        return groups, comps
+
+    @classmethod
     async def get_companies_by_category(
+            cls, criteria: int | str, db: AsyncSession
+    ) -> dict[Category, List[Company]]:
+        """Get companies by search criteria (category_id or category_name)
+
+        Concurrent calls with the same criteria share one execution"""
+        if snapshot_engine.ready and isinstance(criteria, (int, str)):
+            return cls._snapshot_companies_by_category(
+                snapshot_engine.snapshot, criteria
+            )
+        return await query_flight.do(
+            ("companies_by_category", type(criteria).__name__, criteria),
+            lambda: cls._get_companies_by_category(criteria, db)
+        )
+
+    @staticmethod
+    async def _get_companies_by_category(
             criteria: int | str, db: AsyncSession
     ) -> dict[Category, List[Company]]:
-        """Get companies by search criteria (category_id or category_name)"""
 
         try:
             query = (
@@ -262,17 +673,89 @@ class CompaniesQueries:
         return {**main_comps, **child_comps, **grandchild_comps}
 
     @staticmethod
+    def _found_or_404(found: list, detail: str) -> list:
+        if not found:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=detail
+            )
+        return found
+
+    @staticmethod
+    def _snapshot_companies_by_category(
+            snapshot: Snapshot | LayeredSnapshot, criteria: int | str
+    ) -> dict:
+        main_row = snapshot.category_row(criteria)
+        if main_row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Category not found"
+            )
+        child_rows = snapshot.child_categories(main_row).tolist()
+        grandchild_rows = [
+            row for child in child_rows
+            for row in snapshot.child_categories(child).tolist()
+        ]
+        return {
+            snapshot.category_view(row): [
+                snapshot.company_view(cmp)
+                for cmp in snapshot.companies_in_category(row).tolist()
+            ] for row in (main_row, *child_rows, *grandchild_rows)
+        }
+
+    @classmethod
     async def run_advanced_search(
-            name, category_id, category_name, phone_number, building_id,
-            location, db: AsyncSession
-    ) -> List[Company]:
-        query = CompaniesQuerybuilder.get_companies_advanced_search_query(
-            name, category_id, category_name, phone_number, building_id,
-            location
+            cls, name, category_id, category_name, phone_number,
+            building_id, location, db: AsyncSession
+    ) -> List[Row]:
+        """Rows of search_columns matching all given filters"""
+        if snapshot_engine.ready:
+            snapshot = snapshot_engine.snapshot
+            rows = snapshot.search(
+                name, category_id, category_name, phone_number,
+                building_id, location
+            )
+            return cls._found_or_404(
+                [snapshot.search_row(row) for row in rows.tolist()],
+                "No companies found"
+            )
+        company_ids = None
+        if location:
+            company_ids = await geo_cell_cache.find_company_ids(
+                *location, db
+            )
+            if company_ids is not None:
+                location = None
+        query, params = (
+            CompaniesQuerybuilder.get_companies_advanced_search_query(
+                name, category_id, category_name, phone_number, building_id,
+                location, company_ids
+            )
         )
 
-        result = await db.execute(query)
-        comps = result.scalars().unique().all()
+        comps = []
+        if company_ids is None or company_ids:
+            result = await db.execute(query, params)
+            comps = result.all()
+
+        if not comps:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No companies found"
+            )
+
+        return comps
+
+    @staticmethod
+    async def search_text(
+            text: str, limit: int, db: AsyncSession
+    ) -> List[Row]:
+        """Rows of search_columns best matching a web search style query,
+        most relevant first"""
+        query, params = CompaniesQuerybuilder.get_text_search_query(
+            text, limit
+        )
+        result = await db.execute(query, params)
+        comps = result.all()
 
         if not comps:
             raise HTTPException(
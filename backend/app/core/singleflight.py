@@ -0,0 +1,72 @@
+"""Coalescing of identical concurrent reads"""
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from config import settings
+from core.metrics import registry, Counter
+
+coalesced_calls = registry.register(Counter(
+    "singleflight_coalesced_total",
+    "Calls answered by an identical call already in flight",
+    labels=("flight",)
+))
+
+
+class SingleFlight:
+    """Runs one call per key at a time, concurrent callers with the same
+    key await the running call instead of starting their own.
+
+    A finished result stays shared for grace seconds to catch callers
+    arriving right after it. Errors are shared only with callers that
+    were already waiting. Keys are tuples starting with the flight name.
+    """
+
+    def __init__(self, grace: float):
+        self.grace = grace
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(
+            self, key: tuple, call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        while (shared := self._calls.get(key)) is not None:
+            coalesced_calls.inc(key[0])
+            try:
+                return await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise
+                # the leading call was cancelled, take over
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            self._forget(key, future)
+            future.cancel()
+            raise
+        except Exception as e:
+            self._forget(key, future)
+            future.set_exception(e)
+            # mark retrieved, there may be no one waiting
+            future.exception()
+            raise
+
+        future.set_result(result)
+        if self.grace > 0:
+            asyncio.get_running_loop().call_later(
+                self.grace, self._forget, key, future
+            )
+        else:
+            self._forget(key, future)
+        return result
+
+    def _forget(self, key: tuple, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+    def __len__(self):
+        return len(self._calls)
+
+
+query_flight = SingleFlight(settings.SINGLEFLIGHT_GRACE_SECONDS)
@@ -0,0 +1,731 @@
+"""In-memory catalogue snapshot answering read queries with NumPy.
+
+The catalogue is compiled into an immutable Snapshot of columnar
+arrays: sorted id arrays, CSR adjacency between companies, categories
+and buildings, and a grid of buildings for radius searches. The
+SnapshotEngine keeps the source rows in dicts and applies changes from
+catalogue notifications to them. Changed rows are compiled into a small
+overlay Snapshot served on top of the base one, the base is recompiled
+from the dicts on a timer or once the overlay grows too large.
+
+Distances are great-circle distances on the mean earth radius, they
+can differ from PostGIS spheroid distances by up to 0.5%."""
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import namedtuple
+from itertools import chain
+
+import numpy as np
+from geoalchemy2.shape import from_shape
+from sqlalchemy import select, func
+from shapely.geometry import Point
+
+from config import settings
+from core.notifications import notification_hub
+from database import AsyncSession, AsyncSessionLocal
+from models import Building, Category, CompanySearch, CATALOGUE_CHANNEL
+
+logger = logging.getLogger("snapshot")
+
+EARTH_RADIUS = 6371008.8  # mean radius, meters
+# grid cell key is ix * GRID_ROW + iy
+GRID_ROW = 1 << 32
+
+PhoneView = namedtuple("PhoneView", "phone_number")
+CategoryView = namedtuple("CategoryView", "id name")
+CompanyView = namedtuple(
+    "CompanyView", "id name building_id phone_numbers categories"
+)
+SearchRow = namedtuple(
+    "SearchRow",
+    "id name building_id phone_numbers category_ids category_names"
+)
+
+
+class BuildingView(namedtuple("BuildingView", "id address lon lat companies")):
+    __slots__ = ()
+
+    @property
+    def coordinates(self):
+        return from_shape(Point(self.lon, self.lat), srid=4326)
+
+
+def csr_rows(indptr: np.ndarray, indices: np.ndarray, rows) -> np.ndarray:
+    """Concatenated indices of the given CSR rows"""
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if not total:
+        return indices[:0]
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return indices[offsets + np.arange(total)]
+
+
+def csr_from_pairs(
+        rows: np.ndarray, cols: np.ndarray, n_rows: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """CSR arrays listing cols per row, pairs with a negative side are
+    dropped"""
+    valid = (rows >= 0) & (cols >= 0)
+    rows, cols = rows[valid], cols[valid]
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order]
+
+
+def haversine(lon, lat, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    phi1, phi2 = math.radians(lat), np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lons - lon)
+    a = (np.sin(dphi / 2) ** 2
+         + math.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _lookup(sorted_ids: np.ndarray, ids) -> np.ndarray:
+    """Positions of ids in sorted_ids, -1 where missing"""
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(sorted_ids):
+        return np.full(len(ids), -1, dtype=np.int64)
+    pos = np.searchsorted(sorted_ids, ids)
+    pos = np.minimum(pos, len(sorted_ids) - 1)
+    return np.where(sorted_ids[pos] == ids, pos, -1)
+
+
+class TextColumn:
+    """Strings of a column in one buffer, each ended by a NUL, with the
+    start offset of every row. Rows take their own length instead of
+    the longest one's, as in a fixed width array."""
+
+    def __init__(self, values: list[str]):
+        self.buffer = "".join(value + "\0" for value in values)
+        self.offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(
+            np.fromiter((len(value) + 1 for value in values),
+                        dtype=np.int64, count=len(values)),
+            out=self.offsets[1:]
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self.buffer[self.offsets[row]:self.offsets[row + 1] - 1]
+
+    def rows_containing(self, needle: str) -> np.ndarray:
+        """Rows with needle as a substring, ascending"""
+        if not needle:
+            return np.arange(len(self), dtype=np.int64)
+        if "\0" in needle:
+            return np.empty(0, dtype=np.int64)
+        rows = []
+        find, offsets = self.buffer.find, self.offsets
+        pos = find(needle)
+        while pos >= 0:
+            row = int(np.searchsorted(offsets, pos, "right")) - 1
+            rows.append(row)
+            pos = find(needle, int(offsets[row + 1]))
+        return np.array(rows, dtype=np.int64)
+
+
+class Snapshot:
+    """Immutable columnar catalogue.
+
+    companies: id -> (name, building_id, phones, phone_digits,
+    category_ids), buildings: id -> (address, lon, lat),
+    categories: id -> (name, parent_id)."""
+
+    def __init__(
+            self, companies: dict, buildings: dict, categories: dict,
+            grid_degrees: float
+    ):
+        self.grid_degrees = grid_degrees
+
+        # categories
+        self.category_ids = np.array(sorted(categories), dtype=np.int64)
+        cat_rows = [categories[i] for i in self.category_ids.tolist()]
+        self.category_names = [row[0] for row in cat_rows]
+        self.category_parent = np.array(
+            [-1 if row[1] is None else row[1] for row in cat_rows],
+            dtype=np.int64
+        )
+        self._category_by_name: dict[str, list[int]] = {}
+        for idx, name in enumerate(self.category_names):
+            self._category_by_name.setdefault(name, []).append(idx)
+
+        # buildings and their grid cells
+        self.building_ids = np.array(sorted(buildings), dtype=np.int64)
+        bld_rows = [buildings[i] for i in self.building_ids.tolist()]
+        self.building_address = [row[0] for row in bld_rows]
+        self.building_lon = np.array(
+            [row[1] for row in bld_rows], dtype=np.float64
+        )
+        self.building_lat = np.array(
+            [row[2] for row in bld_rows], dtype=np.float64
+        )
+        cell_keys = self._cell_keys(self.building_lon, self.building_lat)
+        self.grid_order = np.argsort(cell_keys, kind="stable")
+        self.grid_keys = cell_keys[self.grid_order]
+
+        # companies
+        self.company_ids = np.array(sorted(companies), dtype=np.int64)
+        cmp_rows = [companies[i] for i in self.company_ids.tolist()]
+        n_companies = len(cmp_rows)
+        self.company_names = [row[0] or "" for row in cmp_rows]
+        self.names_folded = TextColumn(
+            [name.casefold() for name in self.company_names]
+        )
+        self.company_building_ids = np.array(
+            [-1 if row[1] is None else row[1] for row in cmp_rows],
+            dtype=np.int64
+        )
+        self.company_phones = [tuple(row[2]) for row in cmp_rows]
+        self.phone_digits = TextColumn([row[3] or "" for row in cmp_rows])
+
+        # company <-> category and building -> company adjacency
+        lengths = np.array([len(row[4]) for row in cmp_rows], dtype=np.int64)
+        pair_companies = np.repeat(np.arange(n_companies), lengths)
+        pair_categories = _lookup(
+            self.category_ids,
+            np.fromiter(
+                chain.from_iterable(row[4] for row in cmp_rows),
+                dtype=np.int64, count=int(lengths.sum())
+            )
+        )
+        self.company_cat_indptr, self.company_cat_indices = csr_from_pairs(
+            pair_companies, pair_categories, n_companies
+        )
+        self.cat_company_indptr, self.cat_company_indices = csr_from_pairs(
+            pair_categories, pair_companies, len(self.category_ids)
+        )
+        company_buildings = _lookup(
+            self.building_ids, self.company_building_ids
+        )
+        self.bld_company_indptr, self.bld_company_indices = csr_from_pairs(
+            company_buildings, np.arange(n_companies),
+            len(self.building_ids)
+        )
+
+    def _cell_keys(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        ix = np.floor((lons + 180) / self.grid_degrees).astype(np.int64)
+        iy = np.floor((lats + 90) / self.grid_degrees).astype(np.int64)
+        return ix * GRID_ROW + iy
+
+    def __len__(self):
+        return len(self.company_ids)
+
+    # lookups returning row indexes
+    def company_rows(self, company_ids) -> np.ndarray:
+        pos = _lookup(self.company_ids, company_ids)
+        return pos[pos >= 0]
+
+    def building_rows(self, building_ids) -> np.ndarray:
+        pos = _lookup(self.building_ids, building_ids)
+        return pos[pos >= 0]
+
+    def category_row(self, criteria: int | str) -> int | None:
+        match criteria:
+            case int():
+                pos = _lookup(self.category_ids, [criteria])[0]
+                return None if pos < 0 else int(pos)
+            case str():
+                rows = self._category_by_name.get(criteria)
+                return rows[0] if rows else None
+        return None
+
+    def building_row(self, building_id: int) -> int | None:
+        pos = _lookup(self.building_ids, [building_id])[0]
+        return None if pos < 0 else int(pos)
+
+    def buildings_in_area(
+            self, lon: float, lat: float, radius: float
+    ) -> np.ndarray:
+        if not len(self.building_ids) or abs(lat) > 90:
+            return np.empty(0, dtype=np.int64)
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        dlon = dlat / max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))),
+                          1e-9)
+        ix0, ix1 = (
+            math.floor((lon - dlon + 180) / self.grid_degrees),
+            math.floor((lon + dlon + 180) / self.grid_degrees)
+        )
+        iy0, iy1 = (
+            math.floor((lat - dlat + 90) / self.grid_degrees),
+            math.floor((lat + dlat + 90) / self.grid_degrees)
+        )
+        if ix1 - ix0 > 4096:
+            candidates = np.arange(len(self.building_ids))
+        else:
+            columns = np.arange(ix0, ix1 + 1, dtype=np.int64) * GRID_ROW
+            starts = np.searchsorted(self.grid_keys, columns + iy0, "left")
+            ends = np.searchsorted(self.grid_keys, columns + iy1, "right")
+            lengths = ends - starts
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            candidates = self.grid_order[
+                offsets + np.arange(int(lengths.sum()))
+            ]
+        distances = haversine(
+            lon, lat,
+            self.building_lon[candidates], self.building_lat[candidates]
+        )
+        return candidates[distances <= radius]
+
+    def companies_in_area(
+            self, lon: float, lat: float, radius: float
+    ) -> np.ndarray:
+        return np.sort(self.building_companies(
+            self.buildings_in_area(lon, lat, radius)
+        ))
+
+    def building_companies(self, building_rows) -> np.ndarray:
+        return csr_rows(
+            self.bld_company_indptr, self.bld_company_indices, building_rows
+        )
+
+    def companies_in_category(self, category_row: int) -> np.ndarray:
+        return self.cat_company_indices[
+            self.cat_company_indptr[category_row]:
+            self.cat_company_indptr[category_row + 1]
+        ]
+
+    def child_categories(self, category_row: int) -> np.ndarray:
+        return np.flatnonzero(
+            self.category_parent == self.category_ids[category_row]
+        )
+
+    def search(
+            self, name, category_id, category_name, phone_number,
+            building_id, location
+    ) -> np.ndarray:
+        """Rows matching every given filter, same semantics as the
+        advanced search statement"""
+        mask = np.ones(len(self.company_ids), dtype=bool)
+        if name:
+            mask &= self._mask(self.names_folded.rows_containing(
+                name.casefold()
+            ))
+        if category_id or category_name:
+            rows = (
+                [self.category_row(category_id)] if category_id
+                else self._category_by_name.get(category_name, [])
+            )
+            in_category = np.zeros_like(mask)
+            for row in rows:
+                if row is not None:
+                    in_category[self.companies_in_category(row)] = True
+            mask &= in_category
+        if phone_number:
+            mask &= self._mask(self.phone_digits.rows_containing(phone_number))
+        if building_id:
+            mask &= self.company_building_ids == building_id
+        if location:
+            in_area = np.zeros_like(mask)
+            in_area[self.companies_in_area(*location)] = True
+            mask &= in_area
+        return np.flatnonzero(mask)
+
+    def _mask(self, rows: np.ndarray) -> np.ndarray:
+        mask = np.zeros(len(self.company_ids), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    # response-ready views of rows
+    def _company_categories(self, row: int) -> np.ndarray:
+        return self.company_cat_indices[
+            self.company_cat_indptr[row]:self.company_cat_indptr[row + 1]
+        ]
+
+    def _building_id(self, row: int) -> int | None:
+        building_id = int(self.company_building_ids[row])
+        return None if building_id < 0 else building_id
+
+    def company_view(self, row: int) -> CompanyView:
+        return CompanyView(
+            id=int(self.company_ids[row]),
+            name=self.company_names[row],
+            building_id=self._building_id(row),
+            phone_numbers=tuple(
+                PhoneView(phone) for phone in self.company_phones[row]
+            ),
+            categories=tuple(
+                self.category_view(cat)
+                for cat in self._company_categories(row).tolist()
+            ),
+        )
+
+    def search_row(self, row: int) -> SearchRow:
+        categories = self._company_categories(row).tolist()
+        return SearchRow(
+            id=int(self.company_ids[row]),
+            name=self.company_names[row],
+            building_id=self._building_id(row),
+            phone_numbers=self.company_phones[row],
+            category_ids=[int(self.category_ids[cat]) for cat in categories],
+            category_names=[self.category_names[cat] for cat in categories],
+        )
+
+    def category_view(self, row: int) -> CategoryView:
+        return CategoryView(
+            int(self.category_ids[row]), self.category_names[row]
+        )
+
+    def building_view(self, row: int) -> BuildingView:
+        companies = self.building_companies([row])
+        return BuildingView(
+            id=int(self.building_ids[row]),
+            address=self.building_address[row],
+            lon=float(self.building_lon[row]),
+            lat=float(self.building_lat[row]),
+            companies=[self.company_view(cmp) for cmp in companies.tolist()],
+        )
+
+
+class LayeredSnapshot:
+    """A base Snapshot with an overlay Snapshot of the rows changed
+    since it was compiled.
+
+    Overlay rows are numbered after the base rows. Base companies and
+    buildings present in the overlay, or deleted, are hidden. A building
+    is only in one layer: the overlay takes the companies located at its
+    buildings along. Both layers are compiled from the same categories,
+    so category rows are the same in both."""
+
+    def __init__(
+            self, base: Snapshot, overlay: Snapshot,
+            hidden_companies: np.ndarray, hidden_buildings: np.ndarray
+    ):
+        self.base = base
+        self.overlay = overlay
+        self.hidden_companies = hidden_companies
+        self.hidden_buildings = hidden_buildings
+        self._hidden_ids = set(base.company_ids[hidden_companies].tolist())
+        self._base_companies = len(base.company_ids)
+        self._base_buildings = len(base.building_ids)
+
+    def __len__(self):
+        return len(self.base) - len(self.hidden_companies) + len(self.overlay)
+
+    def _merge(self, base_rows: np.ndarray, overlay_rows: np.ndarray):
+        """Visible base rows and overlay rows, ordered by company id"""
+        base_rows = base_rows[~np.isin(base_rows, self.hidden_companies)]
+        if not len(overlay_rows):
+            return base_rows
+        ids = np.concatenate([
+            self.base.company_ids[base_rows],
+            self.overlay.company_ids[overlay_rows]
+        ])
+        rows = np.concatenate([
+            base_rows, overlay_rows + self._base_companies
+        ])
+        return rows[np.argsort(ids, kind="stable")]
+
+    def _company_layer(self, row: int) -> tuple[Snapshot, int]:
+        if row < self._base_companies:
+            return self.base, row
+        return self.overlay, row - self._base_companies
+
+    # lookups returning row indexes
+    def company_rows(self, company_ids) -> np.ndarray:
+        return self._merge(
+            self.base.company_rows(company_ids),
+            self.overlay.company_rows(company_ids)
+        )
+
+    def category_row(self, criteria: int | str) -> int | None:
+        return self.base.category_row(criteria)
+
+    def building_row(self, building_id: int) -> int | None:
+        row = self.overlay.building_row(building_id)
+        if row is not None:
+            return self._base_buildings + row
+        row = self.base.building_row(building_id)
+        if row is None or row in self.hidden_buildings:
+            return None
+        return row
+
+    def companies_in_area(
+            self, lon: float, lat: float, radius: float
+    ) -> np.ndarray:
+        return self._merge(
+            self.base.companies_in_area(lon, lat, radius),
+            self.overlay.companies_in_area(lon, lat, radius)
+        )
+
+    def companies_in_category(self, category_row: int) -> np.ndarray:
+        return self._merge(
+            self.base.companies_in_category(category_row),
+            self.overlay.companies_in_category(category_row)
+        )
+
+    def child_categories(self, category_row: int) -> np.ndarray:
+        return self.base.child_categories(category_row)
+
+    def search(self, *filters) -> np.ndarray:
+        return self._merge(
+            self.base.search(*filters), self.overlay.search(*filters)
+        )
+
+    # response-ready views of rows
+    def company_view(self, row: int) -> CompanyView:
+        layer, row = self._company_layer(row)
+        return layer.company_view(row)
+
+    def search_row(self, row: int) -> SearchRow:
+        layer, row = self._company_layer(row)
+        return layer.search_row(row)
+
+    def category_view(self, row: int) -> CategoryView:
+        return self.base.category_view(row)
+
+    def building_view(self, row: int) -> BuildingView:
+        if row >= self._base_buildings:
+            return self.overlay.building_view(row - self._base_buildings)
+        # companies that moved away or were deleted since the base
+        view = self.base.building_view(row)
+        return view._replace(companies=[
+            cmp for cmp in view.companies if cmp.id not in self._hidden_ids
+        ])
+
+
+class SnapshotEngine:
+    """Owns the current Snapshot and keeps it in sync with the database.
+
+    Changes arrive as catalogue notifications, only the changed rows are
+    read back and compiled into an overlay over the base snapshot, off
+    the event loop. Reads see a change once the refresh after it has
+    been swapped in. The base is recompiled after compact_seconds, once
+    compact_rows rows changed, and on category changes, which are
+    rare and reach every company view.
+
+    The dicts are only changed by refresh, which waits for compiles to
+    finish, so compiles read them without a copy."""
+
+    def __init__(self, enabled: bool, refresh_delay: float,
+                 grid_degrees: float, compact_seconds: float = 30.0,
+                 compact_rows: int = 20000):
+        self.enabled = enabled
+        self.refresh_delay = refresh_delay
+        self.grid_degrees = grid_degrees
+        self.compact_seconds = compact_seconds
+        self.compact_rows = compact_rows
+        self.snapshot: Snapshot | LayeredSnapshot | None = None
+        self.base: Snapshot | None = None
+        self._compiled_at = 0.0
+        self._companies: dict[int, tuple] = {}
+        self._buildings: dict[int, tuple] = {}
+        self._categories: dict[int, tuple] = {}
+        self._dirty = {"companies": set(), "buildings": set(),
+                       "categories": set()}
+        # ids changed since the base was compiled
+        self._changed = {"companies": set(), "buildings": set()}
+        self._reload = True
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self.snapshot is not None
+
+    async def start(self):
+        """Subscribe to changes, load the snapshot and keep it fresh"""
+        await notification_hub.subscribe(
+            CATALOGUE_CHANNEL, self.on_notification
+        )
+        await self.refresh()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        """Stops refreshing, reads fall back to SQL until started again"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.snapshot = self.base = None
+        self._reload = True
+
+    def on_notification(self, payload: str | None):
+        if payload is None:
+            self._reload = True
+        else:
+            change = json.loads(payload)
+            match change["table"], change["op"]:
+                case _, "RELOAD":
+                    self._reload = True
+                case "companies" | "company_search", _:
+                    self._dirty["companies"].add(change["id"])
+                case ("buildings" | "categories") as table, _:
+                    self._dirty[table].add(change["id"])
+                case _:
+                    return
+        self._wakeup.set()
+
+    def _compact_wait(self) -> float | None:
+        """Seconds until the overlay is due to be merged into the base"""
+        if self.snapshot is self.base:
+            return None
+        return max(
+            self._compiled_at + self.compact_seconds - time.monotonic(), 0
+        )
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), self._compact_wait()
+                )
+            except TimeoutError:
+                pass
+            # let a burst of changes settle into one refresh
+            await asyncio.sleep(self.refresh_delay)
+            self._wakeup.clear()
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Snapshot refresh failed")
+                self._reload = True
+                await asyncio.sleep(self.refresh_delay)
+                self._wakeup.set()
+
+    async def refresh(self):
+        dirty = self._dirty
+        self._dirty = {table: set() for table in dirty}
+        reload, self._reload = self._reload, False
+        try:
+            async with AsyncSessionLocal() as db:
+                if reload:
+                    await self._load_all(db)
+                else:
+                    await self._load_changed(db, dirty)
+        except BaseException:
+            # retry the same changes next time
+            self._reload = self._reload or reload
+            for table, ids in dirty.items():
+                self._dirty[table] |= ids
+            raise
+
+        if reload or dirty["categories"] or self.base is None:
+            return await self._compile()
+        for table, ids in self._changed.items():
+            ids |= dirty[table]
+        changed = sum(len(ids) for ids in self._changed.values())
+        if (changed > self.compact_rows
+                or time.monotonic() - self._compiled_at
+                >= self.compact_seconds):
+            await self._compile()
+        elif changed:
+            self.snapshot = await asyncio.to_thread(self._layer)
+
+    async def _compile(self):
+        self.base = await asyncio.to_thread(
+            Snapshot, self._companies, self._buildings, self._categories,
+            self.grid_degrees
+        )
+        self.snapshot = self.base
+        self._changed = {table: set() for table in self._changed}
+        self._compiled_at = time.monotonic()
+
+    def _layer(self) -> LayeredSnapshot:
+        """The base with an overlay of the rows changed since"""
+        base = self.base
+        company_ids = set(self._changed["companies"])
+        building_ids = set(self._changed["buildings"])
+        for company_id in company_ids:
+            row = self._companies.get(company_id)
+            if row is not None and row[1] is not None:
+                building_ids.add(row[1])
+        hidden_buildings = np.sort(base.building_rows(list(building_ids)))
+        company_ids.update(base.company_ids[
+            base.building_companies(hidden_buildings)
+        ].tolist())
+        overlay = Snapshot(
+            {
+                i: self._companies[i] for i in company_ids
+                if i in self._companies
+            },
+            {
+                i: self._buildings[i] for i in building_ids
+                if i in self._buildings
+            },
+            self._categories, self.grid_degrees
+        )
+        return LayeredSnapshot(
+            base, overlay, np.sort(base.company_rows(list(company_ids))),
+            hidden_buildings
+        )
+
+    @staticmethod
+    def _company_query():
+        return select(
+            CompanySearch.company_id, CompanySearch.name,
+            CompanySearch.building_id, CompanySearch.phone_numbers,
+            CompanySearch.phone_digits, CompanySearch.category_ids
+        )
+
+    @staticmethod
+    def _company_row(row) -> tuple:
+        return (
+            row.name, row.building_id,
+            tuple(str(phone) for phone in row.phone_numbers or ()),
+            row.phone_digits, tuple(row.category_ids or ())
+        )
+
+    @staticmethod
+    def _building_query():
+        return select(
+            Building.id, Building.address,
+            func.ST_X(Building.coordinates), func.ST_Y(Building.coordinates)
+        )
+
+    async def _load_all(self, db: AsyncSession):
+        companies = await db.execute(self._company_query())
+        buildings = await db.execute(self._building_query())
+        categories = await db.execute(
+            select(Category.id, Category.name, Category.parent_id)
+        )
+        self._companies = {
+            row.company_id: self._company_row(row) for row in companies
+        }
+        self._buildings = {row[0]: tuple(row[1:]) for row in buildings}
+        self._categories = {row[0]: tuple(row[1:]) for row in categories}
+
+    async def _load_changed(self, db: AsyncSession, dirty: dict):
+        if ids := dirty["companies"]:
+            result = await db.execute(
+                self._company_query()
+                .where(CompanySearch.company_id.in_(ids))
+            )
+            for company_id in ids:
+                self._companies.pop(company_id, None)
+            for row in result:
+                self._companies[row.company_id] = self._company_row(row)
+        if ids := dirty["buildings"]:
+            result = await db.execute(
+                self._building_query().where(Building.id.in_(ids))
+            )
+            for building_id in ids:
+                self._buildings.pop(building_id, None)
+            for row in result:
+                self._buildings[row[0]] = tuple(row[1:])
+        if ids := dirty["categories"]:
+            result = await db.execute(
+                select(Category.id, Category.name, Category.parent_id)
+                .where(Category.id.in_(ids))
+            )
+            for category_id in ids:
+                self._categories.pop(category_id, None)
+            for row in result:
+                self._categories[row[0]] = tuple(row[1:])
+
+
+snapshot_engine = SnapshotEngine(
+    settings.READ_ENGINE == "snapshot",
+    settings.SNAPSHOT_REFRESH_DELAY,
+    settings.SNAPSHOT_GRID_DEGREES,
+    settings.SNAPSHOT_COMPACT_SECONDS,
+    settings.SNAPSHOT_COMPACT_ROWS
+)
@@ -0,0 +1,94 @@
+import asyncio
+from collections import Counter
+
+from sqlalchemy import event, text
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS, \
+    CACHING_DISABLED, NO_CACHE_KEY, NO_DIALECT_SUPPORT
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from core.repositories.companies import CompaniesQuerybuilder
+from database import engine, replicas
+
+# warm-up executions are cancelled after this long, a full scan for a
+# placeholder value is not worth waiting for at start-up
+WARM_UP_TIMEOUT_MS = 100
+
+CACHE_STATUS_NAMES = {
+    CACHE_HIT: "hit",
+    CACHE_MISS: "miss",
+    CACHING_DISABLED: "disabled",
+    NO_CACHE_KEY: "no_key",
+    NO_DIALECT_SUPPORT: "unsupported",
+}
+
+
+class StatementCacheStats:
+    """Counts compiled cache hits and misses of executed statements"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self._engines: list[AsyncEngine] = []
+
+    def attach(self, engine: AsyncEngine):
+        event.listen(
+            engine.sync_engine, "after_cursor_execute", self._on_execute
+        )
+        self._engines.append(engine)
+
+    def _on_execute(
+            self, conn, cursor, statement, parameters, context, executemany
+    ):
+        self.counts[CACHE_STATUS_NAMES.get(context.cache_hit, "other")] += 1
+
+    def snapshot(self) -> dict:
+        hits, misses = self.counts["hit"], self.counts["miss"]
+        return {
+            "hits": hits,
+            "misses": misses,
+            "uncached": sum(self.counts.values()) - hits - misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "compiled_cache_size": sum(
+                len(db_engine.sync_engine._compiled_cache or ())
+                for db_engine in self._engines
+            ),
+        }
+
+
+statement_cache_stats = StatementCacheStats()
+for db_engine in (engine, *replicas.engines):
+    statement_cache_stats.attach(db_engine)
+
+
+async def warm_up_statement_cache(
+        engine: AsyncEngine, connections: int = 1
+) -> int:
+    """Execute hot statements so they are in the compiled cache and
+    prepared on connections pool connections, asyncpg prepares
+    statements per connection.
+
+    Statements run in a session as the repositories run them, with
+    placeholder values, inside a transaction that is rolled back. They
+    are compiled and prepared before they execute, so an execution that
+    fails or hits WARM_UP_TIMEOUT_MS still leaves its statement cached."""
+    statements = CompaniesQuerybuilder.get_warm_up_statements()
+    # held at once, so each runs on its own connection
+    await asyncio.gather(*(
+        _warm_up_connection(engine, statements)
+        for _ in range(max(connections, 1))
+    ))
+    return len(statements)
+
+
+async def _warm_up_connection(engine: AsyncEngine, statements: list):
+    async with engine.connect() as conn:
+        await conn.execute(
+            text(f"SET LOCAL statement_timeout = {WARM_UP_TIMEOUT_MS}")
+        )
+        async with AsyncSession(conn) as db:
+            for statement, params in statements:
+                try:
+                    async with db.begin_nested():
+                        await db.execute(statement, params)
+                except DBAPIError:
+                    pass
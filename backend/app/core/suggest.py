@@ -0,0 +1,317 @@
+"""In-process name completion for companies and categories"""
+import asyncio
+import heapq
+import json
+import logging
+import re
+from bisect import bisect_left, insort
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from database import AsyncSession, AsyncSessionLocal
+from models import Company, Category
+
+WORD_START = re.compile(r"(?<=\W)\w")
+TABLE_KINDS = {"companies": "company", "categories": "category"}
+KIND_MODELS = {"company": Company, "category": Category}
+
+logger = logging.getLogger("suggest")
+
+
+def fold(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+class PrefixIndex:
+    """Names kept in sorted arrays of (folded key, id) per kind, searched
+    with bisect.
+
+    Every name is indexed as a whole and from the start of each of its
+    later words, so "coffee" completes "Best Coffee". Whole name
+    matches rank first, ties are ordered alphabetically. A search for
+    one kind only reads that kind's arrays."""
+
+    def __init__(self):
+        # kind -> sorted (key, id)
+        self._names: dict[str, list[tuple[str, int]]] = {}
+        self._words: dict[str, list[tuple[str, int]]] = {}
+        self._entries: dict[tuple[str, int], str] = {}
+
+    @staticmethod
+    def _word_keys(key: str) -> list[str]:
+        return [key[match.start():] for match in WORD_START.finditer(key)]
+
+    def build(self, entries):
+        """Replace the index with (kind, id, name) entries"""
+        names, words, index = {}, {}, {}
+        for kind, entry_id, name in entries:
+            if not name:
+                continue
+            key = fold(name)
+            index[kind, entry_id] = name
+            names.setdefault(kind, []).append((key, entry_id))
+            words.setdefault(kind, []).extend(
+                (word, entry_id) for word in self._word_keys(key)
+            )
+        for keys in (*names.values(), *words.values()):
+            keys.sort()
+        self._names, self._words, self._entries = names, words, index
+
+    def add(self, kind: str, entry_id: int, name: str | None):
+        self.remove(kind, entry_id)
+        if not name:
+            return
+        key = fold(name)
+        self._entries[kind, entry_id] = name
+        insort(self._names.setdefault(kind, []), (key, entry_id))
+        words = self._words.setdefault(kind, [])
+        for word in self._word_keys(key):
+            insort(words, (word, entry_id))
+
+    def remove(self, kind: str, entry_id: int):
+        name = self._entries.pop((kind, entry_id), None)
+        if name is None:
+            return
+        key = fold(name)
+        self._discard(self._names[kind], (key, entry_id))
+        for word in self._word_keys(key):
+            self._discard(self._words[kind], (word, entry_id))
+
+    @staticmethod
+    def _discard(keys: list, item: tuple):
+        idx = bisect_left(keys, item)
+        if idx < len(keys) and keys[idx] == item:
+            del keys[idx]
+
+    @staticmethod
+    def _from(keys: list, prefix: str, kind: str):
+        """(key, kind, id) of keys from the first one >= prefix"""
+        for idx in range(bisect_left(keys, (prefix,)), len(keys)):
+            key, entry_id = keys[idx]
+            yield key, kind, entry_id
+
+    def search(
+            self, prefix: str, limit: int, kind: str | None = None
+    ) -> list[dict]:
+        prefix = fold(prefix)
+        if not prefix:
+            return []
+        found = []
+        seen = set()
+        for arrays in (self._names, self._words):
+            kinds = arrays if kind is None else (kind,)
+            merged = heapq.merge(*(
+                self._from(arrays.get(k, ()), prefix, k) for k in kinds
+            ))
+            for key, entry_kind, entry_id in merged:
+                if len(found) >= limit or not key.startswith(prefix):
+                    break
+                if (entry_kind, entry_id) in seen:
+                    continue
+                seen.add((entry_kind, entry_id))
+                found.append({
+                    "kind": entry_kind,
+                    "id": entry_id,
+                    "name": self._entries[entry_kind, entry_id],
+                })
+        return found
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SuggestIndex:
+    """PrefixIndex over company and category names, loaded on first use
+    and kept current from committed ORM writes and catalogue
+    notifications.
+
+    Once loaded, reloads run in the background and the current index
+    keeps answering until the new one replaces it."""
+
+    def __init__(self):
+        self.index = PrefixIndex()
+        self.loaded = False
+        self.stale = False
+        self._lock = asyncio.Lock()
+        self._reload_task: asyncio.Task | None = None
+        # (kind, id) notified as changed, names are read back
+        self._unread: set[tuple[str, int]] = set()
+        self._read_task: asyncio.Task | None = None
+        # changes seen while a load is running, replayed after it
+        self._pending: list[tuple] | None = None
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if not self.loaded:
+            async with self._lock:
+                if not self.loaded:
+                    await self.load(db)
+        elif self.stale and self._reload_task is None:
+            # the request's session closes with it, reload on its own
+            self._reload_task = asyncio.create_task(self._reload(db.bind))
+
+    async def _reload(self, bind):
+        try:
+            async with self._lock, AsyncSession(bind) as db:
+                await self.load(db)
+        except Exception:
+            logger.exception("Suggest index reload failed")
+        finally:
+            self._reload_task = None
+
+    async def stop(self):
+        """Cancels reloads and read backs, the index reloads on next use
+        as notifications are no longer received"""
+        tasks = [
+            task for task in (self._reload_task, self._read_task)
+            if task is not None
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._unread.clear()
+        self.invalidate()
+
+    async def load(self, db: AsyncSession):
+        self._pending = []
+        self.stale = False
+        try:
+            companies = await db.execute(select(Company.id, Company.name))
+            categories = await db.execute(select(Category.id, Category.name))
+            entries = [
+                *(("company", *row) for row in companies),
+                *(("category", *row) for row in categories),
+            ]
+            index = PrefixIndex()
+            index.build(entries)
+            self.index = index
+            for change in self._pending:
+                self._apply(*change)
+            self.loaded = True
+        except BaseException:
+            self.stale = True
+            raise
+        finally:
+            self._pending = None
+
+    def search(
+            self, prefix: str, limit: int, kind: str | None = None
+    ) -> list[dict]:
+        return self.index.search(prefix, limit, kind)
+
+    def invalidate(self):
+        """Reload on next use, for writes made without the ORM"""
+        self.stale = True
+
+    def apply(self, kind: str, entry_id: int, name: str | None):
+        """Add or rename an entry, name None removes it"""
+        if self._pending is not None:
+            self._pending.append((kind, entry_id, name))
+        self._apply(kind, entry_id, name)
+
+    def _apply(self, kind: str, entry_id: int, name: str | None):
+        if name is None:
+            self.index.remove(kind, entry_id)
+        else:
+            self.index.add(kind, entry_id, name)
+
+    def on_notification(self, payload: str | None):
+        """catalogue_changes callback, see models.CATALOGUE_CHANNEL"""
+        if payload is None:
+            # notifications may have been missed
+            self.invalidate()
+            return
+        change = json.loads(payload)
+        kind = TABLE_KINDS.get(change["table"])
+        if kind is None:
+            return
+        if change["op"] == "RELOAD":
+            self.invalidate()
+            return
+        if change["op"] == "DELETE":
+            self.apply(kind, change["id"], None)
+            return
+        # notifications carry the id only
+        self._unread.add((kind, change["id"]))
+        if self._read_task is None:
+            self._read_task = asyncio.get_running_loop().create_task(
+                self._read_back()
+            )
+
+    async def _read_back(self):
+        """Applies the current names of the notified entries"""
+        try:
+            while self._unread:
+                unread, self._unread = self._unread, set()
+                async with AsyncSessionLocal() as db:
+                    for kind, model in KIND_MODELS.items():
+                        ids = {i for k, i in unread if k == kind}
+                        if not ids:
+                            continue
+                        result = await db.execute(
+                            select(model.id, model.name)
+                            .where(model.id.in_(ids))
+                        )
+                        names = dict(result.all())
+                        for entry_id in ids:
+                            self.apply(kind, entry_id, names.get(entry_id))
+        except Exception:
+            logger.exception("Suggest index read back failed")
+            self._unread.clear()
+            self.invalidate()
+        finally:
+            self._read_task = None
+
+
+suggest_index = SuggestIndex()
+
+# Session.info key of the flushed (transaction, change) pairs, applied
+# once the session commits
+SESSION_CHANGES = "suggest_changes"
+
+
+def _within(transaction, ancestor) -> bool:
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+def _on_write(kind: str, deleted: bool):
+    def listener(mapper, connection, target):
+        session = object_session(target)
+        if session is None:
+            return
+        transaction = (
+            session.get_nested_transaction() or session.get_transaction()
+        )
+        session.info.setdefault(SESSION_CHANGES, []).append(
+            (transaction, (kind, target.id, None if deleted else target.name))
+        )
+    return listener
+
+
+def _on_commit(session: Session):
+    # savepoints commit into the enclosing transaction
+    if session.in_nested_transaction():
+        return
+    for _, change in session.info.pop(SESSION_CHANGES, ()):
+        suggest_index.apply(*change)
+
+
+def _on_rollback(session: Session, previous_transaction):
+    changes = session.info.get(SESSION_CHANGES)
+    if changes:
+        changes[:] = [
+            (transaction, change) for transaction, change in changes
+            if not _within(transaction, previous_transaction)
+        ]
+
+
+for model, model_kind in ((Company, "company"), (Category, "category")):
+    event.listen(model, "after_insert", _on_write(model_kind, False))
+    event.listen(model, "after_update", _on_write(model_kind, False))
+    event.listen(model, "after_delete", _on_write(model_kind, True))
+event.listen(Session, "after_commit", _on_commit)
+event.listen(Session, "after_soft_rollback", _on_rollback)
@@ -0,0 +1,248 @@
+"""Idempotent upserts of partner records matched by external_id.
+
+A batch is sent as one jsonb parameter and applied by one statement:
+INSERT ... ON CONFLICT (external_id) DO UPDATE, skipping rows that
+would not change, and for companies set differences of phones and
+category links against what is stored. Replaying a batch writes
+nothing and needs no reads before it."""
+import json
+
+from sqlalchemy import text
+from sqlalchemy_utils.types.phone_number import PhoneNumberParseException
+
+from core.cache import response_cache, company_key, building_key, \
+    building_companies_key
+from core.geocache import geo_cell_cache
+from core.suggest import suggest_index
+from database import AsyncSession
+from models import PhoneNumber
+
+CHANGED = ("created", "updated")
+
+BUILDING_UPSERT = text("""
+WITH input AS (
+    SELECT r.external_id, r.address,
+           ST_SetSRID(ST_MakePoint(r.longitude, r.latitude), 4326)
+               AS coordinates
+    FROM jsonb_to_recordset(CAST(:records AS jsonb)) AS r(
+        external_id text, address text,
+        longitude double precision, latitude double precision
+    )
+),
+upserted AS (
+    INSERT INTO buildings AS b (external_id, address, coordinates)
+    SELECT external_id, address, coordinates FROM input
+    ON CONFLICT (external_id) DO UPDATE
+    SET address = EXCLUDED.address,
+        coordinates = EXCLUDED.coordinates,
+        updated_at = now()
+    WHERE b.address IS DISTINCT FROM EXCLUDED.address
+       OR ST_AsEWKB(b.coordinates) IS DISTINCT FROM
+          ST_AsEWKB(EXCLUDED.coordinates)
+    RETURNING b.id, b.external_id, b.xmax = 0 AS inserted
+)
+SELECT i.external_id, coalesce(u.id, b.id) AS id,
+       CASE WHEN u.id IS NULL THEN 'unchanged'
+            WHEN u.inserted THEN 'created'
+            ELSE 'updated' END AS status,
+       NULL AS error
+FROM input i
+LEFT JOIN upserted u ON u.external_id = i.external_id
+LEFT JOIN buildings b ON b.external_id = i.external_id
+""")
+
+# all CTEs see the rows as they were before the statement, so stored
+# phones and links are diffed against the state the batch started from
+COMPANY_UPSERT = text("""
+WITH input AS (
+    SELECT r.external_id, r.name,
+           coalesce(r.building_id, b.id) AS building_id,
+           coalesce(r.phone_numbers, '{}') AS phone_numbers,
+           ARRAY(
+               SELECT DISTINCT unnest(coalesce(r.categories, '{}'))
+           ) AS category_ids
+    FROM jsonb_to_recordset(CAST(:records AS jsonb)) AS r(
+        external_id text, name text, building_id integer,
+        building_external_id text, phone_numbers text[],
+        categories integer[]
+    )
+    LEFT JOIN buildings b ON b.external_id = r.building_external_id
+),
+checked AS (
+    SELECT i.*,
+           CASE
+               WHEN NOT EXISTS (
+                   SELECT FROM buildings b WHERE b.id = i.building_id
+               ) THEN 'building not found'
+               WHEN EXISTS (
+                   SELECT FROM unnest(i.category_ids) AS k(id)
+                   WHERE NOT EXISTS (
+                       SELECT FROM categories c WHERE c.id = k.id
+                   )
+               ) THEN 'categories not found'
+           END AS error
+    FROM input i
+),
+upserted AS (
+    INSERT INTO companies AS c (external_id, name, building_id)
+    SELECT external_id, name, building_id FROM checked WHERE error IS NULL
+    ON CONFLICT (external_id) DO UPDATE
+    SET name = EXCLUDED.name,
+        building_id = EXCLUDED.building_id,
+        updated_at = now()
+    WHERE (c.name, c.building_id)
+          IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.building_id)
+    RETURNING c.id, c.external_id, c.xmax = 0 AS inserted
+),
+targets AS (
+    SELECT i.external_id, coalesce(u.id, c.id) AS id,
+           i.phone_numbers, i.category_ids,
+           CASE WHEN u.id IS NULL THEN 'unchanged'
+                WHEN u.inserted THEN 'created'
+                ELSE 'updated' END AS status
+    FROM checked i
+    LEFT JOIN upserted u ON u.external_id = i.external_id
+    LEFT JOIN companies c ON c.external_id = i.external_id
+    WHERE i.error IS NULL
+),
+removed_phones AS (
+    DELETE FROM phone_numbers p
+    USING targets t
+    WHERE p.company_id = t.id AND p.phone_number <> ALL (t.phone_numbers)
+    RETURNING p.company_id
+),
+added_phones AS (
+    INSERT INTO phone_numbers (phone_number, company_id)
+    SELECT DISTINCT n.phone_number, t.id
+    FROM targets t
+    CROSS JOIN unnest(t.phone_numbers) AS n(phone_number)
+    WHERE NOT EXISTS (
+        SELECT FROM phone_numbers p
+        WHERE p.company_id = t.id AND p.phone_number = n.phone_number
+    )
+    RETURNING company_id
+),
+removed_links AS (
+    DELETE FROM company_category_association a
+    USING targets t
+    WHERE a.company_id = t.id AND a.category_id <> ALL (t.category_ids)
+    RETURNING a.company_id
+),
+added_links AS (
+    INSERT INTO company_category_association (company_id, category_id)
+    SELECT t.id, k.id
+    FROM targets t
+    CROSS JOIN unnest(t.category_ids) AS k(id)
+    WHERE NOT EXISTS (
+        SELECT FROM company_category_association a
+        WHERE a.company_id = t.id AND a.category_id = k.id
+    )
+    RETURNING company_id
+),
+touched AS (
+    UPDATE companies c
+    SET updated_at = now()
+    FROM targets t
+    WHERE c.id = t.id AND t.status = 'unchanged' AND t.id IN (
+        SELECT company_id FROM removed_phones
+        UNION SELECT company_id FROM added_phones
+        UNION SELECT company_id FROM removed_links
+        UNION SELECT company_id FROM added_links
+    )
+    RETURNING c.id
+)
+SELECT i.external_id, t.id,
+       CASE WHEN i.error IS NOT NULL THEN 'rejected'
+            WHEN t.id IN (SELECT id FROM touched) THEN 'updated'
+            ELSE t.status END AS status,
+       i.error
+FROM checked i
+LEFT JOIN targets t ON t.external_id = i.external_id
+""")
+
+_phone_type = PhoneNumber.__table__.c.phone_number.type
+
+
+def _latest(records: list[dict]) -> dict[str, dict]:
+    """Records by external_id in the order of first appearance, a later
+    record replaces an earlier one"""
+    latest = {}
+    for record in records:
+        latest[record["external_id"]] = record
+    return latest
+
+
+async def _run(statement, records: dict[str, dict], db: AsyncSession):
+    try:
+        result = await db.execute(
+            statement, {"records": json.dumps(list(records.values()))}
+        )
+        rows = {row.external_id: row._asdict() for row in result}
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
+    return rows
+
+
+async def upsert_buildings(
+        records: list[dict], db: AsyncSession
+) -> list[dict]:
+    """records: external_id, address, longitude, latitude. Returns
+    external_id, id and status (created, updated or unchanged) for each
+    distinct external_id, in the order they were first given"""
+    latest = _latest(records)
+    rows = await _run(BUILDING_UPSERT, latest, db)
+
+    changed = [row for row in rows.values() if row["status"] in CHANGED]
+    if changed:
+        await response_cache.delete(
+            *(building_key(row["id"]) for row in changed)
+        )
+        await geo_cell_cache.clear()
+    return [rows[external_id] for external_id in latest]
+
+
+async def upsert_companies(
+        records: list[dict], db: AsyncSession
+) -> list[dict]:
+    """records: external_id, name, building_id or building_external_id,
+    phone_numbers and categories (ids), the lists replace the stored
+    ones. Returns external_id, id, status (created, updated, unchanged
+    or rejected) and error for each distinct external_id, in the order
+    they were first given"""
+    latest = _latest(records)
+    order = list(latest)
+    rows = {}
+    for external_id in order:
+        record = latest[external_id]
+        try:
+            record["phone_numbers"] = [
+                _phone_type.process_bind_param(number, None)
+                for number in record.get("phone_numbers") or ()
+                if number.strip()
+            ]
+        except PhoneNumberParseException:
+            del latest[external_id]
+            rows[external_id] = {
+                "external_id": external_id, "id": None,
+                "status": "rejected", "error": "invalid phone number"
+            }
+    if latest:
+        rows.update(await _run(COMPANY_UPSERT, latest, db))
+
+    changed = [row for row in rows.values() if row["status"] in CHANGED]
+    if changed:
+        building_ids = {
+            latest[row["external_id"]].get("building_id") for row in changed
+        }
+        await response_cache.delete(
+            *(company_key(row["id"]) for row in changed),
+            *(building_companies_key(bid) for bid in building_ids if bid)
+        )
+        await geo_cell_cache.clear()
+        for row in changed:
+            suggest_index.apply(
+                "company", row["id"], latest[row["external_id"]]["name"]
+            )
+    return [rows[external_id] for external_id in order]
@@ -0,0 +1,117 @@
+"""Start-up warm-up and readiness of the API and the export worker.
+
+What every request needs is done before the process serves: pool
+connections are opened, hot statements compiled and phone number
+metadata loaded. Catalogue caches that take longer (suggest index,
+snapshot) load in the background, reads fall back to SQL until they
+are in. /health/ready answers 503 until every step has finished, so a
+load balancer only routes to a replica once it serves at full speed.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import settings
+from database import open_pool_connections
+
+logger = logging.getLogger("warm_up")
+
+
+class WarmUp:
+    """Named start-up steps with their duration and errors"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.serving = False
+        self.ready_after: float | None = None
+        # step -> seconds it took, None while running
+        self.steps: dict[str, float | None] = {}
+        self.errors: dict[str, str] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def ready(self) -> bool:
+        return self.serving and None not in self.steps.values()
+
+    async def run(
+            self, name: str, step: Callable[[], Awaitable],
+            errors: tuple[type[BaseException], ...] = (Exception,)
+    ) -> bool:
+        """Runs a step, a failed step is reported and skipped"""
+        self.steps[name] = None
+        started = time.perf_counter()
+        try:
+            await step()
+            return True
+        except errors as e:
+            self.errors[name] = str(e)
+            logger.warning("Warm-up step %s skipped: %s", name, e)
+            return False
+        finally:
+            self.steps[name] = round(time.perf_counter() - started, 3)
+            self._check_ready()
+
+    def run_in_background(
+            self, name: str, step: Callable[[], Awaitable],
+            errors: tuple[type[BaseException], ...] = (Exception,)
+    ):
+        self.steps[name] = None
+        task = asyncio.create_task(self.run(name, step, errors))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Cancels the background steps still running"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def mark_serving(self):
+        """Start-up is over, ready once the background steps finish"""
+        self.serving = True
+        self._check_ready()
+
+    def _check_ready(self):
+        if self.ready and self.ready_after is None:
+            self.ready_after = round(time.monotonic() - self.started, 3)
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "ready_after": self.ready_after,
+            "uptime": round(time.monotonic() - self.started, 3),
+            "steps": dict(self.steps),
+            "errors": dict(self.errors),
+        }
+
+
+def preopen_count() -> int:
+    """Pool connections opened and warmed up at start-up"""
+    if settings.DB_POOL_PREOPEN is None:
+        return settings.DB_POOL_SIZE
+    return settings.DB_POOL_PREOPEN
+
+
+async def warm_up_pool(engine: AsyncEngine):
+    count = preopen_count()
+    if count > 0:
+        await open_pool_connections(engine, count)
+
+
+async def warm_up_codecs():
+    """Loads phone metadata and geometry codecs on their first use, the
+    first company and building responses would pay for it otherwise.
+    Imported here, so importing this module stays cheap"""
+    from geoalchemy2.shape import from_shape, to_shape
+    from shapely.geometry import Point
+    from sqlalchemy_utils import PhoneNumber
+
+    PhoneNumber("+79990000000", "RU").e164
+    to_shape(from_shape(Point(0, 0), srid=4326))
+
+
+warm_up = WarmUp()
@@ -1,18 +1,179 @@
-from typing import AsyncGenerator
+import asyncio
+import itertools
+import time
+from typing import AsyncGenerator, Iterator
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, \
+    AsyncEngine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from config import settings
 
-engine = create_async_engine(settings.URL_DATABASE, echo=True)
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that tracks checkouts queued for a returned connection
+    and the time they wait"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiters = 0
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _must_wait(self) -> bool:
+        # no idle connection and no overflow left to open one
+        return (
+            self._pool.empty()
+            and -1 < self._max_overflow <= self._overflow
+        )
+
+    def _do_get(self):
+        if not self._must_wait():
+            return super()._do_get()
+        self.waiters += 1
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - started
+            self.waiters -= 1
+            self.wait_count += 1
+            self.wait_time_total += elapsed
+            self.wait_time_max = max(self.wait_time_max, elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "waiters": self.waiters,
+            "wait_count": self.wait_count,
+            "wait_time_total": self.wait_time_total,
+            "wait_time_avg": (
+                self.wait_time_total / self.wait_count
+                if self.wait_count else 0.0
+            ),
+            "wait_time_max": self.wait_time_max,
+        }
+
+
+def build_engine(url: str) -> AsyncEngine:
+    """Create an async engine with pool and driver options from settings"""
+    server_settings = {}
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        server_settings["statement_timeout"] = str(
+            settings.DB_STATEMENT_TIMEOUT_MS
+        )
+    return create_async_engine(
+        url,
+        echo=settings.DB_ECHO,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={
+            "prepared_statement_cache_size": (
+                settings.DB_STATEMENT_CACHE_SIZE
+            ),
+            "server_settings": server_settings,
+        },
+    )
+
+
+class ReplicaSet:
+    """Round-robin over read replicas, skipping ones that failed recently"""
+
+    def __init__(self, urls: list[str], retry_after: float):
+        self.engines = [build_engine(url) for url in urls]
+        self._sessionmakers = [
+            sessionmaker(
+                bind=replica_engine,
+                class_=AsyncSession,
+                expire_on_commit=False
+            ) for replica_engine in self.engines
+        ]
+        self._retry_after = retry_after
+        self._down_until = [0.0] * len(self.engines)
+        self._counter = itertools.count()
+
+    def candidates(self) -> Iterator[tuple[int, sessionmaker]]:
+        if not self.engines:
+            return
+        start = next(self._counter)
+        now = time.monotonic()
+        for offset in range(len(self.engines)):
+            idx = (start + offset) % len(self.engines)
+            if self._down_until[idx] <= now:
+                yield idx, self._sessionmakers[idx]
+
+    def mark_down(self, idx: int):
+        self._down_until[idx] = time.monotonic() + self._retry_after
+
+    def health(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "url": replica_engine.url.render_as_string(),
+                "healthy": self._down_until[idx] <= now,
+            } for idx, replica_engine in enumerate(self.engines)
+        ]
+
+
+async def open_pool_connections(engine: AsyncEngine, count: int) -> int:
+    """Connect count pool connections ahead of the first requests,
+    returns how many were opened"""
+    conns = await asyncio.gather(
+        *(engine.connect().start() for _ in range(count)),
+        return_exceptions=True
+    )
+    opened = [conn for conn in conns if not isinstance(conn, BaseException)]
+    for conn in opened:
+        await conn.close()
+    if len(opened) < count:
+        raise next(c for c in conns if isinstance(c, BaseException))
+    return count
+
+
+engine = build_engine(settings.URL_DATABASE)
 AsyncSessionLocal = sessionmaker(
     bind=engine,
     class_=AsyncSession,
     expire_on_commit=False
 )
+replicas = ReplicaSet(
+    settings.SQL_REPLICA_URLS, settings.SQL_REPLICA_RETRY_SECONDS
+)
 
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def _connect_replica() -> AsyncSession | None:
+    """Open a session on the next healthy replica, None if there is none"""
+    for idx, replica_sessionmaker in replicas.candidates():
+        session = replica_sessionmaker()
+        try:
+            await session.connection()
+            return session
+        except (OSError, DBAPIError):
+            await session.close()
+            replicas.mark_down(idx)
+    return None
+
+
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    """Session for read-only work: a replica if available, else primary"""
+    session = await _connect_replica()
+    if session is None:
+        session = AsyncSessionLocal()
+    async with session:
+        yield session
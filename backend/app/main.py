@@ -1,6 +1,83 @@
+from contextlib import asynccontextmanager
+
+import asyncpg
 from fastapi import FastAPI
+from sqlalchemy.exc import DBAPIError
+
+from api.v1.routers import admin, buildings, categories, companies, \
+    export, health, imports, metrics, suggest
+from core.cache import LRUCache, response_cache, on_catalogue_change
+from core.geocache import geo_cell_cache
+from core.metrics import MetricsMiddleware, TimedJSONResponse, \
+    instrument_engine
+from core.notifications import notification_hub
+from core.querylog import RequestTraceMiddleware, trace_engine
+from core.snapshot import snapshot_engine
+from core.statement_cache import warm_up_statement_cache
+from core.suggest import suggest_index
+from core.warmup import warm_up, warm_up_codecs, warm_up_pool, \
+    preopen_count
+from database import engine, replicas, AsyncSessionLocal
+from models import CATALOGUE_CHANNEL
+
+for db_engine in (engine, *replicas.engines):
+    instrument_engine(db_engine)
+    trace_engine(db_engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db_errors = (OSError, DBAPIError, asyncpg.PostgresError)
+    await warm_up.run("codecs", warm_up_codecs)
+    for idx, db_engine in enumerate((engine, *replicas.engines)):
+        name = f"replica_{idx}" if idx else "primary"
+        await warm_up.run(
+            f"pool:{name}", lambda e=db_engine: warm_up_pool(e), db_errors
+        )
+        await warm_up.run(
+            f"statements:{name}",
+            lambda e=db_engine: warm_up_statement_cache(e, preopen_count()),
+            db_errors
+        )
+
+    async def load_suggest_index():
+        # subscribe first so changes made during the load are not missed
+        await notification_hub.subscribe(
+            CATALOGUE_CHANNEL, suggest_index.on_notification
+        )
+        async with AsyncSessionLocal() as db:
+            await suggest_index.ensure_loaded(db)
+
+    warm_up.run_in_background("suggest_index", load_suggest_index, db_errors)
+    if isinstance(response_cache, LRUCache):
+        # every worker has its own entries, writes reach them by NOTIFY
+        warm_up.run_in_background(
+            "response_cache", lambda: notification_hub.subscribe(
+                CATALOGUE_CHANNEL, on_catalogue_change
+            ), db_errors
+        )
+    if geo_cell_cache.enabled:
+        # cells are dropped on writes made by other processes too
+        warm_up.run_in_background(
+            "geo_cache", lambda: notification_hub.subscribe(
+                CATALOGUE_CHANNEL, geo_cell_cache.on_notification
+            ), db_errors
+        )
+    if snapshot_engine.enabled:
+        # reads fall back to SQL until a snapshot is loaded
+        warm_up.run_in_background(
+            "snapshot", snapshot_engine.start, db_errors
+        )
+    warm_up.mark_serving()
+    yield
 
-from api.v1.routers import buildings, categories, companies, export
+    await warm_up.stop()
+    await snapshot_engine.stop()
+    await suggest_index.stop()
+    await geo_cell_cache.stop()
+    await notification_hub.close()
+    for db_engine in (engine, *replicas.engines):
+        await db_engine.dispose()
 
 
 app = FastAPI(
@@ -9,9 +86,18 @@ app = FastAPI(
     version="1.0.0",
     root_path="/api/v1",
     docs_url="/docs",
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse,
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestTraceMiddleware)
 
 app.include_router(buildings.router)
 app.include_router(categories.router)
 app.include_router(companies.router)
 app.include_router(export.router)
+app.include_router(imports.router)
+app.include_router(suggest.router)
+app.include_router(admin.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
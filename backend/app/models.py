@@ -1,6 +1,7 @@
-from geoalchemy2 import Geometry
+from geoalchemy2 import Geometry, Geography
 from sqlalchemy import Column, ForeignKey, Integer, String, Table, DateTime, \
-    func
+    func, Index, DDL, event
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy_utils import PhoneNumberType
 
@@ -23,7 +24,7 @@ class PhoneNumber(Base):
     __tablename__ = "phone_numbers"
     id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     phone_number = Column(PhoneNumberType(region="RU"))
-    company_id = Column(Integer, ForeignKey("companies.id"))
+    company_id = Column(Integer, ForeignKey("companies.id"), index=True)
     company = relationship("Company", back_populates="phone_numbers")
 
     def __repr__(self):
@@ -36,12 +37,17 @@ class Company(Base):
     __tablename__ = "companies"
     id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     name = Column(String)
+    # partner feed key, upserts match on it
+    external_id = Column(String, unique=True, index=True)
     phone_numbers = relationship(
         "PhoneNumber", back_populates="company", cascade="all",
         lazy="selectin"
     )
-    building_id = Column(Integer, ForeignKey("buildings.id"))
+    building_id = Column(Integer, ForeignKey("buildings.id"), index=True)
     building = relationship("Building", back_populates="companies")
+    updated_at = Column(
+        DateTime, server_default=func.now(), onupdate=func.now()
+    )
     categories = relationship(
         "Category",
         back_populates="companies",
@@ -60,7 +66,12 @@ class Building(Base):
     id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     address = Column(String)
     coordinates = Column(Geometry("POINT"))
+    # partner feed key, upserts match on it
+    external_id = Column(String, unique=True, index=True)
     companies = relationship("Company", back_populates="building")
+    updated_at = Column(
+        DateTime, server_default=func.now(), onupdate=func.now()
+    )
 
     def __repr__(self):
         return f"<Building(id={self.id}, address={self.address})>"
@@ -70,7 +81,9 @@ class Category(Base):
     __tablename__ = "categories"
 
     id = Column(Integer, primary_key=True, autoincrement=True, index=True)
-    parent_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    parent_id = Column(
+        Integer, ForeignKey("categories.id"), nullable=True, index=True
+    )
     name = Column(String, nullable=False)
     parent = relationship(
         "Category",
@@ -88,6 +101,9 @@ class Category(Base):
         secondary=company_category_association,
         cascade="all"
     )
+    updated_at = Column(
+        DateTime, server_default=func.now(), onupdate=func.now()
+    )
 
     def __repr__(self):
         return (f"<Category(id={self.id}, name={self.name}, "
@@ -103,3 +119,252 @@ class ExportTask(Base):
     file_path = Column(String, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, onupdate=func.now())
+
+
+class CompanySearch(Base):
+    """Denormalised company document for advanced search.
+
+    Rows are maintained by database triggers on the source tables,
+    see COMPANY_SEARCH_DDL, the application never writes them."""
+    __tablename__ = "company_search"
+
+    company_id = Column(
+        Integer, ForeignKey("companies.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    name = Column(String)
+    building_id = Column(Integer, index=True)
+    geog = Column(Geography("POINT", srid=4326))
+    phone_numbers = Column(ARRAY(PhoneNumberType(region="RU")))
+    # digits of all phone numbers separated by spaces
+    phone_digits = Column(String)
+    category_ids = Column(ARRAY(Integer))
+    category_names = Column(ARRAY(String))
+    # name weighted A, category names weighted B
+    search_vector = Column(TSVECTOR)
+
+    __table_args__ = (
+        Index(
+            "ix_company_search_name_trgm", "name",
+            postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}
+        ),
+        Index(
+            "ix_company_search_phone_digits_trgm", "phone_digits",
+            postgresql_using="gin",
+            postgresql_ops={"phone_digits": "gin_trgm_ops"}
+        ),
+        Index(
+            "ix_company_search_category_ids", "category_ids",
+            postgresql_using="gin"
+        ),
+        Index(
+            "ix_company_search_category_names", "category_names",
+            postgresql_using="gin"
+        ),
+        Index(
+            "ix_company_search_search_vector", "search_vector",
+            postgresql_using="gin"
+        ),
+    )
+
+
+# text search configuration company_search_refresh builds vectors with
+SEARCH_CONFIG = "english"
+
+
+# company_search_refresh(ids) rebuilds the documents of the given
+# companies, company_search_refresh(NULL) rebuilds all of them. Documents
+# are upserted, so concurrent refreshes of one company do not collide.
+COMPANY_SEARCH_REFRESH = f"""
+CREATE OR REPLACE FUNCTION company_search_refresh(ids integer[])
+RETURNS void AS $$
+BEGIN
+    DELETE FROM company_search s
+    WHERE (ids IS NULL OR s.company_id = ANY(ids))
+      AND NOT EXISTS (SELECT 1 FROM companies c WHERE c.id = s.company_id);
+    INSERT INTO company_search (
+        company_id, name, building_id, geog, phone_numbers, phone_digits,
+        category_ids, category_names, search_vector
+    )
+    SELECT c.id, c.name, c.building_id, b.coordinates::geography,
+           coalesce(p.phone_numbers, '{{}}'), coalesce(p.phone_digits, ''),
+           coalesce(k.category_ids, '{{}}'),
+           coalesce(k.category_names, '{{}}'),
+           setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(c.name, '')), 'A')
+           || setweight(to_tsvector(
+               '{SEARCH_CONFIG}',
+               coalesce(array_to_string(k.category_names, ' '), '')
+           ), 'B')
+    FROM companies c
+    LEFT JOIN buildings b ON b.id = c.building_id
+    LEFT JOIN LATERAL (
+        SELECT array_agg(pn.phone_number ORDER BY pn.id) AS phone_numbers,
+               string_agg(
+                   regexp_replace(pn.phone_number, '[^0-9]', '', 'g'), ' '
+                   ORDER BY pn.id
+               ) AS phone_digits
+        FROM phone_numbers pn
+        WHERE pn.company_id = c.id
+    ) p ON true
+    LEFT JOIN LATERAL (
+        SELECT array_agg(cat.id ORDER BY cat.id) AS category_ids,
+               array_agg(cat.name ORDER BY cat.id) AS category_names
+        FROM company_category_association a
+        JOIN categories cat ON cat.id = a.category_id
+        WHERE a.company_id = c.id
+    ) k ON true
+    WHERE ids IS NULL OR c.id = ANY(ids)
+    ON CONFLICT (company_id) DO UPDATE SET
+        name = EXCLUDED.name,
+        building_id = EXCLUDED.building_id,
+        geog = EXCLUDED.geog,
+        phone_numbers = EXCLUDED.phone_numbers,
+        phone_digits = EXCLUDED.phone_digits,
+        category_ids = EXCLUDED.category_ids,
+        category_names = EXCLUDED.category_names,
+        search_vector = EXCLUDED.search_vector;
+END
+$$ LANGUAGE plpgsql
+"""
+
+# source table -> (trigger events, companies affected by the changed
+# rows available as {rows})
+COMPANY_SEARCH_SOURCES = {
+    "companies": (
+        ("INSERT", "UPDATE", "DELETE"), "SELECT id FROM {rows}"
+    ),
+    "phone_numbers": (
+        ("INSERT", "UPDATE", "DELETE"), "SELECT company_id FROM {rows}"
+    ),
+    "company_category_association": (
+        ("INSERT", "UPDATE", "DELETE"), "SELECT company_id FROM {rows}"
+    ),
+    "buildings": (
+        ("UPDATE",),
+        "SELECT c.id FROM companies c JOIN {rows} r ON r.id = c.building_id"
+    ),
+    "categories": (
+        ("UPDATE",),
+        "SELECT a.company_id FROM company_category_association a "
+        "JOIN {rows} r ON r.id = a.category_id"
+    ),
+}
+TRANSITION_TABLES = {
+    "INSERT": "NEW TABLE AS new_rows",
+    "UPDATE": "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "DELETE": "OLD TABLE AS old_rows",
+}
+
+
+def _company_search_triggers() -> list[str]:
+    statements = []
+    for table, (events, affected) in COMPANY_SEARCH_SOURCES.items():
+        old = affected.format(rows="old_rows")
+        new = affected.format(rows="new_rows")
+        statements.append(f"""
+CREATE OR REPLACE FUNCTION company_search_sync_{table}()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM company_search_refresh(ARRAY({new}));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM company_search_refresh(ARRAY({old} UNION {new}));
+    ELSE
+        PERFORM company_search_refresh(ARRAY({old}));
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""")
+        for op in events:
+            statements.append(f"""
+CREATE OR REPLACE TRIGGER company_search_{table}_{op.lower()}
+AFTER {op} ON {table}
+REFERENCING {TRANSITION_TABLES[op]}
+FOR EACH STATEMENT EXECUTE FUNCTION company_search_sync_{table}()
+""")
+    return statements
+
+
+COMPANY_SEARCH_DDL = [COMPANY_SEARCH_REFRESH, *_company_search_triggers()]
+
+# catalogue row changes are published on this channel as
+# {"table", "op", "id"}, large statements publish {"table", "op": "RELOAD"}.
+# Listeners read the rest of a row back, NOTIFY payloads are limited to
+# 8000 bytes.
+CATALOGUE_CHANNEL = "catalogue_changes"
+# table -> key column published as "id"
+CATALOGUE_TABLES = {
+    "companies": "id",
+    "categories": "id",
+    "buildings": "id",
+    "company_search": "company_id",
+}
+CATALOGUE_NOTIFY_MAX_ROWS = 1000
+
+CATALOGUE_NOTIFY = f"""
+CREATE OR REPLACE FUNCTION catalogue_notify()
+RETURNS trigger AS $$
+DECLARE
+    changed integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT count(*) INTO changed FROM old_rows;
+    ELSE
+        SELECT count(*) INTO changed FROM new_rows;
+    END IF;
+    IF changed > {CATALOGUE_NOTIFY_MAX_ROWS} THEN
+        PERFORM pg_notify('{CATALOGUE_CHANNEL}', json_build_object(
+            'table', TG_TABLE_NAME, 'op', 'RELOAD'
+        )::text);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('{CATALOGUE_CHANNEL}', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP,
+            'id', to_jsonb(r) -> TG_ARGV[0]
+        )::text) FROM old_rows r;
+    ELSE
+        PERFORM pg_notify('{CATALOGUE_CHANNEL}', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP,
+            'id', to_jsonb(r) -> TG_ARGV[0]
+        )::text) FROM new_rows r;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def _catalogue_triggers() -> list[str]:
+    return [
+        f"""
+CREATE OR REPLACE TRIGGER catalogue_notify_{table}_{op.lower()}
+AFTER {op} ON {table}
+REFERENCING {TRANSITION_TABLES[op]}
+FOR EACH STATEMENT EXECUTE FUNCTION catalogue_notify('{key}')
+""" for table, key in CATALOGUE_TABLES.items() for op in TRANSITION_TABLES
+    ]
+
+
+CATALOGUE_NOTIFY_DDL = [CATALOGUE_NOTIFY, *_catalogue_triggers()]
+
+# the triggers reference every source table, so they are installed once
+# the whole schema exists
+event.listen(
+    Base.metadata, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
+for statement in (*COMPANY_SEARCH_DDL, *CATALOGUE_NOTIFY_DDL):
+    event.listen(Base.metadata, "after_create", DDL(statement))
+event.listen(
+    Base.metadata, "after_drop",
+    DDL("DROP FUNCTION IF EXISTS company_search_refresh(integer[])")
+)
+for source_table in COMPANY_SEARCH_SOURCES:
+    event.listen(
+        Base.metadata, "after_drop",
+        DDL(f"DROP FUNCTION IF EXISTS company_search_sync_{source_table}()")
+    )
+event.listen(
+    Base.metadata, "after_drop",
+    DDL("DROP FUNCTION IF EXISTS catalogue_notify()")
+)
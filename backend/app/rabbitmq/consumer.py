@@ -1,20 +1,59 @@
 import asyncio
 import aio_pika
 from aio_pika.abc import AbstractIncomingMessage
+from sqlalchemy.exc import DBAPIError
 
-from database import get_session
+from core.metrics import registry
+from core.querylog import request_id, trace_engine
+from core.warmup import warm_up, warm_up_codecs, warm_up_pool
+from database import engine, replicas, get_session, get_read_session
 from rabbitmq.export_service import process_task
 from config import settings
 
 
 async def process_export_message(message: AbstractIncomingMessage):
-    async with message.process():
-        async for db in get_session():
-            task_id = int(message.body.decode())
-            await process_task(db, task_id)
+    # slow statement log lines of the task carry its id
+    token = request_id.set(
+        f"export-{message.body.decode(errors='replace')}"
+    )
+    try:
+        async with message.process():
+            async for db in get_session():
+                async for read_db in get_read_session():
+                    task_id = int(message.body.decode())
+                    await process_task(db, task_id, read_db)
+    finally:
+        request_id.reset(token)
+
+
+async def serve_metrics(reader: asyncio.StreamReader,
+                        writer: asyncio.StreamWriter):
+    """Minimal HTTP endpoint answering any request with worker metrics"""
+    await reader.readuntil(b"\r\n\r\n")
+    body = registry.render().encode()
+    writer.write(
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: text/plain; version=0.0.4\r\n"
+        b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+        b"Connection: close\r\n\r\n" + body
+    )
+    await writer.drain()
+    writer.close()
 
 
 async def consume():
+    for db_engine in (engine, *replicas.engines):
+        trace_engine(db_engine)
+        # the first task should not pay for connecting
+        await warm_up.run(
+            f"pool:{db_engine.url.host}",
+            lambda e=db_engine: warm_up_pool(e), (OSError, DBAPIError)
+        )
+    await warm_up.run("codecs", warm_up_codecs)
+    if settings.WORKER_METRICS_PORT:
+        await asyncio.start_server(
+            serve_metrics, "0.0.0.0", settings.WORKER_METRICS_PORT
+        )
     while True:
         try:
             connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
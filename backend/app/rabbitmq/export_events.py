@@ -0,0 +1,137 @@
+import asyncio
+import json
+from collections import defaultdict
+from typing import AsyncIterator
+
+from sqlalchemy import select, func, cast, String
+
+from api.v1.schemas import ExportStatus
+from config import settings
+from core.notifications import notification_hub, NotificationHub
+from database import AsyncSession, AsyncSessionLocal
+from models import ExportTask
+
+TERMINAL_STATUSES = frozenset({"completed", "failed"})
+
+
+async def notify_task_status(task_id: int, db: AsyncSession):
+    """Queue a NOTIFY with the current task row, delivered on commit"""
+    payload = func.json_build_object(
+        "task_id", ExportTask.id,
+        "status", ExportTask.status,
+        "export_table", ExportTask.export_table,
+        "url", ExportTask.file_path,
+        "created_at", ExportTask.created_at,
+        "updated_at", ExportTask.updated_at,
+    )
+    await db.execute(
+        select(
+            func.pg_notify(
+                settings.EXPORT_EVENTS_CHANNEL, cast(payload, String)
+            )
+        ).where(ExportTask.id == task_id)
+    )
+
+
+class ExportEventsBroker:
+    """Routes export task notifications to per-task subscriber queues.
+
+    A queue receives decoded event dicts, or None when the listener
+    connection was lost and the current status must be re-read."""
+
+    def __init__(self, hub: NotificationHub, channel: str):
+        self._hub = hub
+        self._channel = channel
+        self._listening = False
+        self._lock = asyncio.Lock()
+        self._subscribers: dict[int, set[asyncio.Queue]] = defaultdict(set)
+
+    async def subscribe(self, task_id: int) -> asyncio.Queue:
+        async with self._lock:
+            if not self._listening:
+                await self._hub.subscribe(
+                    self._channel, self._on_notification
+                )
+                self._listening = True
+        queue = asyncio.Queue()
+        self._subscribers[task_id].add(queue)
+        return queue
+
+    def unsubscribe(self, task_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(task_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[task_id]
+
+    def _on_notification(self, payload: str | None):
+        if payload is None:
+            for queues in self._subscribers.values():
+                for queue in queues:
+                    queue.put_nowait(None)
+            return
+        event = json.loads(payload)
+        for queue in self._subscribers.get(event["task_id"], ()):
+            queue.put_nowait(event)
+
+
+export_events_broker = ExportEventsBroker(
+    notification_hub, settings.EXPORT_EVENTS_CHANNEL
+)
+
+
+def task_event(task: ExportTask) -> dict:
+    return {
+        "task_id": task.id,
+        "status": task.status,
+        "export_table": task.export_table,
+        "url": task.file_path,
+        "created_at": task.created_at,
+        "updated_at": task.updated_at,
+    }
+
+
+def format_sse(data: dict, event: str = "status") -> str:
+    """SSE frame of a task event, dates are serialized the same way
+    whether the event was read by the ORM or notified by Postgres"""
+    data = ExportStatus.model_validate(data).model_dump_json()
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def stream_task_events(
+        task_id: int, initial: dict, queue: asyncio.Queue | None
+) -> AsyncIterator[str]:
+    """Yield SSE frames for the task until it reaches a terminal status"""
+    try:
+        yield format_sse(initial)
+        if queue is None or initial["status"] in TERMINAL_STATUSES:
+            return
+
+        last_status = initial["status"]
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), timeout=settings.SSE_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+
+            if event is None:
+                # listener reconnected, notifications may have been missed
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(
+                        select(ExportTask).where(ExportTask.id == task_id)
+                    )
+                    event = task_event(result.scalar_one())
+                if event["status"] == last_status:
+                    continue
+
+            last_status = event["status"]
+            yield format_sse(event)
+            if last_status in TERMINAL_STATUSES:
+                return
+    finally:
+        if queue is not None:
+            export_events_broker.unsubscribe(task_id, queue)
@@ -1,14 +1,18 @@
 import csv
+import time
 from datetime import datetime
 from pathlib import Path
 
 from fastapi import HTTPException, status
-from sqlalchemy import select, text
+from sqlalchemy import select, text, Select
 from sqlalchemy.orm import selectinload
 
 from config import settings
+from core.metrics import export_rows, export_bytes, export_duration, \
+    export_rows_per_second, export_bytes_per_second
 from database import AsyncSession
 from models import Company, ExportTask, PhoneNumber, Building, Category
+from rabbitmq.export_events import notify_task_status
 
 
 async def create_task(export_table, db: AsyncSession) -> ExportTask:
@@ -34,27 +38,50 @@ async def create_task(export_table, db: AsyncSession) -> ExportTask:
     return task
 
 
-async def process_task(db: AsyncSession, task_id: int):
+def export_query(table: str) -> Select:
+    """Rows of an export table with the relations its csv lists"""
+    match table:
+        case 'companies':
+            return select(Company).options(
+                selectinload(Company.phone_numbers),
+                selectinload(Company.categories)
+            )
+        case 'phone_numbers':
+            return select(PhoneNumber)
+        case 'buildings':
+            return select(Building)
+        case 'categories':
+            return select(Category).options(
+                selectinload(Category.children),
+                selectinload(Category.parent)
+            )
+        case _:
+            raise NotImplementedError(f'Export not available for {table}')
+
+
+async def process_task(
+        db: AsyncSession, task_id: int, read_db: AsyncSession | None = None
+):
+    """Export task table to csv. Task status is written through db,
+    table rows are read through read_db (a replica) when given"""
+    if read_db is None:
+        read_db = db
     task = await db.execute(
         select(ExportTask).where(ExportTask.id == task_id)
     )
     task = task.scalar_one()
 
+    started = time.perf_counter()
     try:
         task.status = 'processing'
+        await notify_task_status(task.id, db)
         await db.commit()
 
         table = task.export_table
+        result = await read_db.execute(export_query(table))
+        entries = result.scalars().all()
         match table:
             case 'companies':
-                result = await db.execute(
-                    select(Company)
-                    .options(
-                        selectinload(Company.phone_numbers),
-                        selectinload(Company.categories)
-                    )
-                )
-                entries = result.scalars().all()
                 first_row = [
                     'id', 'name', 'phone_numbers', 'building_id', 'categories'
                 ]
@@ -72,8 +99,6 @@ async def process_task(db: AsyncSession, task_id: int):
                     for ent in entries
                 ]
             case 'phone_numbers':
-                result = await db.execute(select(PhoneNumber))
-                entries = result.scalars().all()
                 first_row = [
                     'id', 'phone_number', 'company_id'
                 ]
@@ -82,8 +107,6 @@ async def process_task(db: AsyncSession, task_id: int):
                     for ent in entries
                 ]
             case 'buildings':
-                result = await db.execute(select(Building))
-                entries = result.scalars().all()
                 first_row = [
                     'id', 'address', 'coordinates'
                 ]
@@ -92,10 +115,6 @@ async def process_task(db: AsyncSession, task_id: int):
                     for ent in entries
                 ]
             case 'categories':
-                result = await db.execute(
-                    select(Category).options(selectinload(Category.children))
-                )
-                entries = result.scalars().all()
                 first_row = [
                     'id', 'name', 'parent_id', 'parent_name', 'children'
                 ]
@@ -109,8 +128,6 @@ async def process_task(db: AsyncSession, task_id: int):
                     ]
                     for ent in entries
                 ]
-            case _:
-                raise NotImplementedError(f'Export not available for {table}')
 
         date_now = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'export_{table}_{date_now}.csv'
@@ -120,16 +137,33 @@ async def process_task(db: AsyncSession, task_id: int):
             writer = csv.writer(f)
             writer.writerow(first_row)
             writer.writerows(data_rows)
+        _record_export_metrics(
+            table, len(data_rows), filepath.stat().st_size,
+            time.perf_counter() - started
+        )
 
         task.status = 'completed'
         task.file_path = str(filepath)
+        await notify_task_status(task.id, db)
         await db.commit()
     except Exception as e:
         task.status = 'failed'
+        await notify_task_status(task.id, db)
         await db.commit()
         raise e
 
 
+def _record_export_metrics(
+        table: str, rows: int, size: int, elapsed: float
+):
+    export_rows.inc(table, amount=rows)
+    export_bytes.inc(table, amount=size)
+    export_duration.observe(table, value=elapsed)
+    if elapsed > 0:
+        export_rows_per_second.set(table, value=rows / elapsed)
+        export_bytes_per_second.set(table, value=size / elapsed)
+
+
 async def check_task(task_id: int, db: AsyncSession) -> ExportTask:
     result = await db.execute(
         select(ExportTask).where(ExportTask.id == task_id)
@@ -1,13 +1,16 @@
-import aio_pika
-
 from config import settings
 
 
 async def get_rabbitmq_connection():
+    # imported on the first export, aio_pika adds ~40 ms to API start-up
+    import aio_pika
+
     return await aio_pika.connect_robust(settings.RABBITMQ_URL)
 
 
 async def publish_export_task(task_id: int):
+    import aio_pika
+
     connection = await get_rabbitmq_connection()
     async with connection:
         channel = await connection.channel()
@@ -1,5 +1,7 @@
 from typing import AsyncGenerator
 
+import asyncpg
+import pytest
 import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
@@ -7,7 +9,10 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from config import settings
-from database import get_session
+from core.datagen import DataSpec, GeneratedData, generate
+from core.metrics import StatementCounter, instrument_engine
+from core.querylog import trace_engine
+from database import get_session, get_read_session
 from main import app
 from models import Base
 
@@ -16,11 +21,22 @@ TEST_DATABASE_URL = (f"postgresql+asyncpg://"
                      f"{settings.SQL_USER}:{settings.SQL_PASSWORD}"
                      f"@test_db:5432/test_db")
 
+# Generated catalogue for scale tests, away from the hand-made fixtures
+SCALE_SPEC = DataSpec(
+    companies=20_000, buildings=2_000, category_levels=(4, 3),
+    clusters=5, city_center=(82.9204, 55.0302), batch_size=5_000
+)
+
 # Create test engine
 test_engine = create_async_engine(
     TEST_DATABASE_URL, echo=False, poolclass=StaticPool
 )
 
+# requests report their statement count in X-SQL-Statements
+instrument_engine(test_engine)
+trace_engine(test_engine)
+settings.SQL_STATEMENTS_HEADER = True
+
 # Create test session
 TestingSessionLocal = sessionmaker(
     test_engine, class_=AsyncSession, expire_on_commit=False
@@ -57,9 +73,47 @@ async def client(db_session) -> AsyncGenerator[AsyncClient, None]:
         yield db_session
 
     app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_read_session] = override_get_session
     transport = ASGITransport(app=app)
     async with AsyncClient(
             transport=transport, base_url="http://test"
     ) as test_client:
         yield test_client
     app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def statements():
+    """Counts SQL statements on the test engine while the test runs, use
+    reset() to start counting after the setup"""
+    with StatementCounter(test_engine) as counter:
+        yield counter
+
+
+@pytest_asyncio.fixture(scope="module", loop_scope="session")
+async def scale_data(test_db) -> AsyncGenerator[GeneratedData, None]:
+    """SCALE_SPEC loaded through the generator, removed after the module"""
+    dsn = TEST_DATABASE_URL.replace("postgresql+asyncpg", "postgresql")
+    # triggers stay on, db_session may hold locks on the tables
+    data = await generate(dsn, SCALE_SPEC, workers=2, disable_triggers=False)
+
+    yield data
+
+    conn = await asyncpg.connect(dsn)
+    try:
+        companies = data.ids["companies"]
+        for table in (
+            "company_category_association", "phone_numbers"
+        ):
+            await conn.execute(
+                f"DELETE FROM {table} WHERE company_id BETWEEN $1 AND $2",
+                companies.start, companies.stop - 1
+            )
+        for table in ("companies", "buildings", "categories"):
+            ids = data.ids[table]
+            await conn.execute(
+                f"DELETE FROM {table} WHERE id BETWEEN $1 AND $2",
+                ids.start, ids.stop - 1
+            )
+    finally:
+        await conn.close()
@@ -0,0 +1,11 @@
+import pytest
+from fastapi import status
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_db_pool_status(client):
+    response = await client.get("/admin/db-pool")
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["checked_out"] >= 0
+    assert data["waiters"] == 0
@@ -3,6 +3,7 @@ import pytest_asyncio
 from fastapi import status
 from geoalchemy2 import WKTElement
 
+from config import settings
 from models import Building
 
 
@@ -28,6 +29,8 @@ async def test_create_building(client):
         }
     )
     assert response.status_code == status.HTTP_201_CREATED
+    # the insert only, no refresh
+    assert int(response.headers["x-sql-statements"]) == 1
     data = response.json()
     assert "id" in data
     assert data["address"] == "456 New St"
@@ -39,6 +42,7 @@ async def test_create_building(client):
 async def test_get_building_by_id(client, test_building):
     response = await client.get(f"/buildings/{test_building.id}")
     assert response.status_code == status.HTTP_200_OK, response
+    assert int(response.headers["x-sql-statements"]) <= 1
     data = response.json()
     assert data["address"] == test_building.address
     wkt_str = (f"POINT ({data["coordinates"]["longitude"]} "
@@ -51,3 +55,98 @@ async def test_get_building_by_id(client, test_building):
 async def test_get_nonexistent_building(client):
     response = await client.get("/buildings/999")
     assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert int(response.headers["x-sql-statements"]) <= 1
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_buildings_by_ids(client, test_building):
+    response = await client.get(
+        "/buildings", params=[("ids", "999999"), ("ids", test_building.id)]
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) == 1
+    data = response.json()
+    assert [bld["id"] for bld in data["buildings"]] == [test_building.id]
+    assert data["buildings"][0]["coordinates"]["longitude"] == 1.0
+    assert data["missing"] == [999999]
+
+    response = await client.get("/buildings", params={"ids": "1,x"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_bulk_import_buildings(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "IMPORT_DIR", tmp_path)
+    body = (
+        "address,longitude,latitude,key\n"
+        "1 Bulk St,37.61,55.75,reg-1\n"
+        "2 Bulk St,37.62,55.76,\n"
+        "3 Bulk St,37.63,55.77,reg-1\n"
+        "4 Bulk St,x,55.77,reg-4\n"
+        "5 Bulk St,37.65,55.79,3\n"
+    )
+    response = await client.post(
+        "/buildings/bulk", content=body,
+        headers={"Content-Type": "text/csv"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    # fixed number of set-based statements, COPY is not counted
+    assert int(response.headers["x-sql-statements"]) <= 8
+    data = response.json()
+    assert data["imported"] == 3
+    assert data["rejected"] == 2
+    # the keyless row on line 3 and the row keyed "3" are both returned
+    assert set(data["ids"]) == {"reg-1", "3"}
+    assert set(data["lines"]) == {"3"}
+    assert data["lines"]["3"] != data["ids"]["3"]
+
+    response = await client.get(f"/buildings/{data['ids']['reg-1']}")
+    assert response.json()["coordinates"] == {
+        "longitude": 37.61, "latitude": 55.75
+    }
+
+    feature = (
+        '\x1e{"type": "Feature", "id": "reg-5", "properties": '
+        '{"address": "5 Bulk St"}, "geometry": '
+        '{"type": "Point", "coordinates": [37.64, 55.78]}}\n'
+    )
+    response = await client.post(
+        "/buildings/bulk", content=feature,
+        headers={"Content-Type": "application/geo+json-seq"}
+    )
+    assert response.json()["imported"] == 1
+    assert list(response.json()["ids"]) == ["reg-5"]
+    assert response.json()["lines"] == {}
+    assert int(response.headers["x-sql-statements"]) <= 8
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_upsert_buildings_by_external_id(client):
+    record = {
+        "external_id": "registry-1",
+        "address": "1 Feed St",
+        "coordinates": {"longitude": 37.61, "latitude": 55.75},
+    }
+    response = await client.post(
+        "/buildings/upsert", json={"records": [record]}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) == 1
+    created = response.json()[0]
+    assert created["status"] == "created"
+
+    response = await client.post(
+        "/buildings/upsert", json={"records": [record, record]}
+    )
+    assert response.json() == [{**created, "status": "unchanged"}]
+    assert int(response.headers["x-sql-statements"]) == 1
+
+    record["address"] = "1 Feed St, corner"
+    response = await client.post(
+        "/buildings/upsert", json={"records": [record]}
+    )
+    assert response.json()[0] == {**created, "status": "updated"}
+
+    response = await client.get(f"/buildings/{created['id']}")
+    assert response.json()["address"] == "1 Feed St, corner"
+    assert int(response.headers["x-sql-statements"]) <= 1
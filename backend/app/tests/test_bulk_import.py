@@ -0,0 +1,92 @@
+import pytest
+
+from core.bulk_import import read_lines, csv_rows, ndjson_rows, RowError, \
+    CompanyImport, BuildingImport
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_lines_are_split_across_chunks():
+    lines = await collect(read_lines(stream(b"a,b\r\n1,", b"2\n3,4")))
+    assert lines == ["a,b", "1,2", "3,4"]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_csv_rows_keep_first_line_numbers():
+    body = (
+        b'name,building_id\n'
+        b'"Multi\nline",1\n'
+        b'\n'
+        b'short\n'
+        b'"Open,2\n'
+    )
+    rows = await collect(csv_rows(read_lines(stream(body))))
+    assert rows[0] == (2, {"name": "Multi\nline", "building_id": "1"})
+    assert rows[1][0] == 5 and isinstance(rows[1][1], RowError)
+    assert rows[2][0] == 6 and str(rows[2][1]) == "unterminated quoted value"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_ndjson_rows_report_bad_lines():
+    body = b'{"name": "A"}\n[1]\n{oops\n'
+    rows = await collect(ndjson_rows(read_lines(stream(body))))
+    assert rows[0] == (1, {"name": "A"})
+    assert str(rows[1][1]) == "row must be a JSON object"
+    assert str(rows[2][1]) == "invalid JSON"
+
+
+def test_company_rows_are_parsed_for_copy():
+    company_import = CompanyImport(db=None)
+    assert company_import.parse({
+        "name": " Cafe ", "building_id": "3",
+        "phone_numbers": "8 (902) 345-67-89; 9023456780",
+        "categories": "1;2"
+    }) == ("Cafe", 3, ["+79023456789", "+79023456780"], [1, 2])
+    assert company_import.parse(
+        {"name": "Cafe", "building_id": 3, "categories": [4]}
+    ) == ("Cafe", 3, [], [4])
+    for fields, error in (
+        ({"building_id": 1}, "name is required"),
+        ({"name": "Cafe"}, "building_id is required"),
+        ({"name": "Cafe", "building_id": "x"}, "building_id must be"),
+        ({"name": "Cafe", "building_id": 1, "phone_numbers": ["abc"]},
+         "invalid phone number: abc"),
+    ):
+        with pytest.raises(RowError, match=error):
+            company_import.parse(fields)
+
+
+def test_building_rows_accept_features_and_flat_rows():
+    building_import = BuildingImport(db=None)
+    assert building_import.parse({
+        "type": "Feature", "id": 17,
+        "geometry": {"type": "Point", "coordinates": [37.61, 55.75]},
+        "properties": {"address": "Tverskaya St, 1"}
+    }) == ("Tverskaya St, 1", 37.61, 55.75, "17")
+    assert building_import.parse({
+        "address": "Arbat St, 2", "longitude": "37.59", "latitude": "55.74"
+    }) == ("Arbat St, 2", 37.59, 55.74, None)
+    for fields, error in (
+        ({"longitude": 1, "latitude": 2}, "address is required"),
+        ({"address": "A", "longitude": 1}, "latitude are required"),
+        ({"address": "A", "longitude": 200, "latitude": 2}, "out of range"),
+        ({"type": "Feature", "geometry": {"type": "Polygon"}},
+         "must be a Point"),
+    ):
+        with pytest.raises(RowError, match=error):
+            building_import.parse(fields)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_geojson_sequence_separators_are_skipped():
+    body = b'\x1e{"type": "Feature"}\n'
+    rows = await collect(ndjson_rows(read_lines(stream(body))))
+    assert rows == [(1, {"type": "Feature"})]
@@ -0,0 +1,104 @@
+import pytest
+from fastapi import Request
+
+from api.v1.caching import make_etag, etag_matches
+from core import cache as cache_module
+from core.cache import LRUCache, RedisCache, on_catalogue_change
+
+
+class FakeRedis:
+    """Local stand-in for redis.asyncio.Redis"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, name):
+        return self.data.get(name)
+
+    async def set(self, name, value, px=None):
+        self.data[name] = value
+
+    async def delete(self, *names):
+        for name in names:
+            self.data.pop(name, None)
+
+    async def scan_iter(self, match):
+        for name in list(self.data):
+            if name.startswith(match.rstrip("*")):
+                yield name
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_lru_cache_evicts_least_recently_used():
+    evicted = []
+    cache = LRUCache(
+        max_entries=2, ttl=60, on_evict=lambda *entry: evicted.append(entry)
+    )
+    await cache.set("a", b"1")
+    await cache.set("b", b"2")
+    assert await cache.get("a") == b"1"
+    await cache.set("c", b"3")
+    assert await cache.get("b") is None
+    assert await cache.get("a") == b"1"
+    assert len(cache) == 2
+    cache.discard("a")
+    assert evicted == [("b", b"2"), ("a", b"1")]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_lru_cache_expires_entries():
+    cache = LRUCache(max_entries=10, ttl=60)
+    await cache.set("a", b"1", ttl=-1)
+    assert await cache.get("a") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_redis_cache_with_stand_in():
+    client = FakeRedis()
+    cache = RedisCache(client, ttl=60)
+    await cache.set("company:1", b"{}")
+    assert client.data == {"cache:company:1": b"{}"}
+    assert await cache.get("company:1") == b"{}"
+    await cache.delete("company:1", "company:2")
+    assert await cache.get("company:1") is None
+    await cache.set("company:3", b"{}")
+    await cache.clear()
+    assert client.data == {}
+
+
+def test_etag_matches_weak_comparison():
+    etag = make_etag("company:1", "2025-01-01 00:00:00", 2)
+    assert etag.startswith('W/"')
+
+    def request_with(header):
+        return Request({
+            "type": "http",
+            "headers": [(b"if-none-match", header.encode())],
+        })
+
+    assert etag_matches(request_with(etag), etag)
+    assert etag_matches(request_with(etag.removeprefix("W/")), etag)
+    assert etag_matches(request_with(f'"other", {etag}'), etag)
+    assert etag_matches(request_with("*"), etag)
+    assert not etag_matches(request_with('W/"other"'), etag)
+    assert etag != make_etag("company:1", "2025-01-01 00:00:00", 3)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_catalogue_notifications_drop_memory_entries(monkeypatch):
+    cache = LRUCache(max_entries=10, ttl=60)
+    monkeypatch.setattr(cache_module, "response_cache", cache)
+    for key in ("building:1", "building:2", "category:3",
+                "category-name:Food", "category-name:Cafes"):
+        await cache.set(key, b"{}")
+
+    on_catalogue_change('{"table": "buildings", "op": "UPDATE", "id": 1}')
+    assert await cache.get("building:1") is None
+    assert await cache.get("building:2") == b"{}"
+
+    on_catalogue_change('{"table": "categories", "op": "UPDATE", "id": 3}')
+    assert len(cache) == 1
+
+    on_catalogue_change(None)
+    assert len(cache) == 0
@@ -2,6 +2,7 @@ import pytest
 import pytest_asyncio
 from fastapi import status
 
+from core.cache import response_cache, category_key
 from models import Category
 
 
@@ -33,6 +34,8 @@ async def test_create_category(client):
         json={"name": "New Category", "parent_id": 0}
     )
     assert response.status_code == status.HTTP_201_CREATED
+    # the insert only, no refresh
+    assert int(response.headers["x-sql-statements"]) == 1
     data = response.json()
     assert data["name"] == "New Category"
 
@@ -47,6 +50,8 @@ async def test_create_child_category(client, test_category):
         }
     )
     assert response.status_code == status.HTTP_201_CREATED
+    # parent with its depth, then the insert
+    assert int(response.headers["x-sql-statements"]) == 2
     data = response.json()
     assert data["name"] == "Child Category"
     assert data["parent_id"] == test_category.id
@@ -56,6 +61,8 @@ async def test_create_child_category(client, test_category):
 async def test_get_category_by_id(client, test_category):
     response = await client.get(f"/categories/{test_category.id}")
     assert response.status_code == status.HTTP_200_OK
+    # version, category, children
+    assert int(response.headers["x-sql-statements"]) <= 3
     data = response.json()
     assert data["name"] == test_category.name
 
@@ -64,6 +71,7 @@ async def test_get_category_by_id(client, test_category):
 async def test_get_nonexistent_category(client):
     response = await client.get("/categories/999")
     assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert int(response.headers["x-sql-statements"]) <= 2
 
 
 @pytest.mark.asyncio(loop_scope="session")
@@ -72,6 +80,51 @@ async def test_search_categories_by_name(client, test_category):
         f"/categories/by-name/{test_category.name}"
     )
     assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) <= 2
     data = response.json()
     assert len(data) > 0
     assert data["name"] == test_category.name
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_cached_category_invalidated_on_child_create(
+        client, test_category
+):
+    response = await client.get(f"/categories/{test_category.id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) <= 3
+    assert await response_cache.get(category_key(test_category.id))
+
+    response = await client.post(
+        "/categories/",
+        json={"name": "Cached Child", "parent_id": test_category.id}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert int(response.headers["x-sql-statements"]) == 2
+    assert await response_cache.get(category_key(test_category.id)) is None
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_category_not_modified(client, test_category):
+    response = await client.get(f"/categories/{test_category.id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) <= 3
+    etag = response.headers["etag"]
+
+    response = await client.get(
+        f"/categories/{test_category.id}",
+        headers={"If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    # the version only
+    assert int(response.headers["x-sql-statements"]) == 1
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    response = await client.get(
+        f"/categories/{test_category.id}",
+        headers={"If-None-Match": 'W/"outdated"'}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) == 1
+    assert response.json()["name"] == test_category.name
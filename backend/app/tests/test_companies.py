@@ -1,8 +1,11 @@
+import asyncio
+
 import pytest
 import pytest_asyncio
 from fastapi import status
 from geoalchemy2 import WKTElement
 
+from config import settings
 from models import Company, Building, Category, PhoneNumber
 
 
@@ -58,6 +61,8 @@ async def test_create_company(client, test_data):
         }
     )
     assert response.status_code == status.HTTP_201_CREATED
+    # company, phones and category links in one statement
+    assert int(response.headers["x-sql-statements"]) == 1
     data = response.json()
     assert data["name"] == "New Company"
     assert data["phone_numbers"] == ["9876543210"]
@@ -65,10 +70,30 @@ async def test_create_company(client, test_data):
     assert data["categories"][0]["category_id"] == test_data["category"].id
 
 
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_company_with_repeated_category(client, test_data):
+    category_id = test_data["category"].id
+    response = await client.post(
+        "/companies/",
+        json={
+            "name": "Repeated Category Company",
+            "phone_numbers": [],
+            "building_id": test_data["building"].id,
+            "categories": [category_id, category_id]
+        }
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert [
+        cat["category_id"] for cat in response.json()["categories"]
+    ] == [category_id]
+
+
 @pytest.mark.asyncio(loop_scope="session")
 async def test_get_company_by_id(client, test_data):
     response = await client.get(f"/companies/{test_data['company'].id}")
     assert response.status_code == status.HTTP_200_OK
+    # version, company, phones, categories
+    assert int(response.headers["x-sql-statements"]) <= 4
     data = response.json()
     assert data[0]["name"] == test_data["company"].name
     assert data[0]["building_id"] == test_data["building"].id
@@ -79,6 +104,7 @@ async def test_get_company_by_id(client, test_data):
 async def test_get_nonexistent_company(client):
     response = await client.get("/companies/999")
     assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert int(response.headers["x-sql-statements"]) <= 2
 
 
 @pytest.mark.asyncio(loop_scope="session")
@@ -89,6 +115,7 @@ async def test_search_companies_by_name(client, test_data):
         params={"company_name": comp_name}
     )
     assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) <= 3
     data = response.json()
     assert data[0]["name"] == comp_name
 
@@ -104,11 +131,37 @@ async def test_search_companies_in_area(client, test_data):
         }
     )
     assert response.status_code == status.HTTP_200_OK
+    # geo cells, companies, phones, categories
+    assert int(response.headers["x-sql-statements"]) <= 4
     data = response.json()
     assert len(data) > 0
     assert data[0]["name"] == test_data["company"].name
 
 
+@pytest.mark.asyncio(loop_scope="session")
+async def test_search_companies_in_areas_batch(client, test_data):
+    near = {"radius": 1000, "longitude": 1.0, "latitude": 2.0}
+    far = {"radius": 10, "longitude": 50.0, "latitude": 50.0}
+    response = await client.post(
+        "/companies/search/in-area/batch",
+        json={"points": [near, far, {**near, "radius": 500}]}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) == 1
+    data = response.json()
+    company_id = test_data["company"].id
+    assert [r["company_ids"] for r in data["results"]] == [
+        [company_id], [], [company_id]
+    ]
+    assert data["results"][1]["longitude"] == 50.0
+    assert [cmp["id"] for cmp in data["companies"]] == [company_id]
+
+    response = await client.post(
+        "/companies/search/in-area/batch", json={"points": []}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
 @pytest.mark.asyncio(loop_scope="session")
 async def test_get_companies_by_category_id(client, test_data):
     cat_id = test_data['category'].id
@@ -116,6 +169,8 @@ async def test_get_companies_by_category_id(client, test_data):
         f"/companies/search/by-category-id?category_id={cat_id}"
     )
     assert response.status_code == status.HTTP_200_OK
+    # category, then companies, phones and children on each of 3 levels
+    assert int(response.headers["x-sql-statements"]) <= 8
     data = response.json()
     assert len(data) > 0
     assert data[0]["category_id"] == cat_id
@@ -134,6 +189,229 @@ async def test_advanced_search_companies(client, test_data):
         }
     )
     assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) == 1
     data = response.json()
     assert len(data) > 0
     assert data[0]["name"] == test_data["company"].name
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_company_etag_changes_with_phones(
+        client, db_session, test_data
+):
+    company_id = test_data["company"].id
+    response = await client.get(f"/companies/{company_id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) <= 4
+    etag = response.headers["etag"]
+
+    db_session.add(
+        PhoneNumber(company_id=company_id, phone_number="9998887766")
+    )
+    await db_session.commit()
+
+    response = await client.get(
+        f"/companies/{company_id}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["etag"] != etag
+    assert int(response.headers["x-sql-statements"]) <= 4
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_text_search_ranks_name_over_category(
+        client, db_session, test_data
+):
+    category = Category(name="Bakery")
+    db_session.add(category)
+    await db_session.commit()
+    building_id = test_data["building"].id
+    by_category = Company(
+        name="Morning Delights", building_id=building_id,
+        categories=[category]
+    )
+    by_name = Company(name="Bakery Corner", building_id=building_id)
+    db_session.add_all([by_category, by_name])
+    await db_session.commit()
+
+    response = await client.get(
+        "/companies/search/text", params={"q": "bakery", "limit": 50}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) == 1
+    ids = [item["id"] for item in response.json()]
+    assert ids.index(by_name.id) < ids.index(by_category.id)
+
+    response = await client.get(
+        "/companies/search/text", params={"q": "bakery -corner"}
+    )
+    assert by_name.id not in [item["id"] for item in response.json()]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_companies_by_ids(client, db_session, test_data):
+    other = Company(name="Other Company", building_id=test_data["building"].id)
+    db_session.add(other)
+    await db_session.commit()
+    first = test_data["company"].id
+
+    response = await client.get(
+        "/companies", params={"ids": f"{other.id},999999,{first}"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    # companies, phones, categories
+    assert int(response.headers["x-sql-statements"]) <= 3
+    data = response.json()
+    assert [cmp["id"] for cmp in data["companies"]] == [other.id, first]
+    assert data["companies"][1]["phone_numbers"] == ["1234567890"]
+    assert data["missing"] == [999999]
+
+    response = await client.get(
+        "/companies", params={"ids": ",".join(["1"] * 101)}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_bulk_import_companies(
+        client, db_session, test_data, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(settings, "IMPORT_DIR", tmp_path)
+    building_id = test_data["building"].id
+    category_id = test_data["category"].id
+    body = (
+        "name,building_id,phone_numbers,categories\n"
+        f'"Bulk One",{building_id},9023456789; 9023456780,{category_id}\n'
+        f"Bulk Two,{building_id},,\n"
+        f"No Building,999999,,\n"
+        f"Bad Category,{building_id},,999999\n"
+        f"Bad Phone,{building_id},abc,\n"
+    )
+    response = await client.post(
+        "/companies/bulk", content=body,
+        headers={"Content-Type": "text/csv"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    # fixed number of set-based statements, COPY is not counted
+    assert int(response.headers["x-sql-statements"]) <= 11
+    data = response.json()
+    assert data["imported"] == 2
+    assert data["rejected"] == 3
+
+    response = await client.get(f"/imports/errors/{data['errors_file']}")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.text.splitlines()[1:] == [
+        "4,building not found: 999999",
+        "5,categories not found: 999999",
+        "6,invalid phone number: abc",
+    ]
+
+    response = await client.get(
+        "/companies/search/by-company-name",
+        params={"company_name": "Bulk One"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    company = response.json()[0]
+    assert company["building_id"] == building_id
+    assert len(company["phone_numbers"]) == 2
+    assert company["categories"][0]["category_id"] == category_id
+
+    response = await client.post(
+        "/companies/bulk",
+        content=f'{{"name": "Bulk Three", "building_id": {building_id}}}\n',
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.json() == {
+        "imported": 1, "rejected": 0, "errors_file": None
+    }
+    assert int(response.headers["x-sql-statements"]) <= 11
+
+    response = await client.post(
+        "/companies/bulk", content="{}",
+        headers={"Content-Type": "application/json"}
+    )
+    assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_upsert_companies_by_external_id(client, test_data):
+    record = {
+        "external_id": "feed-1",
+        "name": "Feed Company",
+        "building_id": test_data["building"].id,
+        "phone_numbers": ["9023456789", "9023456780"],
+        "categories": [test_data["category"].id],
+    }
+    rejected = {**record, "external_id": "feed-2", "building_id": 999999}
+
+    response = await client.post(
+        "/companies/upsert", json={"records": [record, rejected]}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert int(response.headers["x-sql-statements"]) == 1
+    created, missing = response.json()
+    assert created["status"] == "created"
+    assert missing == {
+        "external_id": "feed-2", "id": None, "status": "rejected",
+        "error": "building not found"
+    }
+
+    response = await client.post(
+        "/companies/upsert", json={"records": [record]}
+    )
+    assert response.json()[0] == {**created, "status": "unchanged"}
+
+    record["phone_numbers"] = ["9023456780", "9023456781"]
+    record["categories"] = []
+    response = await client.post(
+        "/companies/upsert", json={"records": [record]}
+    )
+    assert response.json()[0] == {**created, "status": "updated"}
+
+    response = await client.get(f"/companies/{created['id']}")
+    assert int(response.headers["x-sql-statements"]) <= 4
+    company = response.json()[0]
+    assert len(company["phone_numbers"]) == 2
+    assert company["categories"] == []
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_statements_do_not_grow_with_results(
+        client, db_session, test_data
+):
+    parent = Category(name="Statements Parent")
+    db_session.add(parent)
+    await db_session.commit()
+    child = Category(name="Statements Child", parent_id=parent.id)
+    db_session.add(child)
+    await db_session.commit()
+
+    async def count_statements() -> int:
+        response = await client.get(
+            "/companies/search/by-category-id",
+            params={"category_id": parent.id}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        return int(response.headers["x-sql-statements"])
+
+    db_session.add(Company(
+        name="Statements 0", building_id=test_data["building"].id,
+        categories=[child]
+    ))
+    await db_session.commit()
+    few = await count_statements()
+
+    for n in range(1, 6):
+        company = Company(
+            name=f"Statements {n}", building_id=test_data["building"].id,
+            categories=[parent if n % 2 else child]
+        )
+        db_session.add(company)
+        await db_session.commit()
+        db_session.add(
+            PhoneNumber(company_id=company.id, phone_number=f"90000000{n:02}")
+        )
+    await db_session.commit()
+    # past the window in which the first result is shared
+    await asyncio.sleep(settings.SINGLEFLIGHT_GRACE_SECONDS * 2)
+    assert await count_statements() <= few
@@ -0,0 +1,105 @@
+import pytest
+from httpx import AsyncClient
+
+from core.datagen import DataSpec, GeneratedData, category_tree, \
+    category_leaves, batches, building_batch, company_batch
+
+SPEC = DataSpec(
+    companies=1_000, buildings=100, category_levels=(3, 2), batch_size=400
+)
+
+
+def lines(parts, table: str) -> list[str]:
+    data = {name: csv for name, _, csv in parts}
+    return data[table].decode().splitlines()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_category_tree_follows_levels():
+    tree = category_tree(SPEC)
+    assert len(tree) == 3 + 3 * 2
+    assert tree[0] == (None, "Category 1")
+    assert tree[3] == (0, "Category 1.1")
+    assert tree[8] == (2, "Category 3.2")
+    assert category_leaves(SPEC).tolist() == list(range(3, 9))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_batches_cover_all_rows():
+    assert batches(1_000, 400) == [(0, 0, 400), (1, 400, 400), (2, 800, 200)]
+    assert batches(0, 400) == []
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_batches_are_deterministic():
+    assert building_batch(SPEC, 1, 400, 400, 1) == \
+        building_batch(SPEC, 1, 400, 400, 1)
+    assert company_batch(SPEC, 2, 800, 200, 1, 1, 1) == \
+        company_batch(SPEC, 2, 800, 200, 1, 1, 1)
+    other = DataSpec(**{**SPEC.__dict__, "seed": 7})
+    assert company_batch(SPEC, 0, 0, 400, 1, 1, 1) != \
+        company_batch(other, 0, 0, 400, 1, 1, 1)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_company_batch_respects_spec():
+    parts = company_batch(SPEC, 0, 400, 400, 1001, 51, 11)
+    companies = [line.split(",") for line in lines(parts, "companies")]
+    assert [int(row[0]) for row in companies] == list(range(1401, 1801))
+    assert all(51 <= int(row[2]) < 151 for row in companies)
+
+    phones = {}
+    for line in lines(parts, "phone_numbers"):
+        number, company_id = line.split(",")
+        assert number.startswith("+79") and len(number) == 12
+        phones[company_id] = phones.get(company_id, 0) + 1
+    assert max(phones.values()) <= 3
+
+    links = [
+        tuple(map(int, line.split(",")))
+        for line in lines(parts, "company_category_association")
+    ]
+    assert len(links) == len(set(links))
+    assert {category for _, category in links} <= set(range(14, 20))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_buildings_gather_around_clusters():
+    parts = building_batch(SPEC, 0, 0, 400, 1)
+    lon, lat = SPEC.city_center
+    for line in lines(parts, "buildings"):
+        x, y = map(float, line.rsplit("(", 1)[1].rstrip(")").split())
+        assert abs(x - lon) < 1 and abs(y - lat) < 0.5
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio(loop_scope="session")
+async def test_scale_data_is_loaded(
+        client: AsyncClient, scale_data: GeneratedData
+):
+    spec = scale_data.spec
+    assert scale_data.rows["companies"] == spec.companies
+    assert scale_data.rows["buildings"] == spec.buildings
+    assert scale_data.rows["categories"] == len(category_tree(spec))
+
+    ids = list(scale_data.ids["companies"])[:100]
+    response = await client.get(
+        "/companies", params={"ids": ",".join(map(str, ids))}
+    )
+    assert response.status_code == 200
+    assert [cmp["id"] for cmp in response.json()["companies"]] == ids
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio(loop_scope="session")
+async def test_area_search_at_scale(
+        client: AsyncClient, scale_data: GeneratedData
+):
+    lon, lat = scale_data.spec.city_center
+    response = await client.post("/companies/search/in-area", json={
+        "radius": 500, "longitude": lon, "latitude": lat
+    })
+    assert response.status_code == 200
+    found = response.json()
+    assert found
+    assert all(cmp["id"] in scale_data.ids["companies"] for cmp in found)
@@ -1,4 +1,7 @@
 import asyncio
+import csv
+import io
+from datetime import datetime
 from unittest.mock import AsyncMock, patch
 
 import pytest
@@ -7,6 +10,7 @@ from fastapi import status
 from geoalchemy2 import WKTElement
 
 from models import Company, Building, Category, PhoneNumber
+from rabbitmq.export_events import ExportEventsBroker, format_sse
 from rabbitmq.export_service import process_task
 
 
@@ -64,22 +68,30 @@ async def test_export_data(db_session):
 
 
 @pytest.mark.asyncio(loop_scope="session")
-async def test_create_and_check_export(client, db_session, test_export_data):
+async def test_create_and_check_export(
+        client, db_session, test_export_data, statements
+):
     response = await client.post(
         "/export/", params={"export_table": "companies"}
     )
     assert response.status_code == status.HTTP_200_OK
+    # table check, task insert
+    assert int(response.headers["x-sql-statements"]) == 2
     data = response.json()
 
     task_id = data["task_id"]
     assert data["status"] == "pending"
 
     # imitate bg_task from router and wait for task to be finished
+    statements.reset()
     await process_task(db_session, task_id)
+    # task, 2 x (status update, notify), companies, phones, categories
+    assert statements.count <= 8, statements.statements
     await asyncio.sleep(0.5)
 
     response_check = await client.get(f"/export/status/{task_id}")
     assert response_check.status_code == status.HTTP_200_OK
+    assert int(response_check.headers["x-sql-statements"]) == 1
     assert response_check.json()["status"] == "completed"
 
 
@@ -101,4 +113,94 @@ async def test_download_export_result(client, db_session, test_export_data):
         f"/export/download/{data_create['task_id']}"
     )
     assert response_download.status_code == status.HTTP_200_OK
+    assert int(response_download.headers["x-sql-statements"]) == 1
     assert "text/csv" in response_download.headers["content-type"]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_export_events_for_finished_task(
+        client, db_session, test_export_data
+):
+    response_create = await client.post(
+        "/export/", params={"export_table": "companies"}
+    )
+    assert response_create.status_code == status.HTTP_200_OK
+    task_id = response_create.json()["task_id"]
+    await process_task(db_session, task_id)
+
+    response = await client.get(f"/export/events/{task_id}")
+    assert response.status_code == status.HTTP_200_OK
+    # a finished task is not re-read
+    assert int(response.headers["x-sql-statements"]) == 1
+    assert "text/event-stream" in response.headers["content-type"]
+    assert response.text.startswith("event: status\n")
+    assert '"status": "completed"' in response.text
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_categories_export_loads_parents_with_one_statement(
+        client, db_session, statements
+):
+    parent = Category(name="Export Parent")
+    db_session.add(parent)
+    await db_session.commit()
+    db_session.add_all([
+        Category(name=f"Export Child {n}", parent_id=parent.id)
+        for n in range(5)
+    ])
+    await db_session.commit()
+    response = await client.post(
+        "/export/", params={"export_table": "categories"}
+    )
+    task_id = response.json()["task_id"]
+
+    statements.reset()
+    await process_task(db_session, task_id)
+    # task, 2 x (status update, notify), categories, children, parents
+    assert statements.count <= 8, statements.statements
+
+    response = await client.get(f"/export/download/{task_id}")
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0][3] == "parent_name"
+    assert all(
+        row[3] == "Export Parent"
+        for row in rows[1:] if row[1].startswith("Export Child")
+    )
+    parent_row = next(row for row in rows if row[1] == "Export Parent")
+    assert parent_row[4].count("Export Child") == 5
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_export_events_broker_fan_out():
+    hub = AsyncMock()
+    broker = ExportEventsBroker(hub, "export_tasks")
+    first = await broker.subscribe(1)
+    second = await broker.subscribe(1)
+    other = await broker.subscribe(2)
+    hub.subscribe.assert_awaited_once()
+
+    broker._on_notification('{"task_id": 1, "status": "completed"}')
+    assert first.get_nowait()["status"] == "completed"
+    assert second.get_nowait()["status"] == "completed"
+    assert other.empty()
+
+    broker._on_notification(None)
+    assert first.get_nowait() is None
+    assert other.get_nowait() is None
+
+    broker.unsubscribe(1, first)
+    broker.unsubscribe(1, second)
+    broker._on_notification('{"task_id": 1, "status": "failed"}')
+    assert first.empty()
+
+
+def test_sse_frames_share_date_format():
+    event = {
+        "task_id": 1, "status": "pending", "export_table": "companies",
+        "url": None, "created_at": datetime(2026, 10, 19, 6, 49, 19, 123000),
+        "updated_at": None,
+    }
+    # as json_build_object renders the same row
+    notified = {**event, "created_at": "2026-10-19T06:49:19.123"}
+    assert format_sse(event) == format_sse(notified)
+    assert '"created_at":"2026-10-19T06:49:19.123000"' in format_sse(event)
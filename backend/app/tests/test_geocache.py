@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from core.geocache import GeoCellCache, Cell, encode, covering_cells, \
+    haversine
+
+
+async def cache_cell(cache: GeoCellCache, cell: str, entry: Cell):
+    """Caches a cell the way a load does"""
+    await cache._cells.set(cell, entry)
+    cache._building_cells.update(dict.fromkeys(entry.building_ids, cell))
+    cache._company_cells.update(
+        dict.fromkeys((row[0] for row in entry.rows), cell)
+    )
+
+
+async def cached_cache(
+        lon: float, lat: float, rows: tuple, building_ids: tuple = (),
+        max_entries: int = 100
+) -> GeoCellCache:
+    """Cache with every cell around the point loaded, rows in its cell"""
+    cache = GeoCellCache(
+        precision=6, max_cells=24, ttl=60, max_entries=max_entries
+    )
+    for cell, _ in covering_cells(lon, lat, 1000, 6, 24):
+        await cache._cells.set(cell, Cell((), ()))
+    await cache_cell(cache, encode(lon, lat, 6), Cell(rows, building_ids))
+    return cache
+
+
+def test_encode_matches_reference_geohash():
+    assert encode(-5.6, 42.6, 5) == "ezs42"
+    assert encode(37.6176, 55.7558, 6) == "ucfv0n"
+
+
+def test_covering_cells_contain_circle():
+    lon, lat, radius = 37.6176, 55.7558, 1000
+    cells = dict(covering_cells(lon, lat, radius, 6, 24))
+    assert encode(lon, lat, 6) in cells
+    # points on the circle fall into covered cells
+    for dlon, dlat in ((0.0159, 0), (-0.0159, 0), (0, 0.0089), (0, -0.0089)):
+        assert haversine(lon, lat, lon + dlon, lat + dlat) <= radius
+        assert encode(lon + dlon, lat + dlat, 6) in cells
+
+
+def test_covering_cells_bypass_wide_or_invalid_searches():
+    assert covering_cells(37.6, 55.7, 50000, 6, 24) is None
+    assert covering_cells(100.0, 100.0, 1000, 6, 24) is None
+    assert covering_cells(179.999, 0.0, 1000, 6, 24) is None
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_cached_cells_answer_without_query():
+    lon, lat = 37.6176, 55.7558
+    cache = await cached_cache(
+        lon, lat, ((1, lon, lat), (2, lon + 0.05, lat)), building_ids=(10,)
+    )
+    near = encode(lon, lat, 6)
+
+    # db is not touched when every cell is cached
+    assert await cache.find_company_ids(lon, lat, 1000, db=None) == [1]
+
+    cache.invalidate_building(10)
+    assert await cache._cells.get(near) is None
+    # the other ids of the cell went with it
+    assert cache._company_cells == {}
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_rows_near_the_radius_are_checked_in_sql(monkeypatch):
+    lon, lat = 37.6176, 55.7558
+    # about 998 and 1002 m away, spheroid distances may differ by more
+    rows = ((1, lon, lat), (2, lon, lat + 0.008975), (3, lon, lat + 0.009011))
+    cache = await cached_cache(lon, lat, rows)
+    checked = []
+
+    async def within(lon, lat, radius, company_ids, db):
+        checked.extend(company_ids)
+        return company_ids[:1]
+
+    monkeypatch.setattr(cache, "_within", within)
+    assert await cache.find_company_ids(lon, lat, 1000, db=None) == [1, 2]
+    assert checked == [2, 3]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_catalogue_notifications_drop_cells(monkeypatch):
+    lon, lat = 37.6176, 55.7558
+    near = encode(lon, lat, 6)
+    cache = await cached_cache(lon, lat, ((1, lon, lat),))
+    located = []
+
+    async def invalidate_located(key, ids):
+        located.append((key.class_.__name__, ids))
+
+    monkeypatch.setattr(cache, "_invalidate_located", invalidate_located)
+    # the company moved to a building outside the cached cells
+    cache.on_notification('{"table": "companies", "op": "UPDATE", "id": 1}')
+    assert await cache._cells.get(near) is None
+
+    await cache_cell(cache, near, Cell((), (10,)))
+    cache.on_notification('{"table": "buildings", "op": "UPDATE", "id": 10}')
+    assert await cache._cells.get(near) is None
+    await asyncio.gather(*cache._tasks)
+    assert located == [("Company", [1]), ("Building", [10])]
+
+    await cache._cells.set(near, Cell((), ()))
+    cache.on_notification('{"table": "buildings", "op": "RELOAD"}')
+    await asyncio.gather(*cache._tasks)
+    assert len(cache._cells) == 0
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_evicted_cells_take_their_ids():
+    lon, lat = 37.6176, 55.7558
+    cache = await cached_cache(
+        lon, lat, ((1, lon, lat),), building_ids=(10,), max_entries=1
+    )
+    assert cache._company_cells and cache._building_cells
+    await cache_cell(cache, encode(lon + 1, lat, 6), Cell((), (11,)))
+    assert cache._company_cells == {}
+    assert list(cache._building_cells) == [11]
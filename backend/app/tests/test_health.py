@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+from fastapi import status
+
+from api.v1.routers import health
+from core.warmup import WarmUp
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_ready_after_background_steps():
+    warm_up = WarmUp()
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_step():
+        started.set()
+        await release.wait()
+
+    async def failing_step():
+        raise OSError("connection refused")
+
+    assert await warm_up.run("fast", lambda: asyncio.sleep(0))
+    assert await warm_up.run("failing", failing_step, (OSError,)) is False
+    warm_up.run_in_background("slow", slow_step)
+    warm_up.mark_serving()
+    await started.wait()
+    assert not warm_up.ready
+    assert warm_up.status()["steps"]["slow"] is None
+
+    release.set()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    status_report = warm_up.status()
+    assert warm_up.ready and status_report["ready"]
+    assert status_report["ready_after"] is not None
+    assert status_report["errors"] == {"failing": "connection refused"}
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_stop_cancels_background_steps():
+    warm_up = WarmUp()
+    warm_up.run_in_background("forever", asyncio.Event().wait)
+    await asyncio.sleep(0)
+    await warm_up.stop()
+    assert not warm_up._tasks
+    assert warm_up.status()["steps"]["forever"] is not None
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_liveness(client):
+    response = await client.get("/health/live")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"status": "ok"}
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_readiness_waits_for_warm_up(client, db_session, monkeypatch):
+    warm_up = WarmUp()
+    monkeypatch.setattr(health, "warm_up", warm_up)
+
+    response = await client.get("/health/ready")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.json()["database"] is True
+
+    warm_up.mark_serving()
+    response = await client.get("/health/ready")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["ready"] is True
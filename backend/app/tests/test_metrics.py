@@ -0,0 +1,41 @@
+import pytest
+from fastapi import status
+
+from core.metrics import Counter, Histogram
+
+
+def test_histogram_render():
+    histogram = Histogram(
+        "test_seconds", "Test histogram", labels=("route",),
+        buckets=(0.1, 1.0)
+    )
+    histogram.observe("/a", value=0.05)
+    histogram.observe("/a", value=0.5)
+    histogram.observe("/a", value=3)
+    lines = histogram.render()
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/a"} 3' in lines
+
+
+def test_counter_render():
+    counter = Counter("test_total", "Test counter", labels=("table",))
+    counter.inc("companies", amount=10)
+    counter.inc("companies", amount=5)
+    assert 'test_total{table="companies"} 15' in counter.render()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_metrics_endpoint_reports_db_usage(client, db_session):
+    response = await client.get("/categories/999")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = await client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert "text/plain" in response.headers["content-type"]
+    assert ('http_request_duration_seconds_count{method="GET",'
+            'route="/categories/{category_id}",status="404"}'
+            in response.text)
+    assert 'db_statements_per_request_count{route="/categories/' \
+           '{category_id}"}' in response.text
@@ -0,0 +1,239 @@
+import io
+import os
+import subprocess
+import sys
+import tarfile
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.dialects import postgresql
+
+from config import settings
+from core.datagen import GeneratedData
+from core.explain import PLAN_CASES, Explain, summarize, find_regressions, \
+    load_baseline, save_baseline, explain_cases
+from core.repositories.companies import CompaniesQuerybuilder
+
+REPO_DIR = Path(__file__).resolve().parents[3]
+# branches PLAN_BASELINE_REVISION defaults to the merge base with
+BASE_BRANCHES = ("origin/main", "main")
+RECORD_BASELINES = """
+import asyncio, sys
+from pathlib import Path
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from core.explain import explain_cases
+
+async def record(url, directory, company_id):
+    engine = create_async_engine(url)
+    async with AsyncSession(engine) as db:
+        await explain_cases(db, None, Path(directory), company_id, "all")
+    await engine.dispose()
+
+asyncio.run(record(sys.argv[1], sys.argv[2], int(sys.argv[3])))
+"""
+
+
+def node(node_type: str, estimated: int, actual: int, *children, **extra):
+    return {
+        "Node Type": node_type, "Plan Rows": estimated,
+        "Actual Rows": actual, "Plans": list(children), **extra
+    }
+
+
+INDEX_PLAN = {
+    "Plan": node(
+        "Nested Loop", 10, 12,
+        node("Seq Scan", 5, 4, **{"Relation Name": "categories"}),
+        node("Index Scan", 2, 3, **{
+            "Relation Name": "companies", "Index Name": "ix_companies_id"
+        }),
+        **{"Shared Hit Blocks": 40, "Shared Read Blocks": 2}
+    ),
+    "Planning Time": 0.2,
+    "Execution Time": 1.5,
+}
+SEQ_PLAN = {
+    "Plan": node(
+        "Hash Join", 10, 5000,
+        node("Seq Scan", 20000, 20000, **{"Relation Name": "companies"}),
+        node("Seq Scan", 5, 4, **{"Relation Name": "categories"}),
+    ),
+    "Planning Time": 0.3,
+    "Execution Time": 25.0,
+}
+ROWS = {"companies": 20000, "categories": 16}
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_summarize_plan():
+    summary = summarize(INDEX_PLAN)
+    assert summary["seq_scans"] == ["categories"]
+    assert summary["indexes"] == ["ix_companies_id"]
+    # nodes under MIN_ESTIMATE_ROWS are not checked
+    assert summary["misestimate"] == 1.0
+    assert summary["shared_hit"] == 40 and summary["shared_read"] == 2
+    assert summary["execution_ms"] == 1.5
+
+    summary = summarize(SEQ_PLAN)
+    assert summary["seq_scans"] == ["categories", "companies"]
+    assert summary["misestimate"] == 500.0
+    assert summary["misestimated_node"] == "Hash Join"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_seq_scan_of_large_table_is_flagged():
+    summary = summarize(SEQ_PLAN)
+    assert find_regressions(summary, None, ROWS) == [
+        "sequential scan of companies (~20000 rows)"
+    ]
+    assert find_regressions(summary, None, ROWS, ("companies",)) == []
+    # small tables and scans the baseline already did are not flagged
+    assert find_regressions(summarize(INDEX_PLAN), None, ROWS) == []
+    assert find_regressions(summary, summary, ROWS) == []
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_lost_index_and_estimate_blowup_are_flagged():
+    problems = find_regressions(
+        summarize(SEQ_PLAN), summarize(INDEX_PLAN), ROWS
+    )
+    assert problems == [
+        "sequential scan of companies (~20000 rows)",
+        "index ix_companies_id is no longer used",
+        "Hash Join rows estimate off by 500x, baseline 1x",
+    ]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_estimate_blowup_is_relative_to_baseline():
+    baseline = {**summarize(SEQ_PLAN), "misestimate": 200.0}
+    summary = summarize(SEQ_PLAN)
+    assert find_regressions(summary, baseline, ROWS) == []
+    baseline["misestimate"] = 20.0
+    assert find_regressions(summary, baseline, ROWS) == [
+        "Hash Join rows estimate off by 500x, baseline 20x"
+    ]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_baseline_round_trip(tmp_path):
+    assert load_baseline(tmp_path, "advanced:name+location") is None
+    summary = summarize(INDEX_PLAN)
+    save_baseline(tmp_path, "advanced:name+location", INDEX_PLAN, summary)
+    assert load_baseline(tmp_path, "advanced:name+location") == summary
+    assert [p.name for p in tmp_path.iterdir()] == [
+        "advanced_name_location.json"
+    ]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_explain_wraps_repository_statement():
+    q, _ = CompaniesQuerybuilder.get_companies_by_ids_query([1, 2])
+    sql = str(Explain(q).compile(dialect=postgresql.dialect()))
+    assert sql.startswith("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT")
+    assert "companies.id IN" in sql
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_plan_cases_cover_advanced_shapes():
+    names = [case.name for case in PLAN_CASES]
+    assert len(names) == len(set(names))
+    for shape in CompaniesQuerybuilder.common_advanced_shapes:
+        assert "advanced:" + "+".join(shape) in names
+
+
+def baseline_revision() -> str | None:
+    """Revision whose statements' plans are the baseline: the one
+    PLAN_BASELINE_REVISION names, CI sets it to the branch a change
+    merges into, or the merge base with main"""
+    revision = os.environ.get("PLAN_BASELINE_REVISION")
+    if revision:
+        return revision
+    for branch in BASE_BRANCHES:
+        merge_base = subprocess.run(
+            ["git", "-C", str(REPO_DIR), "merge-base", "HEAD", branch],
+            capture_output=True, text=True
+        )
+        if merge_base.returncode == 0:
+            return merge_base.stdout.strip()
+    return None
+
+
+def sample_company(data: GeneratedData) -> int:
+    return data.ids["companies"][data.spec.companies // 2]
+
+
+@pytest.fixture(scope="module")
+def plan_baselines(
+        db_session, scale_data: GeneratedData, tmp_path_factory
+) -> tuple[str, Path]:
+    """The baseline revision and the plans of its statements on the
+    scale data, recorded by a checkout of it in a temporary directory"""
+    revision = baseline_revision()
+    if revision is None:
+        pytest.skip(
+            "set PLAN_BASELINE_REVISION, no main branch to compare with"
+        )
+    root = tmp_path_factory.mktemp("baseline")
+    archive = subprocess.run(
+        ["git", "-C", str(REPO_DIR), "archive", revision, "backend/app"],
+        capture_output=True, check=True
+    ).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(root, filter="data")
+    app_dir = root / "backend" / "app"
+    subprocess.run(
+        [sys.executable, "-c", RECORD_BASELINES,
+         db_session.bind.url.render_as_string(hide_password=False),
+         str(root / "plans"), str(sample_company(scale_data))],
+        cwd=app_dir, env={**os.environ, "PYTHONPATH": str(app_dir)},
+        check=True
+    )
+    return revision, root / "plans"
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("case", PLAN_CASES, ids=lambda case: case.name)
+async def test_plan_has_no_regressions(
+        db_session, scale_data: GeneratedData,
+        plan_baselines: tuple[str, Path], case
+):
+    revision, directory = plan_baselines
+    [report] = await explain_cases(
+        db_session, [case], directory, company_id=sample_company(scale_data)
+    )
+    assert report["baseline"], f"{revision} has no {case.name} plan"
+    assert report["problems"] == []
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio(loop_scope="session")
+async def test_query_plans_endpoint(
+        client: AsyncClient, scale_data: GeneratedData, tmp_path,
+        monkeypatch
+):
+    monkeypatch.setattr(settings, "PLAN_BASELINE_DIR", tmp_path)
+    params = {
+        "case": ["company:id", "advanced:name"],
+        "company_id": scale_data.ids["companies"][0],
+    }
+    response = await client.get("/admin/query-plans", params=params)
+    assert response.status_code == 200
+    reports = response.json()
+    assert [report["case"] for report in reports] == params["case"]
+    assert not any(report["baseline"] for report in reports)
+
+    response = await client.post(
+        "/admin/query-plans/baseline", params=params
+    )
+    assert response.status_code == 200
+    response = await client.get("/admin/query-plans", params=params)
+    assert all(report["baseline"] for report in response.json())
+    assert len(list(tmp_path.iterdir())) == 2
+
+    response = await client.get(
+        "/admin/query-plans", params={"case": "no-such-case"}
+    )
+    assert response.status_code == 400
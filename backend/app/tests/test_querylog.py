@@ -0,0 +1,84 @@
+import json
+import logging
+
+import pytest
+from fastapi import status
+
+from config import settings
+from core.querylog import RequestTrace, SlowRequestTraces, params_shape, \
+    slow_traces
+
+
+def trace(rid: str) -> RequestTrace:
+    return RequestTrace(rid, "GET", f"/companies/{rid}", scope={})
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_params_shape_hides_values():
+    assert params_shape({"name": "Cafe", "ids": [1, 2, 3], "lon": 1.5}) == {
+        "name": "str", "ids": "list[3]", "lon": "float"
+    }
+    assert params_shape((7, "abc", None)) == ["int", "str", "NoneType"]
+    assert params_shape([(1, "a"), (2, "b")], executemany=True) == {
+        "rows": 2, "row": ["int", "str"]
+    }
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_slowest_requests_of_a_minute_are_kept(monkeypatch):
+    monkeypatch.setattr(settings, "SLOW_TRACES_PER_MINUTE", 2)
+    traces = SlowRequestTraces()
+    for rid, duration in (("a", 0.3), ("b", 0.1), ("c", 0.5), ("d", 0.2)):
+        traces.offer(trace(rid), duration, 200)
+    kept = traces.snapshot()
+    assert [t["request_id"] for t in kept] == ["c", "a"]
+    assert kept[0]["duration_ms"] == 500.0
+
+    monkeypatch.setattr(settings, "SLOW_TRACES_PER_MINUTE", 0)
+    traces.clear()
+    traces.offer(trace("e"), 1.0, 200)
+    assert traces.snapshot() == []
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_slow_statements_are_logged_with_request_id(
+        client, db_session, caplog, monkeypatch
+):
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="slow_queries"):
+        response = await client.get(
+            "/categories/987654", headers={"X-Request-ID": "slow-1"}
+        )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.headers["x-request-id"] == "slow-1"
+
+    records = [
+        json.loads(record.getMessage()) for record in caplog.records
+        if record.name == "slow_queries"
+    ]
+    assert records
+    for record in records:
+        assert record["request_id"] == "slow-1"
+        assert record["route"] == "/categories/{category_id}"
+        assert "987654" not in json.dumps(record)
+        assert record["duration_ms"] >= 0
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_slow_requests_endpoint_lists_traces(
+        client, db_session, monkeypatch
+):
+    monkeypatch.setattr(settings, "SLOW_TRACES_PER_MINUTE", 1000)
+    slow_traces.clear()
+    response = await client.get("/companies/987654")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    request_id = response.headers["x-request-id"]
+
+    response = await client.get("/admin/slow-requests")
+    assert response.status_code == status.HTTP_200_OK
+    [traced] = [
+        t for t in response.json() if t["request_id"] == request_id
+    ]
+    assert traced["route"] == "/companies/{company_id}"
+    assert traced["status"] == 404
+    assert traced["statement_count"] == len(traced["statements"]) >= 1
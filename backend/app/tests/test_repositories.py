@@ -3,11 +3,14 @@ import pytest_asyncio
 from fastapi import status
 from geoalchemy2 import WKTElement
 from geoalchemy2.shape import to_shape
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT
 
 from core.repositories.buildings import BuildingsQueries
 from core.repositories.categories import CategoriesQueries
 from core.repositories.companies import CompaniesQueries, CompaniesQuerybuilder
-from models import Company, Building, Category, PhoneNumber
+from core.statement_cache import warm_up_statement_cache
+from models import Company, Building, Category, PhoneNumber, CompanySearch
 
 
 @pytest_asyncio.fixture
@@ -71,6 +74,27 @@ async def test_create_company(db_session, test_repo_data):
     assert company.categories[0].name == test_repo_data["parent_category"].name
 
 
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_company_persists_phones_and_categories(
+        db_session, test_repo_data
+):
+    category_id = test_repo_data["parent_category"].id
+    company = await CompaniesQueries.create_company(
+        name="Stored Company",
+        phone_numbers=["9876543210", "9023456789"],
+        building_id=test_repo_data["building"].id,
+        categories=[category_id, category_id],
+        db=db_session
+    )
+
+    stored = (await CompaniesQueries.get_companies(company.id, db_session))[0]
+    assert stored.name == "Stored Company"
+    assert sorted(num.e164 for num in (
+        phone.phone_number for phone in stored.phone_numbers
+    )) == ["+79023456789", "+79876543210"]
+    assert [cat.id for cat in stored.categories] == [category_id]
+
+
 @pytest.mark.asyncio(loop_scope="session")
 async def test_get_companies_by_id(db_session, test_repo_data):
     companies = await CompaniesQueries.get_companies(
@@ -128,6 +152,26 @@ async def test_advanced_search_companies(db_session, test_repo_data):
     assert any(c.id == test_repo_data["company"].id for c in companies)
 
 
+@pytest.mark.asyncio(loop_scope="session")
+async def test_search_document_follows_source_tables(
+        db_session, test_repo_data
+):
+    company = test_repo_data["company"]
+    doc = await db_session.get(CompanySearch, company.id)
+    assert doc.name == company.name
+    assert doc.building_id == test_repo_data["building"].id
+    assert sorted(doc.category_ids) == sorted(
+        [test_repo_data["parent_category"].id,
+         test_repo_data["child_category"].id]
+    )
+    assert "1234567890" in doc.phone_digits
+
+    test_repo_data["parent_category"].name = "Renamed Category"
+    await db_session.commit()
+    await db_session.refresh(doc)
+    assert "Renamed Category" in doc.category_names
+
+
 # QueryBuilder Tests
 def test_company_query_builder():
     # Test ID query
@@ -143,6 +187,22 @@ def test_company_query_builder():
     assert str(filter_expr).find("ST_DWithin") > 0
 
 
+def test_advanced_search_query_reuses_statement_shape():
+    query, params = CompaniesQuerybuilder.get_companies_advanced_search_query(
+        "Cafe", 1, None, None, None, (1.0, 2.0, 500)
+    )
+    same_shape, other_params = (
+        CompaniesQuerybuilder.get_companies_advanced_search_query(
+            "Bank", 2, None, None, None, (3.0, 4.0, 100)
+        )
+    )
+    assert query is same_shape
+    assert params == {"name_pattern": "%Cafe%", "category_id": 1,
+                      "lon": 1.0, "lat": 2.0, "radius": 500}
+    assert other_params["name_pattern"] == "%Bank%"
+    assert "POINT" not in str(query)
+
+
 # Error Cases
 @pytest.mark.asyncio(loop_scope="session")
 async def test_get_nonexistent_company(db_session):
@@ -232,3 +292,24 @@ async def test_get_category_by_id(db_session, test_repo_data):
     )
     assert category.id == test_repo_data["parent_category"].id
     assert category.name == test_repo_data["parent_category"].name
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_warm_up_compiles_session_statements(test_db, db_session):
+    test_db.sync_engine._compiled_cache.clear()
+    assert await warm_up_statement_cache(test_db) > 0
+
+    cache_hits = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        cache_hits.append(context.cache_hit)
+
+    event.listen(test_db.sync_engine, "after_cursor_execute", record)
+    try:
+        query, params = CompaniesQuerybuilder.get_companies_by_ids_query(
+            [-1]
+        )
+        await db_session.execute(query, params)
+    finally:
+        event.remove(test_db.sync_engine, "after_cursor_execute", record)
+    assert cache_hits == [CACHE_HIT]
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from core.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight(grace=0)
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [calls]
+
+    results = await asyncio.gather(
+        *(flight.do(("query", 1), query) for _ in range(10))
+    )
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert len(flight) == 0
+
+    await flight.do(("query", 1), query)
+    assert calls == 2
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_grace_window_and_errors():
+    flight = SingleFlight(grace=0.05)
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    outcomes = await asyncio.gather(
+        flight.do(("failing",), failing), flight.do(("failing",), failing),
+        return_exceptions=True
+    )
+    assert calls == 1
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    # errors are not kept for late callers
+    with pytest.raises(ValueError):
+        await flight.do(("failing",), failing)
+    assert calls == 2
+
+    async def ok():
+        return "ok"
+
+    assert await flight.do(("ok",), ok) == "ok"
+    assert len(flight) == 1
+    await asyncio.sleep(0.06)
+    assert len(flight) == 0
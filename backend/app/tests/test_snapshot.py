@@ -0,0 +1,162 @@
+import numpy as np
+
+from core.snapshot import Snapshot, SnapshotEngine, TextColumn, csr_rows
+
+
+def catalogue() -> tuple[dict, dict, dict]:
+    categories = {
+        1: ("Food", None),
+        2: ("Cafes", 1),
+        3: ("Coffee Shops", 2),
+        4: ("Banks", None),
+    }
+    buildings = {
+        10: ("Tverskaya St, 10", 37.6119, 55.7616),
+        11: ("Arbat St, 25", 37.5902, 55.7496),
+        12: ("Far away", 30.3141, 59.9386),
+    }
+    companies = {
+        100: ("Coffee Point", 10, ("8 (902) 345-67-89",), "79023456789",
+              (3,)),
+        101: ("Tea House", 11, (), "", (2,)),
+        102: ("Money Bank", 12, ("8 (495) 111-22-33",), "74951112233",
+              (4, 1)),
+        103: ("Homeless", None, (), "", ()),
+    }
+    return companies, buildings, categories
+
+
+def make_snapshot() -> Snapshot:
+    return Snapshot(*catalogue(), grid_degrees=0.01)
+
+
+def make_engine() -> SnapshotEngine:
+    """Engine with a compiled base, changes are applied to its dicts"""
+    engine = SnapshotEngine(True, refresh_delay=0, grid_degrees=0.01)
+    engine._companies, engine._buildings, engine._categories = catalogue()
+    engine.base = make_snapshot()
+    return engine
+
+
+def test_csr_rows_concatenates_rows():
+    indptr = np.array([0, 2, 2, 5])
+    indices = np.array([7, 8, 9, 10, 11])
+    assert csr_rows(indptr, indices, [2, 0]).tolist() == [9, 10, 11, 7, 8]
+    assert csr_rows(indptr, indices, [1]).tolist() == []
+
+
+def test_text_column_finds_rows_once():
+    column = TextColumn(["coffee", "", "toffee coffee", "tea"])
+    assert column[2] == "toffee coffee" and column[1] == ""
+    assert column.rows_containing("offee").tolist() == [0, 2]
+    assert column.rows_containing("ea").tolist() == [3]
+    # rows are NUL separated, matches never span two rows
+    assert column.rows_containing("eetea").tolist() == []
+    assert column.rows_containing("").tolist() == [0, 1, 2, 3]
+
+
+def test_companies_in_area_uses_exact_distance():
+    snapshot = make_snapshot()
+    rows = snapshot.companies_in_area(37.6119, 55.7616, 500)
+    assert snapshot.company_ids[rows].tolist() == [100]
+    rows = snapshot.companies_in_area(37.6, 55.755, 3000)
+    assert snapshot.company_ids[rows].tolist() == [100, 101]
+    assert len(snapshot.companies_in_area(100.0, 100.0, 1000)) == 0
+
+
+def test_category_tree_and_views():
+    snapshot = make_snapshot()
+    food = snapshot.category_row("Food")
+    assert snapshot.category_row(1) == food
+    children = snapshot.child_categories(food).tolist()
+    assert [snapshot.category_ids[row] for row in children] == [2]
+    companies = snapshot.companies_in_category(food)
+    assert snapshot.company_ids[companies].tolist() == [102]
+
+    view = snapshot.company_view(snapshot.company_rows([102])[0])
+    assert view.building_id == 12
+    assert {cat.name for cat in view.categories} == {"Food", "Banks"}
+    assert view.phone_numbers[0].phone_number == "8 (495) 111-22-33"
+
+    building = snapshot.building_view(snapshot.building_row(10))
+    assert [cmp.id for cmp in building.companies] == [100]
+    assert building.coordinates is not None
+
+
+def test_search_combines_filters():
+    snapshot = make_snapshot()
+
+    def search(**filters):
+        params = dict.fromkeys(
+            ("name", "category_id", "category_name", "phone_number",
+             "building_id", "location")
+        )
+        params.update(filters)
+        rows = snapshot.search(**params)
+        return [snapshot.search_row(row).id for row in rows.tolist()]
+
+    assert search(name="COFFEE") == [100]
+    assert search(category_id=2) == [101]
+    assert search(category_name="Banks") == [102]
+    assert search(phone_number="495") == [102]
+    assert search(building_id=11) == [101]
+    assert search(location=(37.6, 55.755, 3000)) == [100, 101]
+    assert search(name="o", location=(37.6, 55.755, 3000)) == [100, 101]
+    assert search(name="house", category_id=3) == []
+
+
+def test_notifications_mark_changed_rows():
+    engine = SnapshotEngine(True, refresh_delay=0, grid_degrees=0.01)
+    engine._reload = False
+    engine.on_notification(
+        '{"table": "company_search", "op": "INSERT", "id": 5}'
+    )
+    engine.on_notification(
+        '{"table": "buildings", "op": "UPDATE", "id": 7}'
+    )
+    assert engine._dirty["companies"] == {5}
+    assert engine._dirty["buildings"] == {7}
+    engine.on_notification('{"table": "companies", "op": "RELOAD"}')
+    assert engine._reload
+    assert not engine.ready
+
+
+def test_overlay_serves_changed_rows():
+    engine = make_engine()
+    # renamed, moved to a new building, added and deleted companies
+    engine._companies[100] = ("Coffee Corner", 13, (), "", (3,))
+    engine._buildings[13] = ("Arbat St, 30", 37.5905, 55.7497)
+    engine._companies[104] = ("New Bank", 12, (), "7495", (4,))
+    del engine._companies[101]
+    engine._changed["companies"] |= {100, 101, 104}
+    engine._changed["buildings"].add(13)
+    snapshot = engine._layer()
+    # companies at a building in the overlay are taken along
+    assert len(snapshot.overlay) == 3
+    assert len(snapshot) == 4
+
+    def ids(rows):
+        return [snapshot.company_view(row).id for row in rows.tolist()]
+
+    assert ids(snapshot.companies_in_area(37.5902, 55.7496, 500)) == [100]
+    assert ids(snapshot.companies_in_area(37.6119, 55.7616, 500)) == []
+    assert ids(snapshot.companies_in_category(snapshot.category_row(4))) \
+        == [102, 104]
+    assert ids(snapshot.search(
+        "bank", None, None, "495", None, None
+    )) == [102, 104]
+    assert ids(snapshot.company_rows([104, 101, 100])) == [100, 104]
+
+    assert snapshot.building_row(11) is not None
+    assert snapshot.building_view(snapshot.building_row(11)).companies == []
+    building = snapshot.building_view(snapshot.building_row(12))
+    assert [cmp.id for cmp in building.companies] == [102, 104]
+    assert snapshot.building_view(snapshot.building_row(13)).companies[0] \
+        .name == "Coffee Corner"
+
+    del engine._buildings[12]
+    engine._changed["buildings"].add(12)
+    snapshot = engine._layer()
+    assert snapshot.building_row(12) is None
+    assert ids(snapshot.search(None, 4, None, None, None, None)) \
+        == [102, 104]
@@ -0,0 +1,117 @@
+import pytest
+from fastapi import status
+
+from core.suggest import PrefixIndex, suggest_index
+from models import Category, Company
+
+
+def test_prefix_index_ranks_whole_names_first():
+    index = PrefixIndex()
+    index.build([
+        ("company", 1, "Best Coffee"),
+        ("company", 2, "Coffee Point"),
+        ("category", 3, "Coffee Shops"),
+        ("company", 4, "Bakery"),
+    ])
+    found = index.search("cof", 10)
+    assert [(item["kind"], item["id"]) for item in found] == [
+        ("company", 2), ("category", 3), ("company", 1)
+    ]
+    assert index.search("COFFEE  p", 10)[0]["name"] == "Coffee Point"
+    assert len(index.search("coffee", 2)) == 2
+    assert index.search("coffee", 10, kind="category")[0]["id"] == 3
+    assert index.search("", 10) == []
+
+
+def test_prefix_index_searches_one_kind():
+    index = PrefixIndex()
+    index.build([
+        *(("company", i, f"Cafe {i}") for i in range(1000)),
+        ("category", 1, "Cafes"),
+    ])
+    assert index._names["category"] == [("cafes", 1)]
+    assert index.search("caf", 1, kind="category") == [
+        {"kind": "category", "id": 1, "name": "Cafes"}
+    ]
+    assert index.search("cafes", 5, kind="company") == []
+    assert [item["id"] for item in index.search("cafe 1", 3)] == [1, 10, 100]
+
+
+def test_prefix_index_incremental_updates():
+    index = PrefixIndex()
+    index.build([("company", 1, "Best Coffee")])
+    index.add("company", 1, "Best Tea")
+    assert index.search("coffee", 10) == []
+    assert index.search("tea", 10)[0]["name"] == "Best Tea"
+    index.remove("company", 1)
+    assert index.search("best", 10) == []
+    assert len(index) == 0
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_catalogue_notifications_update_index(monkeypatch):
+    names = {-1: "Notified Category"}
+
+    async def read_back():
+        unread, suggest_index._unread = suggest_index._unread, set()
+        for kind, entry_id in unread:
+            suggest_index.apply(kind, entry_id, names.get(entry_id))
+        suggest_index._read_task = None
+
+    monkeypatch.setattr(suggest_index, "_read_back", read_back)
+    suggest_index.on_notification(
+        '{"table": "categories", "op": "INSERT", "id": -1}'
+    )
+    await suggest_index._read_task
+    assert suggest_index.search("notified", 10)[0]["id"] == -1
+    suggest_index.on_notification(
+        '{"table": "categories", "op": "DELETE", "id": -1}'
+    )
+    assert suggest_index.search("notified", 10) == []
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_suggest_includes_new_names(client, db_session):
+    response = await client.get("/suggest", params={"q": "zest"})
+    assert response.status_code == status.HTTP_200_OK
+
+    category = Category(name="Zesty Foods")
+    db_session.add(category)
+    await db_session.commit()
+    company = Company(name="Lemon Zest Bar", categories=[category])
+    db_session.add(company)
+    await db_session.commit()
+
+    response = await client.get("/suggest", params={"q": "zest"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()[:2] == [
+        {"kind": "category", "id": category.id, "name": "Zesty Foods"},
+        {"kind": "company", "id": company.id, "name": "Lemon Zest Bar"},
+    ]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_rolled_back_names_are_not_suggested(db_session):
+    savepoint = await db_session.begin_nested()
+    db_session.add(Company(name="Ghost Kitchen"))
+    await db_session.flush()
+    assert suggest_index.search("ghost", 10) == []
+    await savepoint.rollback()
+    await db_session.commit()
+    assert suggest_index.search("ghost", 10) == []
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_reload_serves_previous_index(client):
+    response = await client.get("/suggest", params={"q": "a"})
+    assert response.status_code == status.HTTP_200_OK
+    suggest_index.apply("category", -2, "Stale Category")
+    suggest_index.invalidate()
+
+    response = await client.get("/suggest", params={"q": "stale"})
+    assert response.json()[0]["id"] == -2
+    reload = suggest_index._reload_task
+    assert reload is not None
+    await reload
+    assert not suggest_index.stale
+    assert suggest_index.search("stale", 10) == []
@@ -0,0 +1,95 @@
+"""Building ingest throughput: POST /buildings/bulk against POST /buildings/.
+
+Streams a generated CSV of ROWS buildings to the bulk endpoint, then
+creates a sample of buildings one request at a time and extrapolates
+the per-row path to the same number of rows. Needs a running API,
+every run adds its buildings to the database.
+
+Usage: python benchmarks/bulk_buildings.py [url] [rows] [sample]
+       defaults: http://localhost:8000 1000000 1000
+"""
+import random
+import sys
+import time
+
+import httpx
+
+CHUNK_ROWS = 10000
+
+
+def building_rows(rows: int, seed: int = 42):
+    """CSV lines around Moscow, keys are unique per run"""
+    rnd = random.Random(seed)
+    run = int(time.time())
+    yield "address,longitude,latitude,key\n"
+    for n in range(rows):
+        yield (
+            f"\"{n} Benchmark St, {rnd.randint(1, 300)}\","
+            f"{rnd.uniform(37.3, 37.9):.6f},{rnd.uniform(55.5, 55.95):.6f},"
+            f"bench-{run}-{n}\n"
+        )
+
+
+def chunked(lines):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == CHUNK_ROWS:
+            yield "".join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield "".join(chunk).encode()
+
+
+def bulk(client: httpx.Client, rows: int) -> float:
+    started = time.perf_counter()
+    response = client.post(
+        "/buildings/bulk",
+        content=chunked(building_rows(rows)),
+        headers={"Content-Type": "text/csv"},
+        timeout=None,
+    )
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    result = response.json()
+    assert result["imported"] == rows, result
+    return elapsed
+
+
+def per_row(client: httpx.Client, rows: int) -> float:
+    rnd = random.Random(7)
+    started = time.perf_counter()
+    for n in range(rows):
+        response = client.post("/buildings/", json={
+            "address": f"{n} Single St",
+            "coordinates": {
+                "longitude": rnd.uniform(37.3, 37.9),
+                "latitude": rnd.uniform(55.5, 55.95),
+            },
+        })
+        response.raise_for_status()
+    return time.perf_counter() - started
+
+
+def main(url: str, rows: int, sample: int):
+    with httpx.Client(base_url=url) as client:
+        bulk_elapsed = bulk(client, rows)
+        sample_elapsed = per_row(client, sample)
+
+    per_row_rate = sample / sample_elapsed
+    print(f"{'path':10} {'rows':>10} {'seconds':>10} {'rows/s':>10}")
+    print(f"{'bulk':10} {rows:10} {bulk_elapsed:10.1f} "
+          f"{rows / bulk_elapsed:10.0f}")
+    print(f"{'per-row':10} {sample:10} {sample_elapsed:10.1f} "
+          f"{per_row_rate:10.0f}")
+    print(f"per-row path for {rows} rows: ~{rows / per_row_rate / 60:.0f} "
+          f"min, bulk is {sample_elapsed / sample * rows / bulk_elapsed:.0f}x "
+          f"faster")
+
+
+if __name__ == "__main__":
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8000",
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1000000,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 1000,
+    )
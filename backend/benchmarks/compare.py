@@ -0,0 +1,75 @@
+"""Compares an http_bench.py result file against a saved baseline.
+
+Prints throughput and p50/p95/p99 latency of every scenario found in
+both files with the change against the baseline. A scenario regresses
+when its throughput drops or its p95 latency grows by more than
+threshold percent, or when it has more failed requests than in the
+baseline; the exit status is 1 if any did.
+
+Usage: python benchmarks/compare.py baseline.json results.json [threshold]
+       default threshold: 10
+"""
+import json
+import sys
+
+METRICS = (
+    # name, higher is better
+    ("throughput", True),
+    ("p50_ms", False),
+    ("p95_ms", False),
+    ("p99_ms", False),
+)
+GATES = ("throughput", "p95_ms")
+
+
+def load(path: str) -> dict[tuple, dict]:
+    with open(path) as f:
+        data = json.load(f)
+    return {
+        (row["transport"], row["dataset"], row["scenario"]): row
+        for row in data["results"]
+    }
+
+
+def change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Prints the comparison, returns the regressed scenarios"""
+    regressions = []
+    print(f"{'dataset':>8} {'scenario':32} " + " ".join(
+        f"{name:>19}" for name, _ in METRICS
+    ))
+    for key in sorted(baseline.keys() & current.keys()):
+        old, new = baseline[key], current[key]
+        cells, regressed = [], False
+        for name, higher_is_better in METRICS:
+            delta = change(old[name], new[name])
+            worse = -delta if higher_is_better else delta
+            mark = " "
+            if worse > threshold:
+                mark = "!"
+                regressed |= name in GATES
+            cells.append(f"{new[name]:10.1f} {delta:+6.1f}%{mark}")
+        if new["errors"] > old["errors"]:
+            regressed = True
+            cells.append(f"errors {old['errors']} -> {new['errors']}!")
+        print(f"{key[1]:>8} {key[2]:32} " + " ".join(cells))
+        if regressed:
+            regressions.append(" ".join(key))
+    for key in sorted(baseline.keys() ^ current.keys()):
+        where = "baseline" if key in baseline else "results"
+        print(f"only in {where}: {' '.join(key)}")
+    return regressions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    regressions = compare(load(sys.argv[1]), load(sys.argv[2]), threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regressed by more than {threshold}%:")
+        print("\n".join(regressions))
+        sys.exit(1)
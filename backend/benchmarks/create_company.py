@@ -0,0 +1,120 @@
+"""Latency of CompaniesQueries.create_company against the previous ORM path.
+
+The previous path flushed the company, added phones, selected the
+categories, deleted and inserted associations, committed and refreshed
+the company, it is kept here as legacy_create_company. Both paths run
+against the configured database, alternating per call, and every
+company created is deleted afterwards.
+
+Usage: python benchmarks/create_company.py [iterations]
+"""
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "app"))
+
+from geoalchemy2 import WKTElement
+from sqlalchemy import select, delete
+
+from core.repositories.companies import CompaniesQueries
+from database import AsyncSessionLocal, engine
+from models import Building, Category, Company, PhoneNumber, \
+    company_category_association
+
+PHONES = ["9023456789", "9023456780"]
+
+
+async def legacy_create_company(name, phone_numbers, building_id,
+                                categories, db):
+    cmp = Company(name=name, building_id=building_id)
+    db.add(cmp)
+    await db.flush()
+    db.add_all(
+        PhoneNumber(phone_number=number, company_id=cmp.id)
+        for number in phone_numbers
+    )
+    result = await db.execute(
+        select(Category).where(Category.id.in_(categories))
+    )
+    existing_categories = result.scalars().all()
+    await db.execute(
+        company_category_association.delete().where(
+            company_category_association.c.company_id == cmp.id
+        )
+    )
+    await db.execute(
+        company_category_association.insert(),
+        [{"company_id": cmp.id, "category_id": c.id}
+         for c in existing_categories]
+    )
+    await db.commit()
+    await db.refresh(cmp)
+    return cmp
+
+
+async def timed(create, *args) -> tuple[float, int]:
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        cmp = await create(*args, db)
+        return (time.perf_counter() - started) * 1000, cmp.id
+
+
+def summary(label: str, samples: list[float]):
+    p50, p95 = (statistics.quantiles(samples, n=100)[i] for i in (49, 94))
+    print(f"{label:10} {statistics.mean(samples):8.2f} {p50:8.2f} "
+          f"{p95:8.2f}")
+
+
+async def main(iterations: int):
+    async with AsyncSessionLocal() as db:
+        building = Building(
+            address="Benchmark St",
+            coordinates=WKTElement("POINT (37.61 55.75)", srid=4326)
+        )
+        categories = [Category(name=f"Benchmark {n}") for n in range(3)]
+        db.add_all([building, *categories])
+        await db.commit()
+        args = (building.id, [cat.id for cat in categories])
+
+    paths = {
+        "legacy": legacy_create_company,
+        "single": CompaniesQueries.create_company,
+    }
+    samples = {label: [] for label in paths}
+    created = []
+    try:
+        for n in range(iterations):
+            for label, create in paths.items():
+                elapsed, company_id = await timed(
+                    create, f"Benchmark {label} {n}", PHONES, *args
+                )
+                samples[label].append(elapsed)
+                created.append(company_id)
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(PhoneNumber).where(
+                PhoneNumber.company_id.in_(created)
+            ))
+            await db.execute(company_category_association.delete().where(
+                company_category_association.c.company_id.in_(created)
+            ))
+            await db.execute(delete(Company).where(Company.id.in_(created)))
+            await db.execute(delete(Category).where(
+                Category.id.in_(args[1])
+            ))
+            await db.execute(delete(Building).where(
+                Building.id == args[0]
+            ))
+            await db.commit()
+        await engine.dispose()
+
+    print(f"{'path':10} {'mean':>8} {'p50':>8} {'p95':>8}   (ms per create)")
+    for label, values in samples.items():
+        summary(label, values)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,302 @@
+"""Throughput and latency of the search endpoints at several dataset sizes.
+
+Drives main.app in process through httpx.ASGITransport, or over a
+socket: --workers N starts uvicorn with N workers, --url measures a
+server that is already running. With --generate the catalogue is
+regenerated with core.datagen for every size in --sizes (this TRUNCATES
+it), otherwise the loaded catalogue is measured once under --label.
+
+Every scenario is warmed up, then sent --requests times by --concurrency
+clients. Request parameters come from a fixed seed and a sample of the
+catalogue, so runs over the same data send the same requests. Failed
+calls (transport errors, error statuses other than the 404 the search
+endpoints answer when nothing is found) are counted as errors and left
+out of throughput and latencies; the exit status is 1 if there were
+any. Results go to a JSON file, see benchmarks/compare.py.
+
+Usage: python benchmarks/http_bench.py [--sizes 10k,1M,10M --generate]
+           [--workers 4 | --url http://localhost:8000] [--out bench.json]
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+sys.path.append(str(APP_DIR))
+
+import asyncpg
+import httpx
+import numpy as np
+
+from config import settings
+from core.datagen import DataSpec, KINDS, generate
+
+DSN = settings.URL_DATABASE.replace("postgresql+asyncpg", "postgresql")
+SIZES = {"k": 1_000, "M": 1_000_000}
+
+
+def location(rnd: random.Random, sample: dict, radius: int) -> tuple:
+    lon, lat = rnd.choice(sample["points"])
+    return lon + rnd.uniform(-0.005, 0.005), \
+        lat + rnd.uniform(-0.005, 0.005), radius
+
+
+def advanced(**params):
+    return "GET", "/companies/search/advanced", {"params": params}
+
+
+def in_area(lon: float, lat: float, radius: int):
+    return "POST", "/companies/search/in-area", {"json": {
+        "longitude": lon, "latitude": lat, "radius": radius
+    }}
+
+
+# scenario -> (rnd, sample) -> (method, path, request kwargs)
+SCENARIOS = {
+    "advanced:name": lambda rnd, s: advanced(name=rnd.choice(KINDS)),
+    "advanced:category_id": lambda rnd, s: advanced(
+        category_id=rnd.choice(s["categories"])
+    ),
+    "advanced:phone_number": lambda rnd, s: advanced(
+        phone_number=f"9{rnd.randint(10, 99)}"
+    ),
+    "advanced:location": lambda rnd, s: advanced(
+        location="{},{},{}".format(*location(rnd, s, 1000))
+    ),
+    "advanced:name+location": lambda rnd, s: advanced(
+        name=rnd.choice(KINDS),
+        location="{},{},{}".format(*location(rnd, s, 2000))
+    ),
+    "advanced:category_id+location": lambda rnd, s: advanced(
+        category_id=rnd.choice(s["categories"]),
+        location="{},{},{}".format(*location(rnd, s, 2000))
+    ),
+    "in-area:500": lambda rnd, s: in_area(*location(rnd, s, 500)),
+    "in-area:2000": lambda rnd, s: in_area(*location(rnd, s, 2000)),
+}
+
+
+def parse_size(value: str) -> int:
+    if value[-1] in SIZES:
+        return int(float(value[:-1]) * SIZES[value[-1]])
+    return int(value)
+
+
+async def catalogue_sample(size: int = 500) -> dict:
+    """Category ids and building points to build requests from"""
+    conn = await asyncpg.connect(DSN)
+    try:
+        categories = await conn.fetch("SELECT id FROM categories")
+        points = await conn.fetch(
+            "SELECT ST_X(coordinates) AS lon, ST_Y(coordinates) AS lat "
+            "FROM buildings ORDER BY md5(id::text) LIMIT $1", size
+        )
+    finally:
+        await conn.close()
+    return {
+        "categories": sorted(row["id"] for row in categories),
+        "points": [(row["lon"], row["lat"]) for row in points],
+    }
+
+
+def failed(response: httpx.Response) -> bool:
+    # searches answer 404 when nothing is found
+    return response.status_code >= 400 and response.status_code != 404
+
+
+async def drive(client: httpx.AsyncClient, calls: list, concurrency: int):
+    """Sends calls from concurrency clients, returns latencies (s) of
+    the successful calls and the number of failed ones"""
+    latencies, errors = [], 0
+    pending = iter(calls)
+
+    async def worker():
+        nonlocal errors
+        for method, path, kwargs in pending:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            if failed(response):
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+async def run_scenario(
+        client: httpx.AsyncClient, scenario: str, sample: dict,
+        args: argparse.Namespace
+) -> dict:
+    rnd = random.Random(f"{args.seed}:{scenario}")
+    calls = [
+        SCENARIOS[scenario](rnd, sample)
+        for _ in range(args.warmup + args.requests)
+    ]
+    await drive(client, calls[:args.warmup], args.concurrency)
+    started = time.perf_counter()
+    latencies, errors = await drive(
+        client, calls[args.warmup:], args.concurrency
+    )
+    elapsed = time.perf_counter() - started
+    p50, p95, p99 = (
+        np.percentile(latencies, [50, 95, 99]) * 1000 if latencies
+        else (float("inf"),) * 3
+    )
+    return {
+        "scenario": scenario,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+    }
+
+
+async def run_dataset(
+        client: httpx.AsyncClient, dataset: str, args: argparse.Namespace
+) -> list[dict]:
+    sample = await catalogue_sample()
+    results = []
+    for scenario in args.scenarios:
+        result = await run_scenario(client, scenario, sample, args)
+        result = {"dataset": dataset, "transport": args.transport, **result}
+        print(f"{dataset:>8} {scenario:32} {result['throughput']:9.1f}/s "
+              f"p50 {result['p50_ms']:8.2f} p95 {result['p95_ms']:8.2f} "
+              f"p99 {result['p99_ms']:8.2f} ms  errors {result['errors']}")
+        results.append(result)
+    return results
+
+
+async def run_all(client: httpx.AsyncClient, args: argparse.Namespace):
+    if not args.generate:
+        return await run_dataset(client, args.label, args)
+    results = []
+    for size in args.sizes:
+        started = time.perf_counter()
+        await generate(DSN, DataSpec(
+            companies=parse_size(size),
+            buildings=max(parse_size(size) // 20, 100),
+            seed=args.seed,
+        ), workers=args.generate_workers, truncate=True)
+        print(f"{size:>8} generated in {time.perf_counter() - started:.0f}s")
+        # let the app pick up the RELOAD notifications
+        await asyncio.sleep(1)
+        results += await run_dataset(client, size, args)
+    return results
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    server = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+    ], cwd=APP_DIR)
+    ready = f"http://127.0.0.1:{port}/openapi.json"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(ready).raise_for_status()
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start in 60s")
+
+
+async def main(args: argparse.Namespace):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    if args.transport == "asgi":
+        from main import app
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                    transport=transport, base_url="http://bench",
+                    timeout=None
+            ) as client:
+                return await run_all(client, args)
+
+    server = None
+    url = args.url
+    if args.workers:
+        server = start_server(args.workers, args.port)
+        url = f"http://127.0.0.1:{args.port}"
+    try:
+        async with httpx.AsyncClient(
+                base_url=url, timeout=None, limits=limits
+        ) as client:
+            return await run_all(client, args)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="10k,1M,10M",
+                        help="companies per dataset, with --generate")
+    parser.add_argument("--generate", action="store_true",
+                        help="regenerate the catalogue for every size")
+    parser.add_argument("--generate-workers", type=int, default=4)
+    parser.add_argument("--label", default="current",
+                        help="dataset name without --generate")
+    parser.add_argument("--url", help="measure a running server")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="start uvicorn with this many workers")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="bench.json")
+    args = parser.parse_args()
+    args.sizes = args.sizes.split(",")
+    args.scenarios = args.scenarios.split(",")
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.transport = "socket" if args.url or args.workers else "asgi"
+    return args
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(main(args))
+    Path(args.out).write_text(json.dumps({
+        "created": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "transport": args.transport,
+        "workers": args.workers or None,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "seed": args.seed,
+        "results": results,
+    }, indent=2))
+    print(f"results written to {args.out}")
+    failed_scenarios = [row for row in results if row["errors"]]
+    if failed_scenarios:
+        print(f"{len(failed_scenarios)} scenarios had failed requests")
+        sys.exit(1)
@@ -0,0 +1,64 @@
+"""Import time of the API and worker entry modules.
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters
+and prints the packages that take longest to import, cumulative time
+including what they import, as the median over --runs runs. The first
+run also writes bytecode, it is not counted.
+
+Usage: python benchmarks/import_time.py [--module main] [--top 25]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Cumulative import time per module in microseconds"""
+    env = {**os.environ, "PYTHONPATH": str(APP_DIR)}
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, check=True
+    ).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--module", default="main",
+                        help="main for the API, rabbitmq.consumer for the "
+                             "worker")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    import_times(args.module)
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    median = {
+        name: statistics.median(run.get(name, 0) for run in runs)
+        for name in runs[0]
+    }
+    # top-level packages only, their submodules are included
+    packages = {
+        name: us for name, us in median.items()
+        if "." not in name or name.split(".")[0] in ("api", "core")
+    }
+    print(f"{args.module}: {median[args.module] / 1000:.1f} ms")
+    for name, us in sorted(
+            packages.items(), key=lambda item: -item[1]
+    )[:args.top]:
+        print(f"{us / 1000:9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
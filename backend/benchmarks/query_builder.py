@@ -0,0 +1,70 @@
+"""Python-side overhead per company search query.
+
+Compares building a fresh statement on every call (previous behaviour)
+with the cached statement shapes of CompaniesQuerybuilder, and the cost
+of compiling a statement, which the compiled cache saves on repeated
+shapes (see /api/v1/admin/statement-cache for its hit rate). No
+database is needed.
+
+Usage: python benchmarks/query_builder.py [iterations]
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "app"))
+
+from sqlalchemy.dialects.postgresql.asyncpg import dialect as asyncpg_dialect
+
+from core.repositories.companies import CompaniesQuerybuilder
+
+SEARCHES = {
+    "advanced:name": ("cafe", None, None, None, None, None),
+    "advanced:category_id+location": (
+        None, 3, None, None, None, (37.61, 55.75, 1000)
+    ),
+    "advanced:all": (
+        "cafe", 3, None, "495", 2, (37.61, 55.75, 1000)
+    ),
+}
+
+
+def timed(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main(iterations: int):
+    dialect = asyncpg_dialect()
+    print(f"{'query':34} {'rebuild':>10} {'cached':>10} "
+          f"{'compile':>10}   (us per call)")
+    for label, args in SEARCHES.items():
+        shape = tuple(
+            f for f, v in zip(CompaniesQuerybuilder.advanced_filters, args)
+            if v
+        )
+        rebuild = timed(
+            lambda: CompaniesQuerybuilder._build_advanced_search_query(shape),
+            iterations
+        )
+        cached = timed(
+            lambda: CompaniesQuerybuilder.get_companies_advanced_search_query(
+                *args
+            ),
+            iterations
+        )
+        statement, _ = (
+            CompaniesQuerybuilder.get_companies_advanced_search_query(*args)
+        )
+        compiled = timed(
+            lambda: statement.compile(dialect=dialect),
+            max(iterations // 10, 1)
+        )
+        print(f"{label:34} {rebuild:10.1f} {cached:10.1f} "
+              f"{compiled:10.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -1,6 +1,16 @@
 #!/bin/sh
+set -e
 
-alembic upgrade head
-python ./load_initial_data.py
+# replicas scaled out next to a running one can skip migrations
+if [ "${RUN_MIGRATIONS:-1}" = "1" ]; then
+    alembic upgrade head
+fi
+# development only, replaces the catalogue with sample data
+if [ "${LOAD_INITIAL_DATA:-0}" = "1" ]; then
+    python ./load_initial_data.py
+fi
 
-exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload --reload-dir ./app
\ No newline at end of file
+if [ "${UVICORN_RELOAD:-0}" = "1" ]; then
+    exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload --reload-dir ./app
+fi
+exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-1}"
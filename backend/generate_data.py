@@ -0,0 +1,103 @@
+"""Synthetic catalogue generator for benchmarking, see core.datagen.
+
+The same seed and counts always produce the same rows. Loads through
+COPY in parallel batches and prints the rows loaded per table.
+
+Usage: python generate_data.py --companies 10000000 --buildings 500000 \\
+           --categories 10,6,4 --phones 0-3 --clusters 40 --truncate
+"""
+import argparse
+import asyncio
+import time
+
+from config import settings
+from core.datagen import DataSpec, generate
+
+
+def count_range(value: str) -> tuple[int, int]:
+    low, _, high = value.partition("-")
+    return int(low), int(high or low)
+
+
+def parse_args() -> argparse.Namespace:
+    spec = DataSpec()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--companies", type=int, default=spec.companies)
+    parser.add_argument("--buildings", type=int, default=spec.buildings)
+    parser.add_argument(
+        "--categories", default=",".join(map(str, spec.category_levels)),
+        help="categories per level, roots first: 8,4,3"
+    )
+    parser.add_argument(
+        "--phones", type=count_range,
+        default=spec.phones_per_company, help="phones per company: 0-3"
+    )
+    parser.add_argument(
+        "--company-categories", type=count_range,
+        default=spec.categories_per_company,
+        help="categories per company: 1-3"
+    )
+    parser.add_argument("--clusters", type=int, default=spec.clusters)
+    parser.add_argument(
+        "--center", default=",".join(map(str, spec.city_center)),
+        help="city centre as longitude,latitude"
+    )
+    parser.add_argument(
+        "--city-radius", type=float, default=spec.city_radius_km,
+        help="km, how far clusters scatter from the centre"
+    )
+    parser.add_argument(
+        "--cluster-radius", type=float, default=spec.cluster_radius_km,
+        help="km, spread of buildings around a cluster"
+    )
+    parser.add_argument("--seed", type=int, default=spec.seed)
+    parser.add_argument("--batch-size", type=int, default=spec.batch_size)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--truncate", action="store_true",
+        help="empty the catalogue first instead of adding to it"
+    )
+    parser.add_argument(
+        "--keep-triggers", action="store_true",
+        help="load with the catalogue triggers on, for a database in use"
+    )
+    parser.add_argument("--dsn", default=settings.URL_DATABASE.replace(
+        "postgresql+asyncpg", "postgresql"
+    ))
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    lon, lat = map(float, args.center.split(","))
+    spec = DataSpec(
+        companies=args.companies,
+        buildings=args.buildings,
+        category_levels=tuple(map(int, args.categories.split(","))),
+        phones_per_company=args.phones,
+        categories_per_company=args.company_categories,
+        clusters=args.clusters,
+        city_center=(lon, lat),
+        city_radius_km=args.city_radius,
+        cluster_radius_km=args.cluster_radius,
+        seed=args.seed,
+        batch_size=args.batch_size,
+    )
+    started = time.perf_counter()
+
+    def progress(table: str, rows: int):
+        print(f"{time.perf_counter() - started:8.1f}s {table:12} {rows}")
+
+    data = await generate(
+        args.dsn, spec, workers=args.workers, truncate=args.truncate,
+        disable_triggers=not args.keep_triggers, progress=progress
+    )
+    elapsed = time.perf_counter() - started
+    total = sum(data.rows.values())
+    for table, rows in data.rows.items():
+        print(f"{table:30} {rows:12}")
+    print(f"{total} rows in {elapsed:.1f}s, {total / elapsed:.0f} rows/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())